@@ -1,4 +1,5 @@
 """Defines DiamondHit class"""
+import sys
 
 
 class DiamondHit(object):
@@ -24,9 +25,15 @@ class DiamondHit(object):
         s_end (int): last position of alignment in the subject sequence
         evalue (float): e-value of the hit
         bitscore (float): bit-score of the hit
-        functions (list): list of function identifiers
+        functions (list or tuple): function identifiers
+
+    Note: DiamondHit uses __slots__ and interned subject identifiers to
+    keep memory footprint small, as millions of hits may be kept in memory.
 
     """
+    __slots__ = ('query_id', 'subject_id', 'identity', 'length', 'mismatch',
+                 's_len', 'q_start', 'q_end', 's_start', 's_end', 'evalue',
+                 'bitscore', 'functions')
 
     def __init__(self, query_id="", subject_id="", identity=0.0,
                  length=0, mismatch=0, s_len=0, q_start=0,
@@ -48,7 +55,7 @@ class DiamondHit(object):
 
         """
         self.query_id = query_id
-        self.subject_id = subject_id
+        self.subject_id = sys.intern(subject_id)
         self.identity = identity
         self.length = length
         self.mismatch = mismatch
@@ -59,7 +66,7 @@ class DiamondHit(object):
         self.s_end = s_end
         self.evalue = evalue
         self.bitscore = bitscore
-        self.functions = []
+        self.functions = ()
 
     def create_hit(self, tabular_output_fields):
         """Fills DiamondHit attributes with values from DIAMOND output in
@@ -93,7 +100,7 @@ class DiamondHit(object):
             print(str(detail))
             raise
         self.query_id = tabular_output_fields[0]
-        self.subject_id = tabular_output_fields[1]
+        self.subject_id = sys.intern(tabular_output_fields[1])
         self.identity = tabular_output_fields[2]
         self.length = tabular_output_fields[3]
         self.mismatch = tabular_output_fields[4]
@@ -120,7 +127,8 @@ class DiamondHit(object):
         """
         self.create_hit(entry_tokens[:-1])
         try:
-            self.functions = entry_tokens[12].split('|')
+            self.functions = tuple(sys.intern(function) for function
+                                   in entry_tokens[12].split('|'))
         except IndexError:
             print('Unable to parse function list:', entry_tokens)
 
@@ -1,12 +1,18 @@
 """Describes DiamondHitList class"""
 import fama.diamond_parser.hit_utils as hit_utils
 
+# Minimal number of hits in a list, for which overlapping hits are
+# searched by interval index rather than by comparison with each hit
+OVERLAP_INDEX_MIN_HITS = 16
+
 
 class DiamondHitList(object):
     """DiamondHitList stores a set of DiamondHit objects for one
     query sequence (usually, query is a sequence read or a protein)
 
     """
+    __slots__ = ('_query_id', 'data')
+
     def __init__(self, query_id=None):
         """ Args:
             query_id (str): query sequence identifier
@@ -80,6 +86,11 @@ class DiamondHitList(object):
             overlap_cutoff(int): minimal length of a common area between
                 hits to be considered overlapping
         """
+        if len(self.hits) >= OVERLAP_INDEX_MIN_HITS and all(
+                hit.q_start != hit.q_end for hit in self.hits
+        ):
+            self.hits = hit_utils.filter_overlapping_hits(self.hits, overlap_cutoff)
+            return
         temp_list = []
 
         for hit in self.hits:
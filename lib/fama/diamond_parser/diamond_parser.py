@@ -1,17 +1,30 @@
 """Describes DiamondParser class"""
 import os
+import io
 import csv
-import gzip
+import hashlib
+import threading
+import multiprocessing
 
 from fama.utils.const import STATUS_GOOD
+from fama.utils.gzip_io import open_input_file, open_output_file
 from fama.project.program_config import ProgramConfig
 from fama.project.project_options import ProjectOptions
 from fama.reference_library.reference_data import ReferenceData
 from fama.reference_library.taxonomy_data import TaxonomyData
 from fama.diamond_parser.diamond_hit import DiamondHit
 from fama.diamond_parser.diamond_hit_list import DiamondHitList
+from fama.diamond_parser.tabular_reader import read_tabular_hits, get_tabular_shards
 from fama.sequences.annotated_read import AnnotatedRead
-from fama.diamond_parser.hit_utils import compare_hits_erpk_lca, get_paired_end, parse_fastq_seqid
+from fama.diamond_parser.hit_utils import compare_hits_erpk_lca, get_paired_end, \
+    parse_fastq_seqid
+
+# Minimal size (in bytes) of DIAMOND output range processed by one worker process
+BACKGROUND_SHARD_SIZE_MIN = 16777216
+# DiamondParser instance inherited by forked worker processes
+_BACKGROUND_PARSER = None
+# Suffix of file with checksum of hit segments, next to output of the second DIAMOND search
+HIT_SEGMENTS_SUFFIX = '.segments'
 
 
 class DiamondParser(object):
@@ -28,7 +41,8 @@ class DiamondParser(object):
         candidate query sequences of interest
     2. import_fastq (or import_fasta): reads initial query file and finds
         sequences of interest.
-    3. export_hit_fastq (or export_hit_fasta): creates a sequence file of hits found.
+    3. export_hit_segments (or export_hit_fasta): creates a sequence file
+        of hits found, or writes the sequences directly to DIAMOND input.
     4. export_hit_list : creates a table of hits selected for subsequent analysis
     5. parse_background_output: reads seconf DIAMOND output file and finds
         which query sequences are truly sequences of interest, which should
@@ -48,6 +62,9 @@ class DiamondParser(object):
         ref_data (:obj:'ReferenceData'): reference dataset for the
             collection (list of functions, list of proteins etc.)
         taxonomy_data (:obj:'TaxonomyData'): NCBI taxonomy dataset for the collection
+        hit_segments (:obj:'list' of tuple(str, int, int)): read identifier,
+            start and end of each hit exported for the second DIAMOND
+            search. Index in this list is query identifier of the hit.
 
     Todo:
         * add paired-end processing in DiamondParser. For paired-end
@@ -80,6 +97,7 @@ class DiamondParser(object):
 
         """
         self.reads = {}
+        self.hit_segments = None
         self.sample = sample
         self.end = end
         self.config = config
@@ -101,7 +119,7 @@ class DiamondParser(object):
         if self.taxonomy_data is None:
             self.taxonomy_data = TaxonomyData(self.config, self.collection)
 
-    def parse_reference_output(self):
+    def parse_reference_output(self, tsvfile=None):
         """Reads and processes DIAMOND tabular output of the first DIAMOND
         search.
 
@@ -117,52 +135,40 @@ class DiamondParser(object):
         This function does not return anything. Instead, it populates
         'reads' dictionary with AnnotatedRead objects.
 
+        Args:
+            tsvfile (str or file object, optional): DIAMOND output, for
+                example, stdout of running DIAMOND. If not set, output
+                file in project directory is read.
+
         """
-        tsvfile = os.path.join(
-            self.options.get_project_dir(self.sample.sample_id),
-            self.sample.sample_id + '_' + self.end + '_' + self.options.ref_output_name
-        )
-        current_sequence_read_id = ''
-        hit_list = DiamondHitList(current_sequence_read_id)
+        if tsvfile is None:
+            tsvfile = os.path.join(
+                self.options.get_project_dir(self.sample.sample_id),
+                self.sample.sample_id + '_' + self.end + '_' + self.options.ref_output_name
+            )
+        self.hit_segments = None
         # TODO: cleanup identity_cutoff = self.config.get_identity_cutoff(self.collection)
         length_cutoff = self.config.get_length_cutoff(self.collection)
+        overlap_cutoff = self.config.get_overlap_cutoff(self.collection)
         print('Length cutoff:', length_cutoff)
-        with open(tsvfile, 'r', newline='') as infile:
-            tsvin = csv.reader(infile, delimiter='\t')
-            for row in tsvin:
-                hit = DiamondHit()
-                (row[0], _) = parse_fastq_seqid(row[0])
-                hit.create_hit(row)
-                # filtering by length
-                if hit.length < length_cutoff:
-                    continue  # go to next hit
-
-                if hit.query_id != current_sequence_read_id:
-                    # when new query ID reached, process collected hits,
-                    # then start over with new query identifier
-                    # filtering: remove overlapping hits
-                    hit_list.filter_list(self.config.get_overlap_cutoff(self.collection))
-                    # if any hits left, assign function to hits and populate reads dictionary
-                    hit_list.annotate_hits(self.ref_data)
-                    hit_list.filter_list_by_identity(self.ref_data)
-                    if hit_list.hits_number != 0:
-                        read = AnnotatedRead(current_sequence_read_id)
-                        read.hit_list = hit_list
-                        self.reads[current_sequence_read_id] = read
-                    # start over
-                    current_sequence_read_id = hit.query_id
-                    hit_list = DiamondHitList(current_sequence_read_id)
+        for read_id, hits in read_tabular_hits(
+                tsvfile, length_cutoff=length_cutoff,
+                query_id_parser=lambda query_id: parse_fastq_seqid(query_id)[0]
+        ):
+            hit_list = DiamondHitList(read_id)
+            for hit in hits:
                 hit_list.add_hit(hit)
-            # when EOF reached, process collected hits
-            hit_list.filter_list(self.config.get_overlap_cutoff(self.collection))
+            # filtering: remove overlapping hits
+            hit_list.filter_list(overlap_cutoff)
+            # if any hits left, assign function to hits and populate reads dictionary
             hit_list.annotate_hits(self.ref_data)
             hit_list.filter_list_by_identity(self.ref_data)
             if hit_list.hits_number != 0:
-                read = AnnotatedRead(current_sequence_read_id)
+                read = AnnotatedRead(read_id)
                 read.hit_list = hit_list
-                self.reads[current_sequence_read_id] = read
+                self.reads[read_id] = read
 
-    def parse_background_output(self):
+    def parse_background_output(self, threads=None, tsvfile=None):
         """Reads and processes DIAMOND tabular output of the second DIAMOND
         search.
 
@@ -171,86 +177,188 @@ class DiamondParser(object):
         For the comparison, it calls compare_hits_erpk_lca function, which
         in turn updates entries in the 'reads' dictionary.
 
-        Raises:
-            KeyError if read identifier not found in the 'reads' dictionary
+        If more than one thread is available, DIAMOND output is split into
+        ranges that keep all hits of one read together, and ranges are
+        processed by a pool of forked processes sharing reference data.
+        Read status, functions, taxonomy and hits are then merged back
+        into the 'reads' dictionary. DIAMOND output provided as file
+        object is processed sequentially. Worker processes are not used
+        if other threads are running, because forking a multi-threaded
+        process is unsafe.
+
+        Args:
+            threads (int, optional): number of worker processes. If not set,
+                number of threads from program config is used.
+            tsvfile (str or file object, optional): DIAMOND output, for
+                example, stdout of running DIAMOND. If not set, output
+                file in sample work directory is read.
 
         """
         if not self.reads:
             # Something went wrong and 'reads' dictionary is empty.
             # Let's try to import list of reads from file.
             self.reads = self.import_hit_list()
+        if self.hit_segments is None:
+            self.hit_segments = self.get_hit_segments()
+
+        if tsvfile is None:
+            tsvfile = os.path.join(
+                self.sample.work_directory,
+                self.sample.sample_id + '_' + self.end + '_' + self.options.background_output_name
+            )
+        if isinstance(tsvfile, str):
+            self.check_hit_segments_checksum(tsvfile)
+        if threads is None:
+            threads = int(self.config.threads)
+        print('Relative bit-score cutoff:',
+              self.config.get_biscore_range_cutoff(self.collection),
+              ', Length cutoff:', self.config.get_length_cutoff(self.collection)
+              )
+        shards = []
+        if threads > 1 and isinstance(tsvfile, str) and threading.active_count() == 1 \
+                and 'fork' in multiprocessing.get_all_start_methods():
+            shards = get_tabular_shards(
+                tsvfile,
+                max(BACKGROUND_SHARD_SIZE_MIN, os.path.getsize(tsvfile) // (threads * 4) + 1),
+                key_function=self.get_segment_read_id
+            )
+        if len(shards) < 2:
+            self.process_background_hits(tsvfile)
+            return
+
+        global _BACKGROUND_PARSER
+        _BACKGROUND_PARSER = self
+        try:
+            with multiprocessing.get_context('fork').Pool(threads) as pool:
+                for shard_result in pool.imap(_process_background_shard,
+                                              [(tsvfile, start, end) for start, end in shards]):
+                    for read_id, status, functions, taxonomy, hits in shard_result:
+                        read = self.reads[read_id]
+                        read.status = status
+                        read.functions = functions
+                        read.taxonomy = taxonomy
+                        read.hit_list.hits = hits
+        finally:
+            _BACKGROUND_PARSER = None
+
+    def process_background_hits(self, tsvfile):
+        """Compares hits from DIAMOND tabular output of the second DIAMOND
+        search with hits of the first search and updates entries in the
+        'reads' dictionary.
 
-        tsvfile = os.path.join(
-            self.sample.work_directory,
-            self.sample.sample_id + '_' + self.end + '_' + self.options.background_output_name
-        )
+        Args:
+            tsvfile (str or file object): DIAMOND output file
 
+        Returns:
+            :obj:'list' of str: identifiers of reads compared with new hits
+        """
+        result = []
         average_read_length = self.sample.get_avg_read_length(self.end)
-
-        current_query_id = None
-        hit_list = None
         length_cutoff = self.config.get_length_cutoff(self.collection)
         bitscore_range_cutoff = self.config.get_biscore_range_cutoff(self.collection)
-        print('Relative bit-score cutoff:', bitscore_range_cutoff,
-              ', Length cutoff:', length_cutoff
-              )
-
-        with open(tsvfile, 'r', newline='') as infile:
-            tsvin = csv.reader(infile, delimiter='\t')
-            for row in tsvin:
-                if current_query_id is None:
-                    current_query_id = row[0]
-                    hit_list = DiamondHitList(current_query_id)
-                hit = DiamondHit()
-                hit.create_hit(row)
-                # filtering by length
-                if hit.length < length_cutoff:
-                    continue  # skip this line
-
-                # when new query ID reached, process collected hits,
-                # then start over with new query identifier
-                if hit.query_id != current_query_id:
-                    # assign functions to selected hits
-                    hit_list.annotate_hits(self.ref_data)
-                    hit_list.filter_list_by_identity(self.ref_data)
-                    # extract initial read identifier from identifier of the hit
-                    current_query_id_tokens = current_query_id.split('|')
-                    read_id = '|'.join(current_query_id_tokens[:-2])
-                    # compare list of hits from search in background DB
-                    # with existing hit from the first similarity search
-                    try:
-                        compare_hits_erpk_lca(
-                            self.reads[read_id],
-                            int(current_query_id_tokens[-2]),  # hit_start
-                            int(current_query_id_tokens[-1]),  # hit_end
-                            hit_list, bitscore_range_cutoff, length_cutoff,
-                            average_read_length, self.taxonomy_data, self.ref_data
-                            )
-                    except KeyError:
-                        print('Read not found: ', read_id)
-                    # starting over
-                    current_query_id = hit.query_id
-                    hit_list = DiamondHitList(current_query_id)
+        for query_id, hits in read_tabular_hits(tsvfile, length_cutoff=length_cutoff):
+            hit_list = DiamondHitList(query_id)
+            for hit in hits:
                 hit_list.add_hit(hit)
-            # when EOF reached, process collected hits
             # assign functions to selected hits
             hit_list.annotate_hits(self.ref_data)
             hit_list.filter_list_by_identity(self.ref_data)
-            # extract initial read identifier from identifier of the hit
-            current_query_id_tokens = current_query_id.split('|')
-            read_id = '|'.join(current_query_id_tokens[:-2])
-            # compare list of hits from search in background DB with
-            # existing hit from the first similarity search
+            # find initial read and hit coordinates
+            read_id, hit_start, hit_end = self.get_hit_segment(query_id)
+            # compare list of hits from search in background DB
+            # with existing hit from the first similarity search
+            if read_id in self.reads and (not result or result[-1] != read_id):
+                result.append(read_id)
             try:
                 compare_hits_erpk_lca(
-                    self.reads[read_id],
-                    int(current_query_id_tokens[-2]),  # hit_start
-                    int(current_query_id_tokens[-1]),  # hit_end
+                    self.reads[read_id], hit_start, hit_end,
                     hit_list, bitscore_range_cutoff, length_cutoff,
                     average_read_length, self.taxonomy_data, self.ref_data
                     )
             except KeyError:
                 print('Read not found: ', read_id)
+        return result
+
+    def get_hit_segments(self):
+        """Makes list of hits exported for the second DIAMOND search
+
+        Returns:
+            :obj:'list' of tuple(str, int, int): read identifier, start
+                and end of each hit in the order of export
+        """
+        return [(read_id, hit.q_start, hit.q_end)
+                for read_id, read in self.reads.items() for hit in read.hit_list.hits]
+
+    def get_hit_segment(self, query_id):
+        """Finds read and hit coordinates for query identifier of the
+        second DIAMOND search. Query identifiers are indices in the
+        hit_segments list. Identifiers made of read identifier, start and
+        end of the hit separated by pipe symbol, which were used by earlier
+        versions, are also accepted.
+
+        Args:
+            query_id (str): query identifier from background DIAMOND search
+
+        Returns:
+            tuple(str, int, int): read identifier, start and end of the hit
+
+        Raises:
+            ValueError if query identifier is not a valid index
+        """
+        if query_id.isdigit():
+            segment_index = int(query_id)
+            if segment_index >= len(self.hit_segments):
+                raise ValueError('Query ' + query_id + ' of background DIAMOND search not found '
+                                 + 'in ' + str(len(self.hit_segments)) + ' exported hits')
+            return self.hit_segments[segment_index]
+        query_id_tokens = query_id.split('|')
+        return '|'.join(query_id_tokens[:-2]), int(query_id_tokens[-2]), int(query_id_tokens[-1])
+
+    def get_hit_segments_checksum(self):
+        """Returns number of exported hits and SHA-256 digest of the
+        hit_segments list, separated by space"""
+        if self.hit_segments is None:
+            self.hit_segments = self.get_hit_segments()
+        digest = hashlib.sha256()
+        for read_id, start, end in self.hit_segments:
+            digest.update((read_id + '\t' + str(start) + '\t' + str(end) + '\n').encode('utf8'))
+        return str(len(self.hit_segments)) + ' ' + digest.hexdigest()
+
+    def save_hit_segments_checksum(self, tsvfile):
+        """Saves checksum of hit_segments list next to output file of the
+        second DIAMOND search. Must be called before the search starts.
+
+        Args:
+            tsvfile (str): path to output file of the second DIAMOND search
+        """
+        with open(tsvfile + HIT_SEGMENTS_SUFFIX, 'w') as outfile:
+            outfile.write(self.get_hit_segments_checksum() + '\n')
+
+    def check_hit_segments_checksum(self, tsvfile):
+        """Checks that existing output of the second DIAMOND search was
+        made for the same hit_segments list. Output files without checksum
+        file have query identifiers made of read identifier and hit
+        coordinates, and need no check.
+
+        Args:
+            tsvfile (str): path to output file of the second DIAMOND search
+
+        Raises:
+            ValueError if saved checksum differs from checksum of hit_segments
+        """
+        checksum_file = tsvfile + HIT_SEGMENTS_SUFFIX
+        if not os.path.exists(checksum_file):
+            return
+        with open(checksum_file, 'r') as infile:
+            saved_checksum = infile.read().strip()
+        if saved_checksum != self.get_hit_segments_checksum():
+            raise ValueError('DIAMOND output ' + tsvfile + ' was made for a different list '
+                             + 'of hits. Delete it to repeat the search.')
+
+    def get_segment_read_id(self, query_id):
+        """Returns read identifier for query identifier of the second
+        DIAMOND search"""
+        return self.get_hit_segment(query_id)[0]
 
     def import_fastq(self):
         """Reads uncompressed or gzipped FASTQ file, finds sequences of
@@ -266,10 +374,7 @@ class DiamondParser(object):
         base_count = 0
         current_read = None
         infile_handle = None
-        if fastq_file.endswith('.gz'):
-            infile_handle = gzip.open(fastq_file, 'rb')
-        else:
-            infile_handle = open(fastq_file, 'rb')
+        infile_handle = open_input_file(fastq_file, 'rb', int(self.config.threads))
         for line in infile_handle:
             # count lines as each FASTQ entry has exactly four lines
             line_counter += 1
@@ -313,10 +418,7 @@ class DiamondParser(object):
         base_count = 0
         current_id = ''
         infile_handle = None
-        if fasta_file.endswith('.gz'):
-            infile_handle = gzip.open(fasta_file, 'rb')
-        else:
-            infile_handle = open(fasta_file, 'rb')
+        infile_handle = open_input_file(fasta_file, 'rb', int(self.config.threads))
         for line in infile_handle:
             line = line.decode('utf8').rstrip('\n\r')
             if line.startswith('>'):
@@ -345,10 +447,11 @@ class DiamondParser(object):
     def export_read_fastq(self):
         """Exports sequence reads as gzipped FASTQ file"""
         outdir = self.sample.work_directory
-        with gzip.open(os.path.join(outdir,
-                                    self.sample.sample_id + '_'
-                                    + self.end + '_'
-                                    + self.options.reads_fastq_name + '.gz'), 'wt') as outfile:
+        with open_output_file(os.path.join(outdir,
+                                           self.sample.sample_id + '_'
+                                           + self.end + '_'
+                                           + self.options.reads_fastq_name + '.gz'),
+                              'wt', int(self.config.threads)) as outfile:
             for read_id in sorted(self.reads.keys()):
                 if self.reads[read_id].status == STATUS_GOOD:
                     outfile.write(self.reads[read_id].read_id_line + '\n')
@@ -363,7 +466,7 @@ class DiamondParser(object):
                                   self.sample.sample_id + '_'
                                   + self.end + '_'
                                   + self.options.reads_fastq_name + '.gz')
-        with gzip.open(fastq_file, 'wt') as outfile:
+        with open_output_file(fastq_file, 'wt', int(self.config.threads)) as outfile:
             for read_id in sorted(self.reads.keys()):
                 if self.reads[read_id].status == STATUS_GOOD:
                     outfile.write(self.reads[read_id].read_id_line + '\n')
@@ -399,6 +502,41 @@ class DiamondParser(object):
                     except TypeError:
                         print('TypeError occurred while exporting ', read_id)
 
+    def export_hit_segments(self, outfile=None, prefix=''):
+        """Exports sequences of DIAMOND hits in FASTA format for the second
+        DIAMOND search. Sequence identifier of each hit is its index in
+        the hit_segments list.
+
+        Args:
+            outfile (file object, optional): text file for output, for
+                example, stdin of DIAMOND. If not set, sequences are written
+                to hits file in sample work directory.
+            prefix (str): string added before each sequence identifier
+        """
+        if outfile is None:
+            with open(os.path.join(self.sample.work_directory,
+                                   self.sample.sample_id + '_'
+                                   + self.end + '_'
+                                   + self.options.ref_hits_fastq_name), 'w') as outfile:
+                self.export_hit_segments(outfile, prefix)
+            return
+        if self.hit_segments is None:
+            self.hit_segments = self.get_hit_segments()
+        # hit lists may be changed by parse_background_output while
+        # this function is running, but hit_segments are not
+        for segment_index, (read_id, start, end) in enumerate(self.hit_segments):
+            read = self.reads[read_id]
+            try:
+                if start < end:
+                    # hit on + strand
+                    sequence = read.sequence[start - 1:end]
+                else:
+                    # hit on - strand
+                    sequence = read.sequence[end - 1:start]
+                outfile.write('>' + prefix + str(segment_index) + '\n' + sequence + '\n')
+            except TypeError:
+                print('TypeError occurred while exporting ', read_id)
+
     def export_hit_fasta(self):
         """Exports sequences of DAIMOND hits as gzipped FASTA file"""
         outdir = self.sample.work_directory
@@ -456,13 +594,10 @@ class DiamondParser(object):
                                      self.sample.sample_id + '_'
                                      + self.end + '_'
                                      + self.options.pe_reads_fastq_name + '.gz')
-        with gzip.open(fastq_outfile, 'wt') as outfile:
+        with open_output_file(fastq_outfile, 'wt', int(self.config.threads)) as outfile:
             current_read = None
             infile_handle = None
-            if fastq_file.endswith('.gz'):
-                infile_handle = gzip.open(fastq_file, 'rb')
-            else:
-                infile_handle = open(fastq_file, 'rb')
+            infile_handle = open_input_file(fastq_file, 'rb', int(self.config.threads))
             for line in infile_handle:
                 line_counter += 1
                 if line_counter == 5:
@@ -520,3 +655,26 @@ class DiamondParser(object):
             ret_val[current_read_id].hit_list = hit_list
 
         return ret_val
+
+
+def _process_background_shard(shard):
+    """Processes a range of background DIAMOND output in a worker process.
+
+    Args:
+        shard (tuple(str, int, int)): path to DIAMOND output file, start
+            and end offsets of the range
+
+    Returns:
+        :obj:'list' of tuple: read identifier, status, functions,
+            taxonomy identifier and hits for each processed read
+    """
+    parser = _BACKGROUND_PARSER
+    tsvfile, start, end = shard
+    with open(tsvfile, 'rb') as infile:
+        infile.seek(start)
+        data = infile.read(end - start)
+    result = []
+    for read_id in parser.process_background_hits(io.BytesIO(data)):
+        read = parser.reads[read_id]
+        result.append((read_id, read.status, read.functions, read.taxonomy, read.hit_list.hits))
+    return result
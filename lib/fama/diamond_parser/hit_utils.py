@@ -1,8 +1,15 @@
 """Various functions working with DIAMOND hits"""
-from collections import defaultdict, Counter
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
 from fama.utils.const import ENDS, RANKS, STATUS_GOOD, STATUS_BAD, \
     ROOT_TAXONOMY_ID, UNKNOWN_TAXONOMY_ID
 
+# Minimal fraction of selected hits, which must share a function for
+# assignment of the function to a read
+FUNCTION_WEIGHT_THRESHOLD = 0.5
+# Maximal number of (taxonomy ID, functions) pairs in the cache of rank thresholds
+RANK_THRESHOLDS_CACHE_SIZE = 65536
+
 
 def get_rpkm_score(hit, function_fraction, total_readcount, length_cutoff):
     """Calculates RPKM score of a single hit (number of reads per million
@@ -119,6 +126,109 @@ def get_abundance(coverage, average_coverage, function_fraction=1.0):
     return result
 
 
+@lru_cache(maxsize=RANK_THRESHOLDS_CACHE_SIZE)
+def get_rank_thresholds(taxonomy_id, functions, taxonomy_data, ref_data):
+    """Walks up taxonomy tree from a taxon assigned to reference protein
+    and collects amino acid identity thresholds of taxonomy ranks for
+    the protein functions.
+
+    Note: results are kept in LRU cache, use get_rank_thresholds.cache_info()
+    for hit and miss counts.
+
+    Args:
+        taxonomy_id (str): taxonomy identifier of reference protein
+        functions (tuple of str): function identifiers of reference protein
+        taxonomy_data (:obj:TaxonomyData): taxonomic data
+        ref_data (:obj:ReferenceData): functional reference data
+
+    Returns:
+        thresholds (tuple of float): negated identity thresholds in ascending
+            order. Only taxa with threshold lower than threshold of any
+            taxon below them are kept.
+        taxonomy_ids (tuple of str): taxonomy identifiers for thresholds
+        complete (bool): False if the walk stopped before the root with
+            KeyError raised by taxonomy data
+    """
+    thresholds = []
+    taxonomy_ids = []
+    rank = taxonomy_data.get_rank(taxonomy_id)
+    try:
+        while taxonomy_id != ROOT_TAXONOMY_ID:
+            if rank in RANKS:
+                min_rank_threshold = 100.0
+                for function in functions:
+                    rank_threshold = ref_data.lookup_identity_threshold(
+                        function=function, rank=rank
+                        )
+                    if min_rank_threshold > rank_threshold:
+                        min_rank_threshold = rank_threshold
+                if not thresholds or -min_rank_threshold > thresholds[-1]:
+                    thresholds.append(-min_rank_threshold)
+                    taxonomy_ids.append(taxonomy_id)
+            taxonomy_id, rank = taxonomy_data.get_upper_level_taxon(taxonomy_id)
+    except KeyError:
+        return tuple(thresholds), tuple(taxonomy_ids), False
+    return tuple(thresholds), tuple(taxonomy_ids), True
+
+
+def get_hit_taxonomy_id(taxonomy_id, hit, taxonomy_data, ref_data):
+    """Finds the lowest taxon, starting from taxon of reference protein,
+    for which amino acid identity of a hit is not below identity threshold
+    of the taxon rank for the hit functions.
+
+    Args:
+        taxonomy_id (str): taxonomy identifier of reference protein
+        hit (:obj:DiamondHit): DIAMOND hit
+        taxonomy_data (:obj:TaxonomyData): taxonomic data
+        ref_data (:obj:ReferenceData): functional reference data
+
+    Returns:
+        taxonomy_id (str): taxonomy identifier or None, if identity is
+            below all thresholds
+
+    Raises:
+        KeyError if taxonomy tree above the protein taxon is broken
+    """
+    thresholds, taxonomy_ids, complete = get_rank_thresholds(
+        taxonomy_id, tuple(hit.functions), taxonomy_data, ref_data
+        )
+    index = bisect_left(thresholds, -hit.identity)
+    if index < len(taxonomy_ids):
+        return taxonomy_ids[index]
+    if not complete:
+        raise KeyError(taxonomy_id)
+    return None
+
+
+def find_major_functions(hits):
+    """Finds functions assigned to more than FUNCTION_WEIGHT_THRESHOLD
+    fraction of hits and, for each of them, the first hit with the highest
+    bit-score.
+
+    Args:
+        hits (:obj:'list' of :obj:'DiamondHit'): hits to be analyzed
+
+    Returns:
+        :obj:'dict'[str, :obj:'DiamondHit']: best hit for each function.
+            Functions are in order of their first appearance in hits.
+    """
+    function_counts = {}
+    function_hits = {}
+    for hit in hits:
+        bitscore = hit.bitscore
+        for function in hit.functions:
+            if function in function_counts:
+                function_counts[function] += 1
+                if bitscore > function_hits[function].bitscore:
+                    function_hits[function] = hit
+            else:
+                function_counts[function] = 1
+                function_hits[function] = hit
+    hit_count = len(hits)
+    return {function: function_hit for function, function_hit in function_hits.items()
+            if function_counts[function] / hit_count > FUNCTION_WEIGHT_THRESHOLD}
+
+
 def compare_hits_erpk_lca(read, hit_start, hit_end, new_hit_list, bitscore_range_cutoff,
                           length_cutoff, average_read_length, taxonomy_data,
                           ref_data, rank_cutoffs=None):
@@ -177,42 +287,19 @@ def compare_hits_erpk_lca(read, hit_start, hit_end, new_hit_list, bitscore_range
     selected_hits = [new_hit for new_hit in new_hit_list.hits if
                      new_hit.bitscore > bitscore_lower_cutoff]
     # Add existing hit if it has acceptable bitscore
-    if hit.subject_id not in [selected_hit.subject_id for selected_hit in selected_hits] and (
-            hit.bitscore >= best_bitscore
+    if hit.bitscore >= best_bitscore and all(
+            selected_hit.subject_id != hit.subject_id for selected_hit in selected_hits
     ):
         selected_hits.append(hit)
 
-    # Make non-redundant list of functions from hits after filtering
-    candidate_functions_count = Counter()
-    candidate_functions_data = defaultdict(dict)
-    # Find best hit for each function: only one hit with
-    # highest bitscore to be reported for each function
-    for selected_hit in selected_hits:
-        for selected_hit_function in selected_hit.functions:
-            candidate_functions_count[selected_hit_function] += 1
-            try:
-                if (
-                        selected_hit.bitscore >
-                        candidate_functions_data[selected_hit_function]['bit_score']
-                ):
-                    candidate_functions_data[selected_hit_function]['bit_score'] = \
-                        selected_hit.bitscore
-                    candidate_functions_data[selected_hit_function]['hit'] = \
-                        selected_hit
-            except KeyError:
-                candidate_functions_data[selected_hit_function]['bit_score'] = \
-                    selected_hit.bitscore
-                candidate_functions_data[selected_hit_function]['hit'] = \
-                    selected_hit
-    selected_functions = {}
-    function_weight_threshold = 0.5
+    # Find functions of the majority of hits and best hit for each function:
+    # only one hit with highest bitscore to be reported for each function
+    function_hits = find_major_functions(selected_hits)
     # Calculate RPK scores for functions
-    for function in candidate_functions_data:
-        function_weight = candidate_functions_count[function] / len(selected_hits)
-        if function_weight > function_weight_threshold:
-            selected_functions[function] = \
-                get_erpk_score(candidate_functions_data[function]['hit'].s_len,
-                               average_read_length, length_cutoff)
+    selected_functions = {}
+    for function, function_hit in function_hits.items():
+        selected_functions[function] = \
+            get_erpk_score(function_hit.s_len, average_read_length, length_cutoff)
 
     # If one of the most common function in new hits is unknown, set
     # status STATUS_BAD and return
@@ -226,7 +313,7 @@ def compare_hits_erpk_lca(read, hit_start, hit_end, new_hit_list, bitscore_range
     # Set new list of hits
     read.hit_list.remove_hit_by_index(hit_i)
     for func in selected_functions:
-        good_hit = candidate_functions_data[func]['hit']
+        good_hit = function_hits[func]
         good_hit.query_id = read.read_id
         good_hit.q_start = hit_start
         good_hit.q_end = hit_end
@@ -236,7 +323,8 @@ def compare_hits_erpk_lca(read, hit_start, hit_end, new_hit_list, bitscore_range
     # Collect taxonomy IDs of all hits for LCA inference
     for selected_hit in selected_hits:
         subject_taxon_id = ref_data.lookup_protein_tax(selected_hit.subject_id)
-        subject_rank = taxonomy_data.get_rank(subject_taxon_id)
+        # raises KeyError if taxonomy ID is not in taxonomy data
+        taxonomy_data.get_rank(subject_taxon_id)
         # Consider only hits with functions mapped to the read
         skip_hit = True
         for hit_function in selected_hit.functions:
@@ -244,26 +332,10 @@ def compare_hits_erpk_lca(read, hit_start, hit_end, new_hit_list, bitscore_range
                 skip_hit = False
         if skip_hit:
             continue
-
-        while subject_taxon_id != ROOT_TAXONOMY_ID:
-            if subject_rank not in RANKS:
-                (subject_taxon_id, subject_rank) = \
-                    taxonomy_data.get_upper_level_taxon(subject_taxon_id)
-            else:
-                min_rank_threshold = 100.0
-                for hit_function in selected_hit.functions:
-                    rank_threshold = \
-                        ref_data.lookup_identity_threshold(
-                            function=hit_function, rank=subject_rank
-                            )
-                    if min_rank_threshold > rank_threshold:
-                        min_rank_threshold = rank_threshold
-                if selected_hit.identity < min_rank_threshold:
-                    (subject_taxon_id, subject_rank) = \
-                        taxonomy_data.get_upper_level_taxon(subject_taxon_id)
-                else:
-                    taxonomy_ids.add(subject_taxon_id)
-                    break
+        hit_taxon_id = get_hit_taxonomy_id(subject_taxon_id, selected_hit, taxonomy_data,
+                                           ref_data)
+        if hit_taxon_id is not None:
+            taxonomy_ids.add(hit_taxon_id)
     # Set read taxonomy ID
     if taxonomy_ids:
         read.taxonomy = taxonomy_data.get_lca(taxonomy_ids)
@@ -323,45 +395,22 @@ def compare_protein_hits_lca(read, hit_start, hit_end, new_hit_list, bitscore_ra
     bitscore_lower_cutoff = best_bitscore * (1.0 - bitscore_range_cutoff)
     selected_hits = [new_hit for new_hit in new_hit_list.hits if
                      new_hit.bitscore > bitscore_lower_cutoff]
-    if hit.subject_id not in [
-            selected_hit.subject_id for selected_hit in selected_hits
-    ] and hit.bitscore >= best_bitscore:
+    if hit.bitscore >= best_bitscore and all(
+            selected_hit.subject_id != hit.subject_id for selected_hit in selected_hits
+    ):
         selected_hits.append(hit)
 
-    # Make non-redundant list of functions from hits after filtering
-    candidate_functions_count = Counter()
-    candidate_functions_data = defaultdict(dict)
-    # Find best hit for each function: only one hit with highest bitscore will be
-    # reported for each function
-    for selected_hit in selected_hits:
-        for selected_hit_function in selected_hit.functions:
-            candidate_functions_count[selected_hit_function] += 1
-            try:
-                if (
-                        selected_hit.bitscore >
-                        candidate_functions_data[selected_hit_function]['bit_score']
-                ):
-                    candidate_functions_data[selected_hit_function]['bit_score'] = \
-                        selected_hit.bitscore
-                    candidate_functions_data[selected_hit_function]['hit'] = \
-                        selected_hit
-            except KeyError:
-                candidate_functions_data[selected_hit_function]['bit_score'] = \
-                    selected_hit.bitscore
-                candidate_functions_data[selected_hit_function]['hit'] = \
-                    selected_hit
-
-    # If the most common function in new hits is unknown, set status "nofunction" and return
-    selected_functions = {}
-    function_weight_threshold = 0.5
+    # Find functions of the majority of hits and best hit for each function:
+    # only one hit with highest bitscore will be reported for each function
+    function_hits = find_major_functions(selected_hits)
     # Calculate protein scores for selected functions
-    for function in candidate_functions_data:
-        function_weight = candidate_functions_count[function] / len(selected_hits)
-        if function_weight > function_weight_threshold:
-            selected_functions[function] = get_abundance(
-                coverage, average_coverage
-            )
+    selected_functions = {}
+    for function in function_hits:
+        selected_functions[function] = get_abundance(
+            coverage, average_coverage
+        )
 
+    # If the most common function in new hits is unknown, set status "nofunction" and return
     if not selected_functions or '' in selected_functions:
         read.set_status(STATUS_BAD)
         return
@@ -373,7 +422,7 @@ def compare_protein_hits_lca(read, hit_start, hit_end, new_hit_list, bitscore_ra
     # Set new list of hits
     read.hit_list.remove_hit_by_index(hit_i)
     for func in selected_functions:
-        good_hit = candidate_functions_data[func]['hit']
+        good_hit = function_hits[func]
         try:
             good_hit.query_id = read.read_id
         except AttributeError:
@@ -384,7 +433,8 @@ def compare_protein_hits_lca(read, hit_start, hit_end, new_hit_list, bitscore_ra
     # Collect taxonomy IDs of all hits for LCA inference
     for selected_hit in selected_hits:
         subject_taxon_id = ref_data.lookup_protein_tax(selected_hit.subject_id)
-        subject_rank = taxonomy_data.get_rank(subject_taxon_id)
+        # raises KeyError if taxonomy ID is not in taxonomy data
+        taxonomy_data.get_rank(subject_taxon_id)
         # Consider only hits with functions mapped to the read
         skip_hit = True
         for hit_function in selected_hit.functions:
@@ -392,25 +442,10 @@ def compare_protein_hits_lca(read, hit_start, hit_end, new_hit_list, bitscore_ra
                 skip_hit = False
         if skip_hit:
             continue
-        while subject_taxon_id != ROOT_TAXONOMY_ID:
-            if subject_rank not in RANKS:
-                subject_taxon_id, subject_rank = \
-                    taxonomy_data.get_upper_level_taxon(subject_taxon_id)
-            else:
-                min_rank_threshold = 100.0
-                for hit_function in selected_hit.functions:
-                    rank_threshold = \
-                        ref_data.lookup_identity_threshold(
-                            function=hit_function, rank=subject_rank
-                            )
-                    if min_rank_threshold > rank_threshold:
-                        min_rank_threshold = rank_threshold
-                if selected_hit.identity < min_rank_threshold:
-                    subject_taxon_id, subject_rank = \
-                        taxonomy_data.get_upper_level_taxon(subject_taxon_id)
-                else:
-                    taxonomy_ids.add(subject_taxon_id)
-                    break
+        hit_taxon_id = get_hit_taxonomy_id(subject_taxon_id, selected_hit, taxonomy_data,
+                                           ref_data)
+        if hit_taxon_id is not None:
+            taxonomy_ids.add(hit_taxon_id)
     # Set read taxonomy ID
     if taxonomy_ids:
         read.taxonomy = taxonomy_data.get_lca(taxonomy_ids)
@@ -625,3 +660,65 @@ def replace_hit(new_hit, hit_list, overlap_cutoff):
     if append_flag:
         ret_val.append(new_hit)
     return ret_val
+
+
+def filter_overlapping_hits(hits, overlap_cutoff):
+    """Filters list of DiamondHit objects. Removes hits, which overlap by
+    more than 'overlap_cutoff' base pairs with any hit with higher bit-score.
+
+    Note: this function returns the same list (including the order of hits)
+    as sequential calls of hit_overlaps_any_hits, has_higher_score and
+    replace_hit for each hit. Instead of scanning all selected hits for
+    each new hit, it keeps selected hits of each strand sorted by start
+    position and tests only hits within the window, where overlap is possible.
+
+    Args:
+        hits(:obj:'list' of :obj:'DiamondHit'): list of hits to be filtered.
+            Hits with identical start and end are not supported.
+        overlap_cutoff(int): minimal length of a common area between
+            hits to be considered overlapping
+
+    Returns:
+        :obj:'list' of :obj:'DiamondHit': filtered list of DIAMOND hits
+
+    """
+    # Selected hits in order of addition: key is index of hit in input list
+    selected_hits = {}
+    # For each strand, start and end positions of selected hits sorted by
+    # start position, and keys of the hits in selected_hits
+    starts = {True: [], False: []}
+    ends = {True: [], False: []}
+    keys = {True: [], False: []}
+    # For each strand, upper limit of lengths of selected hits
+    max_length = {True: 0, False: 0}
+    for hit_index, hit in enumerate(hits):
+        if hit.q_start < hit.q_end:
+            strand, start, end = True, hit.q_start, hit.q_end
+        else:
+            strand, start, end = False, hit.q_end, hit.q_start
+        strand_starts = starts[strand]
+        strand_ends = ends[strand]
+        strand_keys = keys[strand]
+        # Hits overlap if end of each hit is at least overlap_cutoff bp
+        # after start of another hit
+        first = bisect_left(strand_starts, start + overlap_cutoff - max_length[strand])
+        last = bisect_right(strand_starts, end - overlap_cutoff)
+        overlapping = [index for index in range(first, last)
+                       if strand_ends[index] >= start + overlap_cutoff]
+        if overlapping:
+            if any(hit.bitscore <= selected_hits[strand_keys[index]].bitscore
+                   for index in overlapping):
+                continue
+            for index in reversed(overlapping):
+                del selected_hits[strand_keys[index]]
+                del strand_starts[index]
+                del strand_ends[index]
+                del strand_keys[index]
+        insert_index = bisect_right(strand_starts, start)
+        strand_starts.insert(insert_index, start)
+        strand_ends.insert(insert_index, end)
+        strand_keys.insert(insert_index, hit_index)
+        selected_hits[hit_index] = hit
+        if end - start > max_length[strand]:
+            max_length[strand] = end - start
+    return list(selected_hits.values())
@@ -0,0 +1,185 @@
+"""Functions for chunked reading of DIAMOND output in tabular format"""
+import os
+import gc
+import csv
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+from fama.diamond_parser.diamond_hit import DiamondHit
+
+# Fields of DIAMOND output format 6 used by Fama, in the order of DiamondHit arguments
+TABULAR_FIELDS = ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'slen',
+                  'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore']
+TABULAR_DTYPES = {'qseqid': str, 'sseqid': str, 'pident': float, 'length': int,
+                  'mismatch': int, 'slen': int, 'qstart': int, 'qend': int,
+                  'sstart': int, 'send': int, 'evalue': float, 'bitscore': float}
+# Number of DIAMOND output lines parsed at once
+TABULAR_CHUNK_SIZE = 100000
+
+# Garbage collector state shared by threads parsing DIAMOND output
+_GC_LOCK = threading.Lock()
+_GC_STATE = {'depth': 0, 'enabled': False}
+
+
+@contextmanager
+def gc_suspended():
+    """Disables garbage collector till the end of the block. Blocks may
+    run in several threads at the same time: the collector is disabled by
+    the first block entered and restored by the last block exited."""
+    with _GC_LOCK:
+        if _GC_STATE['depth'] == 0:
+            _GC_STATE['enabled'] = gc.isenabled()
+            gc.disable()
+        _GC_STATE['depth'] += 1
+    try:
+        yield
+    finally:
+        with _GC_LOCK:
+            _GC_STATE['depth'] -= 1
+            if _GC_STATE['depth'] == 0 and _GC_STATE['enabled']:
+                gc.enable()
+
+
+def read_tabular_chunks(tsvfile, chunk_size=TABULAR_CHUNK_SIZE):
+    """Reads DIAMOND tabular output by large blocks of lines and converts
+    each block into typed columns.
+
+    Args:
+        tsvfile (str or file object): DIAMOND output file
+        chunk_size (int): number of lines in one block
+
+    Yields:
+        :obj:pandas.DataFrame: block of DIAMOND hits, one column per field
+    """
+    # round_trip precision guarantees the same floats as float() conversion
+    for chunk in pd.read_csv(tsvfile, sep='\t', header=None, names=TABULAR_FIELDS,
+                             usecols=range(len(TABULAR_FIELDS)), dtype=TABULAR_DTYPES,
+                             chunksize=chunk_size, na_filter=False, quoting=csv.QUOTE_NONE,
+                             float_precision='round_trip'):
+        yield chunk
+
+
+def parse_tabular_chunk(chunk, length_cutoff=0, query_id_parser=None):
+    """Converts a block of DIAMOND hits into DiamondHit objects grouped by query.
+
+    Note: hits shorter than length_cutoff are removed before any DiamondHit
+    is created. Hits of one query are expected to be contiguous.
+
+    Args:
+        chunk (:obj:pandas.DataFrame): block of DIAMOND hits
+        length_cutoff (int): minimal length of alignment
+        query_id_parser (function, optional): function that takes query
+            identifier from DIAMOND output and returns sequence identifier
+
+    Returns:
+        :obj:'list' of tuple(str, :obj:'list' of :obj:'DiamondHit'): query
+            identifiers and hits in the same order as in the block
+    """
+    if length_cutoff > 0:
+        chunk = chunk[chunk['length'].values >= length_cutoff]
+    if chunk.empty:
+        return []
+    query_ids = chunk['qseqid'].values
+    # first row of each run of identical query identifiers
+    starts = np.flatnonzero(query_ids[1:] != query_ids[:-1]) + 1
+    starts = [0] + starts.tolist()
+    ends = starts[1:] + [len(query_ids)]
+    run_ids = query_ids[starts].tolist()
+    if query_id_parser is not None:
+        run_ids = [query_id_parser(query_id) for query_id in run_ids]
+    # all hits of one query share the same identifier string
+    query_ids = np.repeat(np.array(run_ids, dtype=object), np.subtract(ends, starts))
+    # DiamondHit objects have no reference cycles: suspend garbage
+    # collector, which otherwise rescans the heap during bulk allocation
+    with gc_suspended():
+        hits = list(map(DiamondHit, query_ids.tolist(),
+                        *[chunk[field].tolist() for field in TABULAR_FIELDS[1:]]))
+    result = []
+    for query_id, start, end in zip(run_ids, starts, ends):
+        if result and result[-1][0] == query_id:
+            # different identifiers of one sequence, e.g. with end suffixes
+            result[-1][1].extend(hits[start:end])
+        else:
+            result.append((query_id, hits[start:end]))
+    return result
+
+
+def read_tabular_hits(tsvfile, length_cutoff=0, query_id_parser=None,
+                      chunk_size=TABULAR_CHUNK_SIZE):
+    """Reads DIAMOND output in tabular format and groups hits by query.
+
+    Hits shorter than length_cutoff are skipped. Hits of one query must
+    be contiguous in the file, as DIAMOND reports them.
+
+    Args:
+        tsvfile (str or file object): DIAMOND output file
+        length_cutoff (int): minimal length of alignment
+        query_id_parser (function, optional): function that takes query
+            identifier from DIAMOND output and returns sequence identifier
+        chunk_size (int): number of lines parsed at once
+
+    Yields:
+        query_id (str): query identifier
+        hits (:obj:'list' of :obj:'DiamondHit'): all hits of the query
+    """
+    current_query_id = None
+    current_hits = []
+    try:
+        for chunk in read_tabular_chunks(tsvfile, chunk_size):
+            for query_id, hits in parse_tabular_chunk(chunk, length_cutoff, query_id_parser):
+                if query_id != current_query_id:
+                    if current_hits:
+                        yield current_query_id, current_hits
+                    current_query_id = query_id
+                    current_hits = []
+                current_hits.extend(hits)
+    except pd.errors.EmptyDataError:
+        # DIAMOND found no hits
+        pass
+    if current_hits:
+        yield current_query_id, current_hits
+
+
+def get_tabular_shards(tsvfile, shard_size, key_function=None):
+    """Splits DIAMOND tabular output into byte ranges, which do not split
+    groups of lines with the same key.
+
+    Args:
+        tsvfile (str): path to DIAMOND output file
+        shard_size (int): approximate size of one range in bytes
+        key_function (function, optional): function that takes query
+            identifier and returns grouping key. If not set, query
+            identifier is the key.
+
+    Returns:
+        :obj:'list' of tuple(int, int): start and end offsets of ranges
+    """
+    result = []
+    file_size = os.path.getsize(tsvfile)
+    start = 0
+    with open(tsvfile, 'rb') as infile:
+        while start < file_size:
+            end = start + shard_size
+            if end >= file_size:
+                result.append((start, file_size))
+                break
+            infile.seek(end)
+            infile.readline()  # move to the beginning of next line
+            current_key = None
+            while True:
+                end = infile.tell()
+                line = infile.readline()
+                if not line:
+                    break
+                key = line.split(b'\t', 1)[0].decode('utf8')
+                if key_function is not None:
+                    key = key_function(key)
+                if current_key is None:
+                    current_key = key
+                elif key != current_key:
+                    break
+            result.append((start, end))
+            start = end
+    return result
@@ -321,6 +321,7 @@ evalue_cutoff = 0.0001
 hits_overlap_cutoff = 10
 biscore_range_cutoff = 0.03
 aligner_path = /kb/deployment/bin/diamond/diamond
+stream_diamond_output = yes
 krona_path = /kb/deployment/bin/krona/Krona/KronaTools/scripts/ImportXML.pl
 taxonomy_file = {refdir}/fama_taxonomy.tsv
 microbecensus_data = {refdir}
@@ -10,6 +10,31 @@ from fama.gene_assembler.gene import Gene
 from fama.gene_assembler.gene_assembly import GeneAssembly
 
 
+def get_attributes(obj):
+    """Returns dictionary of object attributes. Works for objects with
+    __dict__ and for objects with __slots__
+
+    Args:
+        obj (obj): object to encode
+    """
+    try:
+        return obj.__dict__
+    except AttributeError:
+        return {attr: getattr(obj, attr) for attr in obj.__slots__ if hasattr(obj, attr)}
+
+
+def set_attributes(obj, attributes):
+    """Sets object attributes from dictionary. Works for objects with
+    __dict__ and for objects with __slots__
+
+    Args:
+        obj (obj): object to update
+        attributes (dict): attribute names as keys, attribute values as values
+    """
+    for attr, value in attributes.items():
+        setattr(obj, attr, value)
+
+
 def decode_reads(obj):
     """Custom JSON decoder for AnnotatedRead object
 
@@ -18,15 +43,15 @@ def decode_reads(obj):
     """
     if '__AnnotatedRead__' in obj:
         annotated_read = AnnotatedRead()
-        annotated_read.__dict__.update(obj['__AnnotatedRead__'])
+        set_attributes(annotated_read, obj['__AnnotatedRead__'])
         return annotated_read
     elif '__DiamondHitList__' in obj:
         diamond_hit_list = DiamondHitList()
-        diamond_hit_list.__dict__.update(obj['__DiamondHitList__'])
+        set_attributes(diamond_hit_list, obj['__DiamondHitList__'])
         return diamond_hit_list
     elif '__DiamondHit__' in obj:
         diamond_hit = DiamondHit()
-        diamond_hit.__dict__.update(obj['__DiamondHit__'])
+        set_attributes(diamond_hit, obj['__DiamondHit__'])
         return diamond_hit
     return obj
 
@@ -39,19 +64,19 @@ def decode_sample(obj):
     """
     if '__Sample__' in obj:
         sample = Sample()
-        sample.__dict__.update(obj['__Sample__'])
+        set_attributes(sample, obj['__Sample__'])
         return sample
     elif '__AnnotatedRead__' in obj:
         annotated_read = AnnotatedRead()
-        annotated_read.__dict__.update(obj['__AnnotatedRead__'])
+        set_attributes(annotated_read, obj['__AnnotatedRead__'])
         return annotated_read
     elif '__DiamondHitList__' in obj:
         diamond_hit_list = DiamondHitList()
-        diamond_hit_list.__dict__.update(obj['__DiamondHitList__'])
+        set_attributes(diamond_hit_list, obj['__DiamondHitList__'])
         return diamond_hit_list
     elif '__DiamondHit__' in obj:
         diamond_hit = DiamondHit()
-        diamond_hit.__dict__.update(obj['__DiamondHit__'])
+        set_attributes(diamond_hit, obj['__DiamondHit__'])
         return diamond_hit
     return obj
 
@@ -64,23 +89,23 @@ def decode_assembly(obj):
     """
     if '__DiamondHitList__' in obj:
         diamond_hit_list = DiamondHitList()
-        diamond_hit_list.__dict__.update(obj['__DiamondHitList__'])
+        set_attributes(diamond_hit_list, obj['__DiamondHitList__'])
         return diamond_hit_list
     elif '__DiamondHit__' in obj:
         diamond_hit = DiamondHit()
-        diamond_hit.__dict__.update(obj['__DiamondHit__'])
+        set_attributes(diamond_hit, obj['__DiamondHit__'])
         return diamond_hit
     elif '__Contig__' in obj:
         contig = Contig()
-        contig.__dict__.update(obj['__Contig__'])
+        set_attributes(contig, obj['__Contig__'])
         return contig
     elif '__Gene__' in obj:
         gene = Gene()
-        gene.__dict__.update(obj['__Gene__'])
+        set_attributes(gene, obj['__Gene__'])
         return gene
     elif '__GeneAssembly__' in obj:
         gene_assembly = GeneAssembly()
-        gene_assembly.__dict__.update(obj['__GeneAssembly__'])
+        set_attributes(gene_assembly, obj['__GeneAssembly__'])
         return gene_assembly
     return obj
 
@@ -134,21 +159,6 @@ def import_gene_assembly(infile):
     return deserialized
 
 
-def export_annotated_reads(parser):
-    """Exports annotated reads in JSON format
-
-    Args:
-        parser (:obj:DiamondParser): parser with annotated reads
-    """
-    outfile = os.path.join(
-        parser.options.get_project_dir(parser.sample.sample_id),
-        parser.sample.sample_id + '_' + parser.end + '_' + parser.options.reads_json_name
-    )
-    # print pretty JSON: print(json.dumps(parser.reads,indent=4, cls=CustomEncoder))
-    with open(outfile, 'w') as out:
-        json.dump(parser.reads, out, cls=CustomEncoder)
-
-
 def export_sample(sample):
     """Exports sample in JSON format
 
@@ -182,4 +192,4 @@ class CustomEncoder(json.JSONEncoder):
         Args:
             obj (object): instance to encode
         """
-        return {'__{}__'.format(obj.__class__.__name__): obj.__dict__}
+        return {'__{}__'.format(obj.__class__.__name__): get_attributes(obj)}
@@ -1,7 +1,7 @@
 """Various functions for Krona chart generation
 
-Functions starting with "make_" are actual generators. Functions starting with "get_"
-return XML internal nodes for taxa.
+Functions starting with "make_" are actual generators. Functions starting with "write_"
+write XML internal nodes for taxa through KronaXmlWriter.
 
 make_functions_chart: makes Krona chart of function abundances in one sample
 make_taxonomy_chart: makes Krona chart of taxon abundances in one sample
@@ -9,12 +9,190 @@ make_taxonomy_series_chart: makes Krona chart of taxon abundances in multiple sa
 make_function_taxonomy_chart: makes Krona chart of taxon abundances for multiple
     functions in one sample
 make_assembly_taxonomy_chart: makes Krona chart of taxon/gene abundances in assemby
+
+Krona HTML pages are written by make_krona_html, which embeds the XML file into
+page template of KronaTools the same way as ktImportXML does, without running
+external program. If KronaTools files are not found, ktImportXML is called.
 """
 import os
+import glob
+import shutil
+from functools import lru_cache
 from collections import defaultdict
+from xml.sax.saxutils import escape
 from fama.utils.const import STATUS_GOOD, ROOT_TAXONOMY_ID
 from fama.utils.utils import autovivify, run_external_program
 
+# Image files of KronaTools embedded into standalone HTML page
+KRONA_IMAGES = ('hidden', 'loading', 'favicon', 'logo-med')
+
+
+class KronaXmlWriter(object):
+    """KronaXmlWriter writes Krona XML into file element by element, with
+    one tab of indentation per nesting level. Text and attribute values
+    are escaped.
+
+    Attributes:
+        out (file object): output file
+        depth (int): current nesting level
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.depth = 0
+
+    def start(self, tag, attributes=None):
+        """Writes opening tag of element with child elements"""
+        self.out.write('\t' * self.depth + '<' + tag + format_attributes(attributes) + '>\n')
+        self.depth += 1
+
+    def end(self, tag):
+        """Writes closing tag of element opened by start"""
+        self.depth -= 1
+        self.out.write('\t' * self.depth + '</' + tag + '>\n')
+
+    def element(self, tag, text='', attributes=None):
+        """Writes element with text content"""
+        self.out.write('\t' * self.depth + '<' + tag + format_attributes(attributes) + '>'
+                       + escape(text) + '</' + tag + '>\n')
+
+    def values(self, tag, values, value_attributes=None):
+        """Writes element with list of <val> elements, one value per dataset
+
+        Args:
+            tag (str): element name
+            values (list of str): formatted values
+            value_attributes (list of dict, optional): attributes of <val> elements
+        """
+        if value_attributes is None:
+            vals = ''.join(['<val>' + escape(value) + '</val>' for value in values])
+        else:
+            vals = ''.join(['<val' + format_attributes(attributes) + '>' + escape(value) + '</val>'
+                            for value, attributes in zip(values, value_attributes)])
+        self.out.write('\t' * self.depth + '<' + tag + '>' + vals + '</' + tag + '>\n')
+
+    def start_chart(self, metric, attributes, datasets):
+        """Writes chart header: attribute definitions, color settings and
+        list of datasets
+
+        Args:
+            metric (str): attribute for node size
+            attributes (list of tuple(str, str, dict)): attribute name,
+                display name and additional settings of <attribute> elements
+            datasets (list of str): dataset names
+        """
+        self.start('krona', {'key': 'false'})
+        self.start('attributes', {'magnitude': metric})
+        for name, display, settings in attributes:
+            element_attributes = {'display': display}
+            element_attributes.update(settings)
+            self.element('attribute', name, element_attributes)
+        self.end('attributes')
+        self.element('color', '', {'attribute': 'identity', 'valueStart': '50',
+                                   'valueEnd': '100', 'hueStart': '0', 'hueEnd': '240',
+                                   'default': 'true'})
+        self.start('datasets')
+        for dataset in datasets:
+            self.element('dataset', dataset)
+        self.end('datasets')
+
+    def end_chart(self):
+        """Closes root element"""
+        self.end('krona')
+
+
+def format_attributes(attributes):
+    """Returns attributes of XML element as string starting with space"""
+    if not attributes:
+        return ''
+    return ''.join([' ' + key + '="' + escape(value, {'"': '&quot;'}) + '"'
+                    for key, value in attributes.items()])
+
+
+def get_score_attributes(metric, identity_name='AAI %'):
+    """Returns definitions of readcount, metric and identity attributes"""
+    attributes = []
+    if metric == 'proteincount':
+        attributes.append((metric, 'Protein count', {}))
+    else:
+        attributes.append(('readcount', 'Read count', {}))
+    if metric not in ('readcount', 'proteincount'):
+        attributes.append((metric, 'Score:' + metric, {}))
+    attributes.append(('identity', identity_name, {'mono': 'true'}))
+    return attributes
+
+
+@lru_cache(maxsize=None)
+def get_krona_resources(krona_path):
+    """Finds JavaScript and images of KronaTools installation for
+    standalone Krona charts
+
+    Args:
+        krona_path (str): ktImportXML command or path to ImportXML.pl script
+
+    Returns:
+        dict[str,str]: key is 'script' or image name, value is file content,
+            or None if KronaTools files not found
+    """
+    script_path = shutil.which(krona_path)
+    if script_path is None:
+        return None
+    # KronaTools/scripts/ImportXML.pl or a symbolic link to it
+    tools_dir = os.path.dirname(os.path.dirname(os.path.realpath(script_path)))
+    script_files = sorted(glob.glob(os.path.join(tools_dir, 'src', 'krona-*.js')))
+    if not script_files:
+        return None
+    result = {}
+    try:
+        with open(script_files[-1], 'r') as infile:
+            result['script'] = infile.read()
+        for image in KRONA_IMAGES:
+            with open(os.path.join(tools_dir, 'img', image + '.uri'), 'r') as infile:
+                result[image] = infile.read().strip()
+    except OSError:
+        return None
+    return result
+
+
+def make_krona_html(xml_file, html_file, krona_path):
+    """Generates standalone Krona chart from XML file. The chart is the
+    same as made by ktImportXML: XML data embedded into HTML page
+    with Krona JavaScript code and images.
+
+    Args:
+        xml_file (str): path to Krona XML file
+        html_file (str): path for HTML output
+        krona_path (str): Krona Tools command
+    """
+    resources = get_krona_resources(krona_path)
+    if resources is None:
+        run_external_program([krona_path, '-o', html_file, xml_file])
+        return
+    with open(html_file, 'w') as out:
+        out.write(
+            '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" '
+            + '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+            + '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">\n'
+            + ' <head>\n'
+            + '  <meta charset="utf-8"/>\n'
+            + '  <link rel="shortcut icon" href="' + resources['favicon'] + '"/>\n'
+            + '  <script language="javascript" type="text/javascript">\n'
+            + resources['script'] + '\n'
+            + '  </script>\n'
+            + ' </head>\n'
+            + ' <body>\n'
+            + '  <img id="hiddenImage" src="' + resources['hidden']
+            + '" style="display:none" />\n'
+            + '  <img id="loadingImage" src="' + resources['loading']
+            + '" style="display:none" />\n'
+            + '  <img id="logo" src="' + resources['logo-med'] + '" style="display:none" />\n'
+            + '  <noscript>Javascript must be enabled to view this page.</noscript>\n'
+            + '  <div style="display:none">\n'
+        )
+        with open(xml_file, 'r') as infile:
+            shutil.copyfileobj(infile, out)
+        out.write('  </div>\n </body>\n</html>\n')
+
 
 def make_functions_chart(parser, metric='efpkg'):
     """Writes XML file for functions chart and generates Krona plot from it
@@ -29,25 +207,17 @@ def make_functions_chart(parser, metric='efpkg'):
         parser.sample.sample_id + '_' + parser.end + '_' + parser.options.xml_name
     )
     with open(outfile, 'w') as out:
+        writer = KronaXmlWriter(out)
         # Write header
         if metric == 'proteincount':
             metric = 'readcount'
-            out.write('<krona key="false">\n' +
-                      '\t<attributes magnitude="' + metric + '">\n' +
-                      '\t\t<attribute display="Protein count">' + metric + '</attribute>\n')
+            attributes = [(metric, 'Protein count', {})]
         else:
-            out.write('<krona key="false">\n' +
-                      '\t<attributes magnitude="' + metric + '">\n' +
-                      '\t\t<attribute display="Read count">readcount</attribute>\n')
+            attributes = [('readcount', 'Read count', {})]
         if metric != 'readcount':
-            out.write('\t\t<attribute display="Score:' + metric + '">' + metric + '</attribute>\n')
-        out.write('\t\t<attribute display="AAI %" mono="true">identity</attribute>\n'
-                  + '\t</attributes>\n'
-                  + ' '.join(['\t<color attribute="identity"', 'valueStart="50"', 'valueEnd="100"',
-                              'hueStart="0"', 'hueEnd="240"', 'default="true"></color>\n'])
-                  # Write dataset
-                  + '\t<datasets>\n\t\t<dataset>' + parser.sample.sample_id
-                  + '</dataset>\n\t</datasets>\n')
+            attributes.append((metric, 'Score:' + metric, {}))
+        attributes.append(('identity', 'AAI %', {'mono': 'true'}))
+        writer.start_chart(metric, attributes, [parser.sample.sample_id])
 
         read_count = 0
         total_rpkm = 0.0
@@ -75,142 +245,129 @@ def make_functions_chart(parser, metric='efpkg'):
 
         # Write nodes
         # Write top-level node
-        out.write('\t<node name="' + parser.sample.sample_id + '_' + parser.end + '">\n')
+        writer.start('node', {'name': parser.sample.sample_id + '_' + parser.end})
         if metric != 'readcount':
-            out.write('\t\t<readcount><val>' + str(read_count) + '</val></readcount>\n')
-        out.write('\t\t<' + metric + '><val>' + str(total_rpkm) + '</val></' + metric + '>\n')
+            writer.values('readcount', [str(read_count)])
+        writer.values(metric, [str(total_rpkm)])
 
         for group in groups_rpkm:
             # Write group-level node
-            out.write('\t\t<node name="' + group + '">\n')
+            writer.start('node', {'name': group})
             if metric != 'readcount':
-                out.write('\t\t\t<readcount><val>'
-                          + str(len(groups_counts[group]))
-                          + '</val></readcount>\n')
-            out.write('\t\t\t<' + metric + '><val>' + str(groups_rpkm[group])
-                      + '</val></' + metric + '>\n')
+                writer.values('readcount', [str(len(groups_counts[group]))])
+            writer.values(metric, [str(groups_rpkm[group])])
             if group in groups_identity:
-                out.write('\t\t\t<identity><val>'
-                          + str(sum(groups_identity[group]) / len(groups_identity[group]))
-                          + '</val></identity>\n')
+                writer.values('identity', [
+                    str(sum(groups_identity[group]) / len(groups_identity[group]))
+                ])
             else:
-                out.write('\t\t\t<identity><val>0.0</val></identity>\n')
+                writer.values('identity', ['0.0'])
             for function in parser.ref_data.get_functions_in_group(group):
                 if function in functions_rpkm:
                     # Write function-level node
-                    out.write('\t\t\t<node name="' + function + '">\n')
+                    writer.start('node', {'name': function})
                     if metric != 'readcount':
-                        out.write('\t\t\t\t<readcount><val>'
-                                  + str(len(functions_counts[function]))
-                                  + '</val></readcount>\n')
-                    out.write('\t\t\t\t<' + metric + '><val>' + str(functions_rpkm[function])
-                              + '</val></' + metric + '>\n')
+                        writer.values('readcount', [str(len(functions_counts[function]))])
+                    writer.values(metric, [str(functions_rpkm[function])])
                     if function in functions_identity:
-                        out.write(
-                            '\t\t\t\t<identity><val>' + str(sum(
-                                functions_identity[function]
-                            ) / len(functions_identity[function])) + '</val></identity>\n'
-                        )
+                        writer.values('identity', [str(
+                            sum(functions_identity[function])
+                            / len(functions_identity[function])
+                        )])
                     else:
-                        out.write('\t\t\t\t<identity><val>0.0</val></identity>\n')
-                    out.write('\t\t\t</node>\n')
+                        writer.values('identity', ['0.0'])
+                    writer.end('node')
             # Close group-level node
-            out.write('\t\t</node>\n')
+            writer.end('node')
         # Close top-level node
-        out.write('\t</node>\n</krona>')
-    # Run Krona
+        writer.end('node')
+        writer.end_chart()
+    # Make Krona chart
     html_file = os.path.join(parser.options.get_project_dir(parser.sample.sample_id),
                              parser.options.get_output_subdir(parser.sample.sample_id),
                              parser.sample.sample_id + '_' + parser.end + '_'
                              + parser.options.html_name)
-    run_external_program([parser.config.krona_path, '-o', html_file, outfile])
+    make_krona_html(outfile, html_file, parser.config.krona_path)
 
 
-def get_taxon_xml(tax_profile, taxid, offset, metric='efpkg'):
-    """Returns XML node for a phylogenetic tree node and all its children
+def write_taxon_xml(writer, tax_profile, taxid, metric='efpkg'):
+    """Writes XML node for a phylogenetic tree node and all its children
 
     Args:
+        writer (:obj:KronaXmlWriter): XML writer
         tax_profile (:obj:TaxonomyProfile): taxonomy profile
         taxid (str): taxonomy identifier of a node of interest
-        offset (int): number of starting tabs
         metric (str): scoring metric (default value 'efpkg')
-
-    Returns:
-        ret_val (str): XML node
     """
     if taxid not in tax_profile.tree.data:
         raise KeyError(taxid, 'not found in the tree!!!')
-    ret_val = '\t'*offset + '<node name="' + tax_profile.tree.data[taxid].name + '">\n'
-    offset += 1
+    writer.start('node', {'name': tax_profile.tree.data[taxid].name})
     if tax_profile.tree.data[taxid].attributes:
         if metric != 'readcount':
-            ret_val += '\t'*offset + '<readcount><val>' + format(
+            writer.values('readcount', [format(
                 tax_profile.tree.data[taxid].attributes['count'], "0.0f"
-            ) + '</val></readcount>\n'
-        ret_val += '\t'*offset + '<' + metric + '><val>' + format(
+            )])
+        writer.values(metric, [format(
             tax_profile.tree.data[taxid].attributes[metric], "0.2f"
-        ) + '</val></' + metric + '>\n'
-        ret_val += '\t'*offset + '<identity><val>' + format((
+        )])
+        writer.values('identity', [format((
             tax_profile.tree.data[taxid].attributes['identity']
             / tax_profile.tree.data[taxid].attributes['hit_count']
-        ), "0.1f") + '</val></identity>\n'
+        ), "0.1f")])
     else:
         if metric != 'readcount':
-            ret_val += '\t'*offset + '<readcount><val>0</val></readcount>\n'
-        ret_val += '\t'*offset + '<' + metric + '><val>0.0</val></' + metric + '>\n'
-        ret_val += '\t'*offset + '<identity><val>0.0</val></identity>\n'
+            writer.values('readcount', ['0'])
+        writer.values(metric, ['0.0'])
+        writer.values('identity', ['0.0'])
 
     if tax_profile.tree.data[taxid].children:
         for child_taxid in tax_profile.tree.data[taxid].children:
-            ret_val += get_taxon_xml(tax_profile, child_taxid, offset, metric)
-    offset -= 1
-    ret_val += '\t'*offset + '</node>\n'
-    return ret_val
+            write_taxon_xml(writer, tax_profile, child_taxid, metric)
+    writer.end('node')
 
 
-def get_lca_tax_xml(tax_profile, taxid, offset, metric='efpkg'):
-    """Returns XML node for a phylogenetic tree node and all its children.
+def write_lca_tax_xml(writer, tax_profile, taxid, metric='efpkg'):
+    """Writes XML node for a phylogenetic tree node and all its children.
     Creates additional child node for a fictional "Unclassified..." taxon
     if not all reads of the current node are mapped to children nodes.
 
     Args:
+        writer (:obj:KronaXmlWriter): XML writer
         tax_profile (:obj:TaxonomyProfile): taxonomy profile
         taxid (str): taxonomy identifier of a node of interest
-        offset (int): number of starting tabs
         metric (str): scoring metric (default value 'efpkg')
 
     Returns:
-        ret_val (str): XML node
+        attribute_values (defaultdict[str,float]): key is in [metric,
+            'count', 'identity', 'hit_count'], value is float.
     """
     attribute_values = defaultdict(float)
     try:
-        ret_val = '\t'*offset + '<node name="' + tax_profile.tree.data[taxid].name + '">\n'
+        writer.start('node', {'name': tax_profile.tree.data[taxid].name})
     except KeyError:
         print(taxid, 'not found in the tree data!!!')
         raise KeyError
-    offset += 1
     if tax_profile.tree.data[taxid].attributes:
         if metric != 'readcount' and metric != 'proteincount':
-            ret_val += '\t'*offset + '<readcount><val>' + format(
+            writer.values('readcount', [format(
                 tax_profile.tree.data[taxid].attributes['count'], "0.0f"
-            ) + '</val></readcount>\n'
-        ret_val += '\t'*offset + '<' + metric + '><val>' + format(
+            )])
+        writer.values(metric, [format(
             tax_profile.tree.data[taxid].attributes[metric], "0.2f"
-        ) + '</val></' + metric + '>\n'
-        ret_val += '\t'*offset + '<identity><val>' + format((
+        )])
+        writer.values('identity', [format((
             tax_profile.tree.data[taxid].attributes['identity']
             / tax_profile.tree.data[taxid].attributes['hit_count']
-        ), "0.1f") + '</val></identity>\n'
+        ), "0.1f")])
     else:
         if metric != 'readcount' and metric != 'proteincount':
-            ret_val += '\t'*offset + '<readcount><val>0</val></readcount>\n'
-        ret_val += '\t'*offset + '<' + metric + '><val>0.0</val></' + metric + '>\n'
-        ret_val += '\t'*offset + '<identity><val>0.0</val></identity>\n'
+            writer.values('readcount', ['0'])
+        writer.values(metric, ['0.0'])
+        writer.values('identity', ['0.0'])
 
     if tax_profile.tree.data[taxid].children:
         for child_taxid in tax_profile.tree.data[taxid].children:
-            child_node, child_values = get_lca_tax_xml(tax_profile, child_taxid, offset, metric)
-            ret_val += child_node
+            child_values = write_lca_tax_xml(writer, tax_profile, child_taxid, metric)
             for key, val in child_values.items():
                 attribute_values[key] += val
 
@@ -219,40 +376,37 @@ def get_lca_tax_xml(tax_profile, taxid, offset, metric='efpkg'):
                 attribute_values['count'] < tax_profile.tree.data[taxid].attributes['count']
         ):
             unknown_node = 'Unidentified ' + tax_profile.tree.data[taxid].name
-            if offset == 2:
+            if writer.depth == 2:
                 unknown_node = 'Unknown'
-            ret_val += '\t'*offset + '<node name="' + unknown_node + '">\n'
-            offset += 1
+            writer.start('node', {'name': unknown_node})
             if metric != 'readcount' and metric != 'proteincount':
-                ret_val += '\t'*offset + '<readcount><val>' + format((
+                writer.values('readcount', [format((
                     tax_profile.tree.data[taxid].attributes['count']
                     - attribute_values['count']
-                ), "0.0f") + '</val></readcount>\n'
-            ret_val += '\t'*offset + '<' + metric + '><val>' + format((
+                ), "0.0f")])
+            writer.values(metric, [format((
                 tax_profile.tree.data[taxid].attributes[metric]
                 - attribute_values[metric]
-            ), "0.2f") + '</val></' + metric + '>\n'
+            ), "0.2f")])
             if tax_profile.tree.data[taxid].attributes['hit_count'] > attribute_values['hit_count']:
-                ret_val += '\t'*offset + '<identity><val>' + format(((
+                writer.values('identity', [format(((
                     tax_profile.tree.data[taxid].attributes['identity']
                     - attribute_values['identity']
                 ) / (
                     tax_profile.tree.data[taxid].attributes['hit_count']
                     - attribute_values['hit_count']
-                )), "0.1f") + '</val></identity>\n'
+                )), "0.1f")])
             else:
-                ret_val += '\t'*offset + '<identity><val>0.0</val></identity>\n'
-            offset -= 1
-            ret_val += '\t'*offset + '</node>\n'
+                writer.values('identity', ['0.0'])
+            writer.end('node')
 
-    offset -= 1
-    ret_val += '\t'*offset + '</node>\n'
+    writer.end('node')
     attribute_values = defaultdict(float)
     attribute_values[metric] = tax_profile.tree.data[taxid].attributes[metric]
     attribute_values['count'] = tax_profile.tree.data[taxid].attributes['count']
     attribute_values['identity'] = tax_profile.tree.data[taxid].attributes['identity']
     attribute_values['hit_count'] = tax_profile.tree.data[taxid].attributes['hit_count']
-    return ret_val, attribute_values
+    return attribute_values
 
 
 def make_taxonomy_chart(tax_profile, sample, outfile, krona_path, metric='efpkg'):
@@ -266,35 +420,13 @@ def make_taxonomy_chart(tax_profile, sample, outfile, krona_path, metric='efpkg'
         metric (str): scoring metric (efpkg by default)
     """
     with open(outfile, 'w') as out:
-        # Write header
-        out.write('<krona key="false">\n')
-        out.write('\t<attributes magnitude="' + metric + '">\n')
-        if metric == 'proteincount':
-            out.write('\t\t<attribute display="Protein count">' + metric + '</attribute>\n')
-        else:
-            out.write('\t\t<attribute display="Read count">readcount</attribute>\n')
-        if metric != 'readcount' and metric != 'proteincount':
-            out.write('\t\t<attribute display="Score:' + metric + '">' + metric + '</attribute>\n')
-        out.write('\t\t<attribute display="AAI %" mono="true">identity</attribute>\n')
-        out.write('\t</attributes>\n')
-        out.write('\t<color attribute="identity" valueStart="50" valueEnd="100" hueStart="0"'
-                  + ' hueEnd="240" default="true"></color>\n')
-        # Write dataset
-        out.write('\t<datasets>\n')
-        out.write('\t\t<dataset>' + sample + '</dataset>\n')
-        out.write('\t</datasets>\n')
-
+        writer = KronaXmlWriter(out)
+        writer.start_chart(metric, get_score_attributes(metric), [sample])
         # Write nodes
-        offset = 1
-        child_node, _ = get_lca_tax_xml(tax_profile, ROOT_TAXONOMY_ID, offset, metric=metric)
-        out.write(child_node)
-        # Close XML
-        out.write('</krona>')
+        write_lca_tax_xml(writer, tax_profile, ROOT_TAXONOMY_ID, metric=metric)
+        writer.end_chart()
 
-    # Run Krona
-    html_file = outfile + '.html'
-    krona_cmd = [krona_path, '-o', html_file, outfile]
-    run_external_program(krona_cmd)
+    make_krona_html(outfile, outfile + '.html', krona_path)
 
 
 def make_taxonomy_series_chart(tax_profile, sample_list, outfile, krona_path, metric='efpkg'):
@@ -310,54 +442,31 @@ def make_taxonomy_series_chart(tax_profile, sample_list, outfile, krona_path, me
         metric (str): scoring metric (efpkg by default)
     """
     with open(outfile, 'w') as out:
-        # Write header
-        out.write('<krona key="false">\n')
-        out.write('\t<attributes magnitude="' + metric + '">\n')
-        if metric == 'proteincount':
-            out.write('\t\t<attribute display="Protein count">' + metric + '</attribute>\n')
-        else:
-            out.write('\t\t<attribute display="Read count">readcount</attribute>\n')
-        if metric != 'readcount' and metric != 'proteincount':
-            out.write('\t\t<attribute display="Score:' + metric + '">' + metric + '</attribute>\n')
-        out.write('\t\t<attribute display="AAI %" mono="true">identity</attribute>\n')
-        out.write('\t</attributes>\n')
-        out.write('\t<color attribute="identity" valueStart="50" valueEnd="100" hueStart="0" ' +
-                  'hueEnd="240" default="true"></color>\n')
-        # Write dataset
-        out.write('\t<datasets>\n')
-        for sample in sample_list:
-            out.write('\t\t<dataset>' + sample + '</dataset>\n')
-        out.write('\t</datasets>\n')
+        writer = KronaXmlWriter(out)
+        writer.start_chart(metric, get_score_attributes(metric), sample_list)
         # Write nodes
-        offset = 1
-        child_nodes, _ = get_lca_dataseries_tax_xml(
-            tax_profile, sample_list, ROOT_TAXONOMY_ID, offset, metric=metric
+        write_lca_dataseries_tax_xml(
+            writer, tax_profile, sample_list, ROOT_TAXONOMY_ID, metric=metric
             )
-        out.write(child_nodes)
-        # Close XML
-        out.write('</krona>')
+        writer.end_chart()
 
-    # Run Krona
-    html_file = outfile + '.html'
-    krona_cmd = [krona_path, '-o', html_file, outfile]
-    run_external_program(krona_cmd)
+    make_krona_html(outfile, outfile + '.html', krona_path)
 
 
-def get_lca_dataseries_tax_xml(tax_profile, dataseries, taxid, offset, metric='efpkg'):
-    """Returns XML node for a phylogenetic tree node and all its children.
+def write_lca_dataseries_tax_xml(writer, tax_profile, dataseries, taxid, metric='efpkg'):
+    """Writes XML node for a phylogenetic tree node and all its children.
     Creates additional child node for a fictional "Unclassified..." taxon
     if not all reads of the current node were mapped to children nodes.
 
     Args:
+        writer (:obj:KronaXmlWriter): XML writer
         tax_profile (:obj:TaxonomyProfile): taxonomy profile
         dataseries (list of str): either sample identifiers or function identifiers,
             depending on profile type (functional or taxonomic)
         taxid (str): taxonomy identifier of a node of interest
-        offset (int): number of starting tabs
         metric (str): scoring metric (default value 'efpkg')
 
     Returns:
-        ret_val (str): XML node
         attribute_values (defaultdict[str,dict[str,float]]): outer key is
             one of dataseries members, inner key is in [metric, 'count', 'identity'
             'hit_count'], value is float.
@@ -366,216 +475,133 @@ def get_lca_dataseries_tax_xml(tax_profile, dataseries, taxid, offset, metric='e
 
     if taxid not in tax_profile.tree.data:
         raise KeyError(taxid, 'not found in the tree!!!')
-    ret_val = '\t'*offset + '<node name="' + tax_profile.tree.data[taxid].name + '">\n'
-    offset += 1
-    if tax_profile.tree.data[taxid].attributes:
+    writer.start('node', {'name': tax_profile.tree.data[taxid].name})
+    attributes = tax_profile.tree.data[taxid].attributes
+    if attributes:
         if metric != 'readcount' and metric != 'proteincount':
-            ret_val += '\t'*offset + '<readcount>'
-            for datapoint in dataseries:
-                if (datapoint in tax_profile.tree.data[taxid].attributes) and (
-                        'count' in tax_profile.tree.data[taxid].attributes[datapoint]
-                ):
-                    ret_val += '<val>' + format(
-                        tax_profile.tree.data[taxid].attributes[datapoint]['count'], "0.0f"
-                        ) + '</val>'
-                else:
-                    ret_val += '<val>0</val>'
-            ret_val += '</readcount>\n'
-        ret_val += '\t'*offset + '<' + metric + '>'
-        for datapoint in dataseries:
-            if datapoint in tax_profile.tree.data[taxid].attributes and (
-                    metric in tax_profile.tree.data[taxid].attributes[datapoint]
-            ):
-                ret_val += '<val>' + format(
-                    tax_profile.tree.data[taxid].attributes[datapoint][metric], "0.6f"
-                ) + '</val>'
-            else:
-                ret_val += '<val>0.0</val>'
-        ret_val += '</' + metric + '>\n' + '\t'*offset + '<identity>'
-        for datapoint in dataseries:
-            if datapoint in tax_profile.tree.data[taxid].attributes and (
-                    'identity' in tax_profile.tree.data[taxid].attributes[datapoint]
-            ):
-                ret_val += '<val>' + format((
-                    tax_profile.tree.data[taxid].attributes[datapoint]['identity']
-                    / tax_profile.tree.data[taxid].attributes[datapoint]['hit_count']
-                ), "0.1f") + '</val>'
-            else:
-                ret_val += '<val>0.0</val>'
-        ret_val += '</identity>\n'
+            writer.values('readcount', [
+                format(attributes[datapoint]['count'], "0.0f")
+                if datapoint in attributes and 'count' in attributes[datapoint] else '0'
+                for datapoint in dataseries
+            ])
+        writer.values(metric, [
+            format(attributes[datapoint][metric], "0.6f")
+            if datapoint in attributes and metric in attributes[datapoint] else '0.0'
+            for datapoint in dataseries
+        ])
+        writer.values('identity', [
+            format(attributes[datapoint]['identity'] / attributes[datapoint]['hit_count'], "0.1f")
+            if datapoint in attributes and 'identity' in attributes[datapoint] else '0.0'
+            for datapoint in dataseries
+        ])
     else:
         if metric != 'readcount' and metric != 'proteincount':
-            ret_val += '\t'*offset + '<readcount>'
-            ret_val += '<val>0</val>'*len(dataseries)
-            ret_val += '</readcount>\n'
-        ret_val += '\t'*offset + '<' + metric + '>'
-        ret_val += '<val>0.0</val>'*len(dataseries)
-        ret_val += '<' + metric + '>\n' + '\t'*offset + '<identity>'
-        ret_val += '<val>0.0</val>'*len(dataseries)
-        ret_val += '</identity>\n'
+            writer.values('readcount', ['0'] * len(dataseries))
+        writer.values(metric, ['0.0'] * len(dataseries))
+        writer.values('identity', ['0.0'] * len(dataseries))
 
     if tax_profile.tree.data[taxid].children:
         for child_taxid in tax_profile.tree.data[taxid].children:
-            child_node, child_values = get_lca_dataseries_tax_xml(tax_profile,
-                                                                  dataseries,
-                                                                  child_taxid,
-                                                                  offset,
-                                                                  metric=metric)
-            ret_val += child_node
+            child_values = write_lca_dataseries_tax_xml(writer,
+                                                        tax_profile,
+                                                        dataseries,
+                                                        child_taxid,
+                                                        metric=metric)
             for datapoint in child_values.keys():
                 for key, val in child_values[datapoint].items():
                     attribute_values[datapoint][key] += val
         # Add a child node for unidentified child taxon, if needed
         unidentified_flag = False
         for datapoint in dataseries:
-            if datapoint in tax_profile.tree.data[taxid].attributes:
-                if (
-                        attribute_values[datapoint]['count']
-                        < tax_profile.tree.data[taxid].attributes[datapoint]['count']
-                ):
+            if datapoint in attributes:
+                if attribute_values[datapoint]['count'] < attributes[datapoint]['count']:
                     unidentified_flag = True
                     break
 
         if unidentified_flag:
-            if offset == 2:
-                ret_val += '\t'*offset + '<node name="Unclassified">\n'
+            if writer.depth == 2:
+                writer.start('node', {'name': 'Unclassified'})
             else:
-                ret_val += '\t'*offset + '<node name="Unclassified '\
-                           + tax_profile.tree.data[taxid].name + '">\n'
-            offset += 1
+                writer.start('node', {'name': 'Unclassified '
+                                              + tax_profile.tree.data[taxid].name})
+            unidentified = [datapoint in attributes and (
+                attribute_values[datapoint]['count'] < attributes[datapoint]['count']
+            ) for datapoint in dataseries]
             if metric != 'readcount' and metric != 'proteincount':
-                ret_val += '\t'*offset + '<readcount>'
-                for datapoint in dataseries:
-                    if datapoint in tax_profile.tree.data[taxid].attributes and (
-                            attribute_values[datapoint]['count']
-                            < tax_profile.tree.data[taxid].attributes[datapoint]['count']
-                    ):
-                        ret_val += '<val>' + format((
-                            tax_profile.tree.data[taxid].attributes[datapoint]['count']
-                            - attribute_values[datapoint]['count']
-                        ), "0.0f") + '</val>'
-                    else:
-                        ret_val += '<val>0</val>'
-                ret_val += '</readcount>\n'
-            ret_val += '\t'*offset + '<' + metric + '>'
-            for datapoint in dataseries:
-                if datapoint in tax_profile.tree.data[taxid].attributes and (
-                        attribute_values[datapoint]['count']
-                        < tax_profile.tree.data[taxid].attributes[datapoint]['count']
-                ):
-                    ret_val += '<val>' + format((
-                        tax_profile.tree.data[taxid].attributes[datapoint][metric]
-                        - attribute_values[datapoint][metric]
-                    ), "0.6f") + '</val>'
-                else:
-                    ret_val += '<val>0.0</val>'
-            ret_val += '</' + metric + '>\n'
-            ret_val += '\t'*offset + '<identity>'
-            for datapoint in dataseries:
-                if datapoint in tax_profile.tree.data[taxid].attributes and (
-                        'hit_count' in tax_profile.tree.data[taxid].attributes[datapoint]
-                ) and (
-                    attribute_values[datapoint]['hit_count']
-                    < tax_profile.tree.data[taxid].attributes[datapoint]['hit_count']
-                ):
-                    ret_val += '<val>' + format(((
-                        tax_profile.tree.data[taxid].attributes[datapoint]['identity']
-                        - attribute_values[datapoint]['identity']
-                    ) / (
-                        tax_profile.tree.data[taxid].attributes[datapoint]['hit_count']
-                        - attribute_values[datapoint]['hit_count']
-                    )), "0.1f") + '</val>'
-                else:
-                    ret_val += '<val>0.0</val>'
-            ret_val += '</identity>\n'
-            offset -= 1
-            ret_val += '\t'*offset + '</node>\n'
-    offset -= 1
-    ret_val += '\t'*offset + '</node>\n'
+                writer.values('readcount', [
+                    format(attributes[datapoint]['count'] - attribute_values[datapoint]['count'],
+                           "0.0f") if flag else '0'
+                    for datapoint, flag in zip(dataseries, unidentified)
+                ])
+            writer.values(metric, [
+                format(attributes[datapoint][metric] - attribute_values[datapoint][metric],
+                       "0.6f") if flag else '0.0'
+                for datapoint, flag in zip(dataseries, unidentified)
+            ])
+            writer.values('identity', [
+                format((
+                    attributes[datapoint]['identity'] - attribute_values[datapoint]['identity']
+                ) / (
+                    attributes[datapoint]['hit_count'] - attribute_values[datapoint]['hit_count']
+                ), "0.1f")
+                if datapoint in attributes and 'hit_count' in attributes[datapoint] and (
+                    attribute_values[datapoint]['hit_count'] < attributes[datapoint]['hit_count']
+                ) else '0.0'
+                for datapoint in dataseries
+            ])
+            writer.end('node')
+    writer.end('node')
     attribute_values = autovivify(1)
     for datapoint in dataseries:
-        if datapoint in tax_profile.tree.data[taxid].attributes:
-            if metric in tax_profile.tree.data[taxid].attributes[datapoint]:
-                attribute_values[datapoint][metric] = tax_profile.tree.data[taxid]\
-                    .attributes[datapoint][metric]
-            if 'count' in tax_profile.tree.data[taxid].attributes[datapoint]:
-                attribute_values[datapoint]['count'] = tax_profile.tree.data[taxid]\
-                    .attributes[datapoint]['count']
-            if 'identity' in tax_profile.tree.data[taxid].attributes[datapoint]:
-                attribute_values[datapoint]['identity'] = tax_profile.tree.data[taxid]\
-                    .attributes[datapoint]['identity']
-            if 'hit_count' in tax_profile.tree.data[taxid].attributes[datapoint]:
-                attribute_values[datapoint]['hit_count'] = tax_profile.tree.data[taxid]\
-                    .attributes[datapoint]['hit_count']
-    return ret_val, attribute_values
-
-
-def get_dataseries_tax_xml(tax_profile, dataseries, taxid, offset, metric='efpkg'):
-    """Returns XML node for a phylogenetic tree node and all its children.
+        if datapoint in attributes:
+            for key in (metric, 'count', 'identity', 'hit_count'):
+                if key in attributes[datapoint]:
+                    attribute_values[datapoint][key] = attributes[datapoint][key]
+    return attribute_values
+
+
+def write_dataseries_tax_xml(writer, tax_profile, dataseries, taxid, metric='efpkg'):
+    """Writes XML node for a phylogenetic tree node and all its children.
 
     Args:
+        writer (:obj:KronaXmlWriter): XML writer
         tax_profile (:obj:TaxonomyProfile): taxonomy profile
         dataseries (list of str): either sample identifiers or function identifiers,
             depending on profile type (functional or taxonomic)
         taxid (str): taxonomy identifier of a node of interest
-        offset (int): number of starting tabs
         metric (str): scoring metric (default value 'efpkg')
-
-    Returns:
-        ret_val (str): XML node
     """
     if taxid not in tax_profile.tree.data:
         raise KeyError(taxid, 'not found in the tree!!!')
-    ret_val = '\t'*offset + '<node name="' + tax_profile.tree.data[taxid].name + '">\n'
-    offset += 1
-    if tax_profile.tree.data[taxid].attributes:
+    writer.start('node', {'name': tax_profile.tree.data[taxid].name})
+    attributes = tax_profile.tree.data[taxid].attributes
+    if attributes:
         if metric != 'readcount' and metric != 'proteincount':
-            ret_val += '\t'*offset + '<readcount>'
-            for datapoint in dataseries:
-                if datapoint in tax_profile.tree.data[taxid].attributes:
-                    ret_val += '<val>' + format(
-                        tax_profile.tree.data[taxid].attributes[datapoint]['count'], "0.0f"
-                    ) + '</val>'
-                else:
-                    ret_val += '<val>0</val>'
-            ret_val += '</readcount>\n'
-        ret_val += '\t'*offset + '<' + metric + '>'
-        for datapoint in dataseries:
-            if datapoint in tax_profile.tree.data[taxid].attributes:
-                ret_val += '<val>' + format((
-                    tax_profile.tree.data[taxid].attributes[datapoint][metric]
-                ), "0.5f") + '</val>'
-            else:
-                ret_val += '<val>0.0</val>'
-        ret_val += '</' + metric + '>\n' + '\t'*offset + '<identity>'
-        for datapoint in dataseries:
-            if datapoint in tax_profile.tree.data[taxid].attributes:
-                ret_val += '<val>' + format((
-                    tax_profile.tree.data[taxid].attributes[datapoint]['identity']
-                    / tax_profile.tree.data[taxid].attributes[datapoint]['hit_count']
-                ), "0.1f") + '</val>'
-            else:
-                ret_val += '<val>0.0</val>'
-        ret_val += '</identity>\n'
+            writer.values('readcount', [
+                format(attributes[datapoint]['count'], "0.0f")
+                if datapoint in attributes else '0'
+                for datapoint in dataseries
+            ])
+        writer.values(metric, [
+            format(attributes[datapoint][metric], "0.5f")
+            if datapoint in attributes else '0.0'
+            for datapoint in dataseries
+        ])
+        writer.values('identity', [
+            format(attributes[datapoint]['identity'] / attributes[datapoint]['hit_count'], "0.1f")
+            if datapoint in attributes else '0.0'
+            for datapoint in dataseries
+        ])
     else:
         if metric != 'readcount' and metric != 'proteincount':
-            ret_val += '\t'*offset + '<readcount>'
-            ret_val += '<val>0</val>'*len(dataseries)
-            ret_val += '</readcount>\n'
-        ret_val += '\t'*offset + '<' + metric + '>'
-        ret_val += '<val>0.0</val>'*len(dataseries)
-        ret_val += '<' + metric + '>\n' + '\t'*offset + '<identity>'
-        ret_val += '<val>0.0</val>'*len(dataseries)
-        ret_val += '</identity>\n'
+            writer.values('readcount', ['0'] * len(dataseries))
+        writer.values(metric, ['0.0'] * len(dataseries))
+        writer.values('identity', ['0.0'] * len(dataseries))
 
     if tax_profile.tree.data[taxid].children:
         for child_taxid in tax_profile.tree.data[taxid].children:
-            ret_val += get_dataseries_tax_xml(
-                tax_profile, dataseries, child_taxid, offset, metric=metric
-                )
-    offset -= 1
-    ret_val += '\t'*offset + '</node>\n'
-    return ret_val
+            write_dataseries_tax_xml(writer, tax_profile, dataseries, child_taxid, metric=metric)
+    writer.end('node')
 
 
 def make_function_taxonomy_chart(tax_profile, function_list, outfile, krona_path,
@@ -591,44 +617,22 @@ def make_function_taxonomy_chart(tax_profile, function_list, outfile, krona_path
         metric (str): scoring metric (efpkg by default)
     """
     with open(outfile, 'w') as out:
-        # Write header
-        out.write('<krona key="false">\n')
-        out.write('\t<attributes magnitude="' + metric + '">\n')
-        if metric == 'proteincount':
-            out.write('\t\t<attribute display="Protein count">' + metric + '</attribute>\n')
-        else:
-            out.write('\t\t<attribute display="Read count">readcount</attribute>\n')
-        if metric != 'readcount' and metric != 'proteincount':
-            out.write('\t\t<attribute display="Score:' + metric + '">' + metric + '</attribute>\n')
-        out.write('\t\t<attribute display="Best hit identity %" mono="true">identity</attribute>\n')
-        out.write('\t</attributes>\n')
-        out.write('\t<color attribute="identity" valueStart="50" valueEnd="100" hueStart="0" '
-                  + 'hueEnd="240" default="true"></color>\n')
-        # Write dataset
-        out.write('\t<datasets>\n')
-        for function in function_list:
-            out.write('\t\t<dataset>' + function + '</dataset>\n')
-        out.write('\t</datasets>\n')
+        writer = KronaXmlWriter(out)
+        writer.start_chart(metric, get_score_attributes(metric, 'Best hit identity %'),
+                           function_list)
         # Write nodes
-        offset = 1
-        out.write(
-            get_dataseries_tax_xml(
-                tax_profile, function_list, ROOT_TAXONOMY_ID, offset, metric=metric
-                )
-        )
-        # Close XML
-        out.write('</krona>')
+        write_dataseries_tax_xml(writer, tax_profile, function_list, ROOT_TAXONOMY_ID,
+                                 metric=metric)
+        writer.end_chart()
 
-    # Run Krona
-    html_file = outfile + '.html'
-    krona_cmd = [krona_path, '-o', html_file, outfile]
-    run_external_program(krona_cmd)
+    make_krona_html(outfile, outfile + '.html', krona_path)
 
 
-def get_genes_xml(gene_data, gene_ids, dataseries, offset, metric):
-    """Returns XML nodes for all predicted gene from one taxon.
+def write_genes_xml(writer, gene_data, gene_ids, dataseries, metric):
+    """Writes XML nodes for all predicted gene from one taxon.
 
     Args:
+        writer (:obj:KronaXmlWriter): XML writer
         gene_data (defaultdict[str,defaultdict[str,dict[str,float]]]): outer key is
             gene identifier, middle key is function identifier, inner key is in
             [metric, 'count', 'identity', 'coverage', 'Length', 'Completeness'],
@@ -636,87 +640,31 @@ def get_genes_xml(gene_data, gene_ids, dataseries, offset, metric):
         gene_ids (list of str): gene identifiers
         dataseries (list of str): either sample identifiers or function identifiers,
             depending on profile type (functional or taxonomic)
-        offset (int): number of starting tabs
         metric (str): scoring metric
-
-    Returns:
-        ret_val (str): XML node
-        attribute_values (defaultdict[str,dict[str,float]]): outer key is
-            one of dataseries members, inner key is in [metric, 'count', 'identity'
-            'hit_count'], value is float.
     """
     # gene data: gene_data[gene_id][function][parameter] = parameter_value
-    ret_val = ''
     for gene_id in gene_ids:
-        ret_val += '\t'*offset + '<node name="' + gene_id + '">\n'
-        offset += 1
-
+        writer.start('node', {'name': gene_id})
+        gene = gene_data[gene_id]
         if metric != 'readcount':
-            ret_val += '\t'*offset + '<readcount>'
-            for datapoint in dataseries:
-                if datapoint in gene_data[gene_id]:
-                    ret_val += '<val>' + gene_data[gene_id][datapoint]['count'] + '</val>'
-                else:
-                    ret_val += '<val>0</val>'
-            ret_val += '</readcount>\n'
-
-        ret_val += '\t'*offset + '<' + metric + '>'
-        for datapoint in dataseries:
-            if datapoint in gene_data[gene_id]:
-                ret_val += '<val>' + gene_data[gene_id][datapoint][metric] + '</val>'
-            else:
-                ret_val += '<val>0</val>'
-        ret_val += '</' + metric + '>\n'
-        ret_val += '\t'*offset + '<coverage>'
-        for datapoint in dataseries:
-            if datapoint in gene_data[gene_id]:
-                ret_val += '<val>' + gene_data[gene_id][datapoint]['coverage'] + '</val>'
-            else:
-                ret_val += '<val>0</val>'
-        ret_val += '</coverage>\n'
-
-        ret_val += '\t'*offset + '<identity>'
-        for datapoint in dataseries:
-            if datapoint in gene_data[gene_id]:
-                ret_val += '<val>' + gene_data[gene_id][datapoint]['identity'] + '</val>'
-            else:
-                ret_val += '<val>0</val>'
-        ret_val += '</identity>\n'
-
-        ret_val += '\t'*offset + '<Length>'
-        for datapoint in dataseries:
-            if datapoint in gene_data[gene_id]:
-                ret_val += '<val>' + gene_data[gene_id][datapoint]['Length'] + '</val>'
-            else:
-                ret_val += '<val>0</val>'
-        ret_val += '</Length>\n'
-
-        ret_val += '\t'*offset + '<Completeness>'
-        for datapoint in dataseries:
-            if datapoint in gene_data[gene_id]:
-                ret_val += '<val>' + gene_data[gene_id][datapoint]['Completeness'] + '</val>'
-            else:
-                ret_val += '<val>0</val>'
-        ret_val += '</Completeness>\n'
-
-        ret_val += '\t'*offset + '<best_hit>'
-        for datapoint in dataseries:
-            if datapoint in gene_data[gene_id] and 'Best hit' in gene_data[gene_id][datapoint]:
-                ret_val += '<val href="' + gene_data[gene_id][datapoint]['Best hit'] + '">'\
-                           + gene_data[gene_id][datapoint]['Best hit'] + '</val>'
-            else:
-                ret_val += '<val></val>'
-        ret_val += '</best_hit>\n'
-
-        offset -= 1
-        ret_val += '\t'*offset + '</node>\n'
-    return ret_val
-
-
-def get_assembly_tax_xml(tax_profile, genes, dataseries, taxid, offset, metric='efpkg'):
-    """Returns XML node for assembly phylogenetic tree node and all its children.
+            writer.values('readcount', [gene[datapoint]['count'] if datapoint in gene else '0'
+                                        for datapoint in dataseries])
+        for key in (metric, 'coverage', 'identity', 'Length', 'Completeness'):
+            writer.values(key, [gene[datapoint][key] if datapoint in gene else '0'
+                                for datapoint in dataseries])
+        best_hits = [gene[datapoint]['Best hit']
+                     if datapoint in gene and 'Best hit' in gene[datapoint] else ''
+                     for datapoint in dataseries]
+        writer.values('best_hit', best_hits,
+                      [{'href': best_hit} if best_hit else None for best_hit in best_hits])
+        writer.end('node')
+
+
+def write_assembly_tax_xml(writer, tax_profile, genes, dataseries, taxid, metric='efpkg'):
+    """Writes XML node for assembly phylogenetic tree node and all its children.
 
     Args:
+        writer (:obj:KronaXmlWriter): XML writer
         tax_profile (:obj:TaxonomyProfile): taxonomy profile
         genes (defaultdict[str,defaultdict[str,dict[str,float]]]): outer key is
             gene identifier, middle key is function identifier, inner key is in
@@ -724,76 +672,46 @@ def get_assembly_tax_xml(tax_profile, genes, dataseries, taxid, offset, metric='
             value is float (genes[gene_id][function_id][parameter_name] = parameter_value).
         dataseries (list of str): function identifiers
         taxid (str): taxonomy identifier of a node of interest
-        offset (int): number of starting tabs
         metric (str): scoring metric (default value 'efpkg')
-
-    Returns:
-        ret_val (str): XML node
     """
     if taxid not in tax_profile.tree.data:
         raise KeyError(taxid, 'not found in the tree!!!')
-    ret_val = '\t'*offset + '<node name="' + taxid + ':' + tax_profile.tree.data[taxid].name\
-              + '">\n'
-    offset += 1
-    if tax_profile.tree.data[taxid].attributes:
+    writer.start('node', {'name': taxid + ':' + tax_profile.tree.data[taxid].name})
+    attributes = tax_profile.tree.data[taxid].attributes
+    if attributes:
         if metric != 'readcount':
-            ret_val += '\t'*offset + '<readcount>'
-            for datapoint in dataseries:
-                if datapoint in tax_profile.tree.data[taxid].attributes:
-                    ret_val += '<val>' + format(
-                        tax_profile.tree.data[taxid].attributes[datapoint]['count'], "0.0f"
-                    ) + '</val>'
-                else:
-                    ret_val += '<val>0</val>'
-            ret_val += '</readcount>\n'
-        ret_val += '\t' * offset + '<' + metric + '>'
-        for datapoint in dataseries:
-            if datapoint in tax_profile.tree.data[taxid].attributes:
-                ret_val += '<val>' + format(
-                    tax_profile.tree.data[taxid].attributes[datapoint][metric], "0.7f"
-                ) + '</val>'
-            else:
-                ret_val += '<val>0.0</val>'
-        ret_val += '</' + metric + '>\n' + '\t'*offset + '<identity>'
-        for datapoint in dataseries:
-            if (datapoint in tax_profile.tree.data[taxid].attributes) and (
-                tax_profile.tree.data[taxid].attributes[datapoint]['hit_count'] > 0
-            ):
-                ret_val += '<val>' + format((
-                    tax_profile.tree.data[taxid].attributes[datapoint]['identity']
-                    / tax_profile.tree.data[taxid].attributes[datapoint]['hit_count']
-                ), "0.1f") + '</val>'
-            else:
-                ret_val += '<val>0.0</val>'
-        ret_val += '</identity>\n'
-        # if not tax_profile.tree.data[taxid].children:
+            writer.values('readcount', [
+                format(attributes[datapoint]['count'], "0.0f")
+                if datapoint in attributes else '0'
+                for datapoint in dataseries
+            ])
+        writer.values(metric, [
+            format(attributes[datapoint][metric], "0.7f")
+            if datapoint in attributes else '0.0'
+            for datapoint in dataseries
+        ])
+        writer.values('identity', [
+            format(attributes[datapoint]['identity'] / attributes[datapoint]['hit_count'], "0.1f")
+            if datapoint in attributes and attributes[datapoint]['hit_count'] > 0 else '0.0'
+            for datapoint in dataseries
+        ])
         gene_ids = set()
-        for datapoint in tax_profile.tree.data[taxid].attributes:
-            if 'genes' in tax_profile.tree.data[taxid].attributes[datapoint]:
-                for gene_id in tax_profile.tree.data[taxid].attributes[datapoint]['genes'].split(
-                        ' '
-                ):
+        for datapoint in attributes:
+            if 'genes' in attributes[datapoint]:
+                for gene_id in attributes[datapoint]['genes'].split(' '):
                     gene_ids.add(gene_id)
-        ret_val += get_genes_xml(genes, sorted(gene_ids), dataseries, offset, metric)
+        write_genes_xml(writer, genes, sorted(gene_ids), dataseries, metric)
 
     else:
         if metric != 'readcount':
-            ret_val += '\t'*offset + '<readcount>'
-            ret_val += '<val>0</val>'*len(dataseries)
-            ret_val += '</readcount>\n'
-        ret_val += '\t' * offset + '<' + metric + '>'
-        ret_val += '<val>0.0</val>'*len(dataseries)
-        ret_val += '</' + metric + '>\n' + '\t'*offset + '<identity>'
-        ret_val += '<val>0.0%</val>'*len(dataseries)
-        ret_val += '</identity>\n'
+            writer.values('readcount', ['0'] * len(dataseries))
+        writer.values(metric, ['0.0'] * len(dataseries))
+        writer.values('identity', ['0.0%'] * len(dataseries))
 
     if tax_profile.tree.data[taxid].children:
         for child_taxid in tax_profile.tree.data[taxid].children:
-            ret_val += get_assembly_tax_xml(tax_profile, genes, dataseries, child_taxid, offset,
-                                            metric)
-    offset -= 1
-    ret_val += '\t'*offset + '</node>\n'
-    return ret_val
+            write_assembly_tax_xml(writer, tax_profile, genes, dataseries, child_taxid, metric)
+    writer.end('node')
 
 
 def make_assembly_taxonomy_chart(tax_profile, genes, function_list, outfile,
@@ -813,40 +731,25 @@ def make_assembly_taxonomy_chart(tax_profile, genes, function_list, outfile,
         metric (str): scoring metric (efpkg by default)
     """
     # genes contains gene data:, genes[gene_id][function][parameter] = parameter_value
+    attributes = []
+    if metric != 'readcount':
+        attributes.append(('readcount', 'Read count', {}))
+    attributes += [
+        (metric, 'Score:' + metric, {}),
+        ('coverage', 'Coverage', {'mono': 'true'}),
+        ('Length', 'Length', {'mono': 'true'}),
+        ('Completeness', 'CDS completeness %', {'mono': 'true'}),
+        ('identity', 'Best hit identity %', {'mono': 'true'}),
+        # Obsolete
+        ('best_hit', 'UniRef hit', {'hrefbase': 'https://www.uniprot.org/uniref/',
+                                    'target': 'uniref', 'mono': 'true'})
+    ]
     with open(outfile, 'w') as out:
-        # Write header
-        out.write('<krona key="false">\n')
-        out.write('\t<attributes magnitude="' + metric + '">\n')
-        if metric != 'readcount':
-            out.write('\t\t<attribute display="Read count">readcount</attribute>\n')
-        out.write('\t\t<attribute display="Score:' + metric + '">' + metric + '</attribute>\n')
-        out.write('\t\t<attribute display="Coverage" mono="true">coverage</attribute>\n')
-        out.write('\t\t<attribute display="Length" mono="true">Length</attribute>\n')
-        out.write('\t\t<attribute display="CDS completeness %" mono="true">Completeness'
-                  + '</attribute>\n')
-        out.write('\t\t<attribute display="Best hit identity %" mono="true">identity</attribute>\n')
-    # Obsolete
-        out.write('\t\t<attribute display="UniRef hit" hrefbase="https://www.uniprot.org/uniref/" '
-                  + 'target="uniref" mono="true">best_hit</attribute>\n')
-        out.write('\t</attributes>\n')
-        out.write('\t<color attribute="identity" valueStart="50" valueEnd="100" hueStart="0" '
-                  + 'hueEnd="240" default="true"></color>\n')
-        # Write dataset
-        out.write('\t<datasets>\n')
-        for function in function_list:
-            out.write('\t\t<dataset>' + function + '</dataset>\n')
-        out.write('\t</datasets>\n')
+        writer = KronaXmlWriter(out)
+        writer.start_chart(metric, attributes, function_list)
         # Write nodes
-        offset = 1
-        out.write(
-            get_assembly_tax_xml(
-                tax_profile, genes, function_list, ROOT_TAXONOMY_ID, offset, metric
-                )
-            )
-        # Close XML
-        out.write('</krona>')
+        write_assembly_tax_xml(writer, tax_profile, genes, function_list, ROOT_TAXONOMY_ID,
+                               metric)
+        writer.end_chart()
 
-    # Run Krona
-    html_file = outfile + '.html'
-    krona_cmd = [krona_path, '-o', html_file, outfile]
-    run_external_program(krona_cmd)
+    make_krona_html(outfile, outfile + '.html', krona_path)
@@ -0,0 +1,226 @@
+"""Functions for columnar serialization and deserialization of annotated
+reads in NumPy .npz format.
+
+Each attribute of AnnotatedRead and DiamondHit objects is stored as a
+separate array, so that annotations can be loaded without sequences.
+Strings are stored as UTF-8 bytes with offsets, repetitive strings (status,
+taxonomy, function and reference protein identifiers) as category codes.
+Variable-length lists (functions of reads, hits of reads and functions of
+hits) are stored as flat arrays with offsets.
+"""
+import os
+import sys
+from operator import itemgetter
+import numpy as np
+
+from fama.diamond_parser.diamond_hit import DiamondHit
+from fama.diamond_parser.diamond_hit_list import DiamondHitList
+from fama.sequences.annotated_read import AnnotatedRead
+
+# Attributes of AnnotatedRead with sequence data. Other attributes are annotations.
+SEQUENCE_COLUMNS = ('read_id_line', 'sequence', 'quality', 'line3',
+                    'pe_id', 'pe_sequence', 'pe_quality', 'pe_line3')
+# Numeric attributes of DiamondHit
+HIT_FLOAT_COLUMNS = ('identity', 'evalue', 'bitscore')
+HIT_INT_COLUMNS = ('length', 'mismatch', 's_len', 'q_start', 'q_end', 's_start', 's_end')
+
+
+def get_offsets(lengths):
+    """Returns array of offsets for list of lengths
+
+    Args:
+        lengths (list of int): lengths of list items
+
+    Returns:
+        :obj:np.ndarray: array of len(lengths) + 1 offsets starting from zero
+    """
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def encode_strings(arrays, name, values):
+    """Adds arrays for list of strings. None values are allowed.
+
+    Args:
+        arrays (dict[str, :obj:np.ndarray]): arrays to save
+        name (str): column name
+        values (list of str): strings
+    """
+    encoded = [b'' if value is None else value.encode('utf8') for value in values]
+    arrays[name + ':data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    arrays[name + ':offsets'] = get_offsets([len(value) for value in encoded])
+    arrays[name + ':null'] = np.array([value is None for value in values], dtype=bool)
+
+
+def decode_strings(data, name):
+    """Returns list of strings saved by encode_strings
+
+    Args:
+        data (:obj:NpzFile): loaded arrays
+        name (str): column name
+    """
+    blob = data[name + ':data'].tobytes()
+    offsets = data[name + ':offsets'].tolist()
+    if blob.isascii():
+        # byte offsets are the same as character offsets
+        blob = blob.decode('ascii')
+        result = [blob[start:end] for start, end in zip(offsets, offsets[1:])]
+    else:
+        result = [blob[start:end].decode('utf8') for start, end in zip(offsets, offsets[1:])]
+    null = data[name + ':null']
+    if null.any():
+        for index in np.flatnonzero(null).tolist():
+            result[index] = None
+    return result
+
+
+def encode_categories(arrays, name, values):
+    """Adds arrays for list of repetitive strings
+
+    Args:
+        arrays (dict[str, :obj:np.ndarray]): arrays to save
+        name (str): column name
+        values (list of str): strings
+    """
+    categories = {}
+    codes = [categories.setdefault(value, len(categories)) for value in values]
+    encode_strings(arrays, name + ':categories', list(categories))
+    arrays[name + ':codes'] = np.array(codes, dtype=np.int32)
+
+
+def decode_categories(data, name):
+    """Returns list of strings saved by encode_categories
+
+    Args:
+        data (:obj:NpzFile): loaded arrays
+        name (str): column name
+    """
+    categories = [value if value is None else sys.intern(value)
+                  for value in decode_strings(data, name + ':categories')]
+    codes = data[name + ':codes']
+    if not len(codes):
+        return []
+    if len(codes) == 1:
+        return [categories[codes[0]]]
+    return list(itemgetter(*codes.tolist())(categories))
+
+
+def export_annotated_reads(parser):
+    """Exports annotated reads in .npz format
+
+    Args:
+        parser (:obj:DiamondParser): parser with annotated reads
+    """
+    outfile = os.path.join(
+        parser.options.get_project_dir(parser.sample.sample_id),
+        parser.sample.sample_id + '_' + parser.end + '_' + parser.options.reads_data_name
+    )
+    save_annotated_reads(parser.reads, outfile)
+
+
+def save_annotated_reads(reads, outfile):
+    """Writes annotated reads into .npz file
+
+    Args:
+        reads (dict[str, :obj:AnnotatedRead]): key is read identifier,
+            value is annotated read
+        outfile (str): output file path
+    """
+    arrays = {}
+    read_list = list(reads.values())
+    encode_strings(arrays, 'key', list(reads.keys()))
+    encode_strings(arrays, 'read_id', [read.read_id for read in read_list])
+    encode_categories(arrays, 'status', [read.status for read in read_list])
+    encode_categories(arrays, 'taxonomy', [read.taxonomy for read in read_list])
+    for column in SEQUENCE_COLUMNS:
+        encode_strings(arrays, column, [getattr(read, column) for read in read_list])
+    # Functions of reads
+    arrays['functions:offsets'] = get_offsets([len(read.functions) for read in read_list])
+    encode_categories(arrays, 'functions:id',
+                      [function for read in read_list for function in read.functions])
+    arrays['functions:score'] = np.array(
+        [score for read in read_list for score in read.functions.values()], dtype=np.float64
+    )
+    # Hit lists
+    hit_lists = [read.hit_list for read in read_list]
+    arrays['hit_list:null'] = np.array([hit_list is None for hit_list in hit_lists], dtype=bool)
+    encode_strings(arrays, 'hit_list:query_id',
+                   [None if hit_list is None else hit_list.query_id for hit_list in hit_lists])
+    hit_lists = [[] if hit_list is None else hit_list.hits for hit_list in hit_lists]
+    arrays['hits:offsets'] = get_offsets([len(hits) for hits in hit_lists])
+    hits = [hit for hit_list in hit_lists for hit in hit_list]
+    encode_strings(arrays, 'hits:query_id', [hit.query_id for hit in hits])
+    encode_categories(arrays, 'hits:subject_id', [hit.subject_id for hit in hits])
+    for column in HIT_FLOAT_COLUMNS:
+        arrays['hits:' + column] = np.array([getattr(hit, column) for hit in hits],
+                                            dtype=np.float64)
+    for column in HIT_INT_COLUMNS:
+        arrays['hits:' + column] = np.array([getattr(hit, column) for hit in hits],
+                                            dtype=np.int64)
+    arrays['hits:functions:offsets'] = get_offsets([len(hit.functions) for hit in hits])
+    encode_categories(arrays, 'hits:functions:id',
+                      [function for hit in hits for function in hit.functions])
+    temp_file = outfile + '.' + str(os.getpid()) + '.tmp.npz'
+    np.savez_compressed(temp_file, **arrays)
+    os.replace(temp_file, outfile)
+
+
+def import_annotated_reads(infile, sequences=True):
+    """Imports annotated reads from .npz file
+
+    Args:
+        infile (str): .npz file name
+        sequences (bool): if False, only annotations are loaded and
+            sequence attributes of reads are None
+
+    Returns:
+        reads (dict[str, :obj:AnnotatedRead]): key is read identifier,
+            value is annotated read
+    """
+    if not os.path.exists(infile):
+        return {}
+    with np.load(infile, allow_pickle=False) as data:
+        keys = decode_strings(data, 'key')
+        columns = {'read_id': decode_strings(data, 'read_id'),
+                   'status': decode_categories(data, 'status'),
+                   'taxonomy': decode_categories(data, 'taxonomy')}
+        if sequences:
+            for column in SEQUENCE_COLUMNS:
+                columns[column] = decode_strings(data, column)
+        function_offsets = data['functions:offsets'].tolist()
+        function_ids = decode_categories(data, 'functions:id')
+        function_scores = data['functions:score'].tolist()
+        hit_list_null = data['hit_list:null'].tolist()
+        hit_list_query_ids = decode_strings(data, 'hit_list:query_id')
+        hit_offsets = data['hits:offsets'].tolist()
+        hit_columns = [decode_strings(data, 'hits:query_id'),
+                       decode_categories(data, 'hits:subject_id')]
+        hit_columns.extend(data['hits:' + column].tolist() for column in HIT_INT_COLUMNS)
+        hit_columns.extend(data['hits:' + column].tolist() for column in HIT_FLOAT_COLUMNS)
+        hit_function_offsets = data['hits:functions:offsets'].tolist()
+        hit_function_ids = decode_categories(data, 'hits:functions:id')
+
+    hits = []
+    for (query_id, subject_id, length, mismatch, s_len, q_start, q_end, s_start, s_end,
+         identity, evalue, bitscore, start, end) in zip(
+             *hit_columns, hit_function_offsets, hit_function_offsets[1:]
+         ):
+        hit = DiamondHit(query_id, subject_id, identity, length, mismatch, s_len,
+                         q_start, q_end, s_start, s_end, evalue, bitscore)
+        hit.functions = tuple(hit_function_ids[start:end])
+        hits.append(hit)
+
+    result = {}
+    column_names = list(columns)
+    for index, (key, values) in enumerate(zip(keys, zip(*columns.values()))):
+        read = AnnotatedRead()
+        for column, value in zip(column_names, values):
+            setattr(read, column, value)
+        start, end = function_offsets[index], function_offsets[index + 1]
+        read.functions = dict(zip(function_ids[start:end], function_scores[start:end]))
+        if not hit_list_null[index]:
+            read.hit_list = DiamondHitList(hit_list_query_ids[index])
+            read.hit_list.hits = hits[hit_offsets[index]:hit_offsets[index + 1]]
+        result[key] = read
+    return result
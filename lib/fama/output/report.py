@@ -6,7 +6,6 @@ from collections import defaultdict, Counter, OrderedDict
 from fama.utils.const import RANKS, STATUS_CAND, STATUS_GOOD, STATUS_BAD, \
     UNKNOWN_TAXONOMY_ID, ROOT_TAXONOMY_ID
 from fama.utils.utils import autovivify, sanitize_file_name
-from fama.diamond_parser.hit_utils import get_efpk_score, get_fpk_score
 from fama.taxonomy.taxonomy_profile import TaxonomyProfile
 from fama.output.xlsx_util import make_function_sample_xlsx, make_func_tax_sample_xlsx, \
     make_sample_tax_func_xlsx
@@ -384,6 +383,9 @@ def get_function_scores(project, sample_id=None, metric=None):
     calculate average identity % for a group of function by summing up
     their cumulative identity % values and divide by total number of hits.
 
+    Note 3: scores of all metrics are calculated once per sample and cached
+    in the project (see Project.get_score_table).
+
     """
     # This function actually returns read counts for readcount metric,
     # RPK for rpkm and rpkg
@@ -398,13 +400,13 @@ def get_function_scores(project, sample_id=None, metric=None):
     for sample in project.list_samples():
         if sample_id is not None and sample != sample_id:
             continue
-        length_cutoff = project.config.get_length_cutoff(project.options.get_collection(sample))
-        average_read_length = project.samples[sample].get_avg_read_length('pe1')
-        # Check if reads were processed or imported for this sample
-        if project.samples[sample].reads is None or 'pe1' not in project.samples[sample].reads:
+        # Check if reads were processed or imported for this sample.
+        # If no reads were loaded, saved scores or reads JSON are used.
+        sample_reads = project.samples[sample].reads
+        if sample_reads is None or (sample_reads and 'pe1' not in sample_reads):
             raise KeyError('No reads data loaded for sample', sample, 'end pe1')
         if project.samples[sample].is_paired_end:
-            if 'pe2' not in project.samples[sample].reads:
+            if sample_reads and 'pe2' not in sample_reads:
                 raise KeyError('No reads data loaded for sample', sample, 'end pe2')
 
         norm_factor = 0.0
@@ -424,241 +426,12 @@ def get_function_scores(project, sample_id=None, metric=None):
         if metric in ['readcount', 'erpk', 'erpkg', 'erpkm', 'proteincount']:
             if project.samples[sample].is_paired_end:
                 raise ValueError('No read count, RPKG and RPKM metric for paired-end input')
-
-            for read_id, read in project.samples[sample].reads['pe1'].items():
-                if read.status != STATUS_GOOD:  # Skip bad reads
-                    continue
-                for function in read.functions:
-                    if metric == 'readcount' or metric == 'proteincount':
-                        ret_val[function][sample]['count'] += 1.0
-                        ret_val[function][sample][metric] += 1.0
-                    else:
-                        ret_val[function][sample]['count'] += 1.0
-                        ret_val[function][sample][metric] += \
-                            norm_factor * read.functions[function]
-
-                function_maxbitscores = defaultdict(dict)
-                # Find max. bitscore for each function
-                for hit in read.hit_list.hits:
-                    for hit_function in [
-                            function for function in hit.functions
-                            if function in read.functions
-                    ]:
-                        if hit_function in function_maxbitscores:
-                            if hit.bitscore > function_maxbitscores[hit_function]['bitscore']:
-                                function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                function_maxbitscores[hit_function]['identity'] = hit.identity
-                        else:
-                            function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                            function_maxbitscores[hit_function]['identity'] = hit.identity
-                # Count hits and calculate cumulative %identity
-                for function in read.functions:
-                    if function in function_maxbitscores:
-                        ret_val[function][sample]['hit_count'] += 1.0
-                        ret_val[function][sample]['identity'] += function_maxbitscores[
-                            function
-                            ]['identity']
-                    else:
-                        print('Function', function, 'not found in hits of read', read_id)
+            project.get_score_table(sample).add_function_scores(ret_val, metric)
 
         elif metric in ['fragmentcount', 'fpk', 'efpk', 'fpkg', 'fpkm', 'efpkg', 'efpkm']:
             if not project.samples[sample].is_paired_end:
                 raise ValueError('Metrics based on fragment count require paired-end sequences')
-            insert_size = project.get_insert_size(project.samples[sample])
-            reads_processed = set()
-
-            for read_id, read_pe1 in project.samples[sample].reads['pe1'].items():
-                if read_pe1.status != STATUS_GOOD:
-                    continue
-                reads_processed.add(read_id)
-
-                if 'pe2' in project.samples[sample].reads and (
-                        read_id in project.samples[sample].reads['pe2']
-                ):
-                    read_pe2 = project.samples[sample].reads['pe2'][read_id]
-                    if read_pe2.status == STATUS_GOOD:
-                        # Both ends are mapped
-
-                        fragment_functions = set()  # List of functions assigned to the current read
-                        read1_functions = read_pe1.functions
-                        read2_functions = read_pe2.functions
-
-                        fragment_functions.update(read1_functions.keys())
-                        fragment_functions.update(read2_functions.keys())
-
-                        function_maxbitscores = defaultdict(dict)
-                        hits1 = [hit for hit in read_pe1.hit_list.hits]
-                        hits2 = [hit for hit in read_pe2.hit_list.hits]
-                        # Find hit with max. bitscore for each function
-                        for hit in hits1:
-                            for hit_function in [
-                                    function for function in hit.functions
-                                    if function in fragment_functions
-                            ]:
-                                if hit_function in function_maxbitscores:
-                                    if hit.bitscore > function_maxbitscores[hit_function][
-                                            'bitscore'
-                                    ]:
-                                        function_maxbitscores[hit_function][
-                                            'bitscore'
-                                            ] = hit.bitscore
-                                        function_maxbitscores[hit_function][
-                                            'identity'
-                                            ] = hit.identity
-                                        function_maxbitscores[hit_function]['length'] = hit.s_len
-                                else:
-                                    function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                    function_maxbitscores[hit_function]['identity'] = hit.identity
-                                    function_maxbitscores[hit_function]['length'] = hit.s_len
-                        for hit in hits2:
-                            for hit_function in [
-                                    function for function in hit.functions
-                                    if function in fragment_functions
-                            ]:
-                                if hit_function in function_maxbitscores:
-                                    if hit.bitscore > function_maxbitscores[hit_function][
-                                            'bitscore'
-                                    ]:
-                                        function_maxbitscores[hit_function][
-                                            'bitscore'
-                                            ] = hit.bitscore
-                                        function_maxbitscores[hit_function][
-                                            'identity'
-                                            ] = hit.identity
-                                        function_maxbitscores[hit_function]['length'] = hit.s_len
-                                else:
-                                    function_maxbitscores[hit_function][
-                                        'bitscore'
-                                        ] = hit.bitscore
-                                    function_maxbitscores[hit_function][
-                                        'identity'
-                                        ] = hit.identity
-                                    function_maxbitscores[hit_function]['length'] = hit.s_len
-                        # Count hits and calculate cumulative %identity
-                        for function in fragment_functions:
-                            ret_val[function][sample]['count'] += 1
-                            if function in function_maxbitscores:
-                                ret_val[function][sample]['hit_count'] += 1.0
-                                ret_val[function][sample][
-                                    'identity'
-                                    ] += function_maxbitscores[function]['identity']
-                                if metric == 'fragmentcount':
-                                    ret_val[function][sample][metric] += 1
-                                elif metric in ['fpk', 'fpkg', 'fpkm']:
-                                    ret_val[function][sample][
-                                        metric
-                                        ] += norm_factor * get_fpk_score(
-                                            function_maxbitscores[function]['length']
-                                            )
-                                else:
-                                    ret_val[function][sample][
-                                        metric
-                                        ] += norm_factor * get_efpk_score(
-                                            function_maxbitscores[function]['length'],
-                                            average_read_length,
-                                            length_cutoff,
-                                            insert_size=insert_size
-                                            )
-                            else:
-                                print('Function', function, 'not found in hits of read', read_id)
-
-                else:  # Only end1 is mapped
-                    read_functions = read_pe1.functions
-                    fragment_functions = set(read_functions.keys())
-                    # Count FPKM
-                    # for function in fragment_functions:
-                    #     ret_val[function][s]['count'] += 1
-                    #     ret_val[function][s][metric] += norm_factor * read_functions[function]
-
-                    function_maxbitscores = defaultdict(dict)
-                    hits1 = [hit for hit in read_pe1.hit_list.hits]
-
-                    # Find max. bitscore for each function
-                    for hit in hits1:
-                        for hit_function in [
-                                function for function in hit.functions
-                                if function in fragment_functions
-                        ]:
-                            if hit_function in function_maxbitscores:
-                                if hit.bitscore > function_maxbitscores[hit_function]['bitscore']:
-                                    function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                    function_maxbitscores[hit_function]['identity'] = hit.identity
-                                    function_maxbitscores[hit_function]['length'] = hit.s_len
-                            else:
-                                function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                function_maxbitscores[hit_function]['identity'] = hit.identity
-                                function_maxbitscores[hit_function]['length'] = hit.s_len
-                    # Count hits and calculate cumulative identity
-                    for function in fragment_functions:
-                        ret_val[function][sample]['count'] += 1
-                        if function in function_maxbitscores:
-                            ret_val[function][sample]['hit_count'] += 1.0
-                            ret_val[function][sample][
-                                'identity'
-                                ] += function_maxbitscores[function]['identity']
-                            if metric == 'fragmentcount':
-                                ret_val[function][sample][metric] += 1
-                            elif metric in ['fpk', 'fpkg', 'fpkm']:
-                                ret_val[function][sample][metric] += norm_factor * get_fpk_score(
-                                    function_maxbitscores[function]['length']
-                                    )
-                            else:
-                                ret_val[function][sample][metric] += norm_factor * get_efpk_score(
-                                    function_maxbitscores[function]['length'], average_read_length,
-                                    length_cutoff, insert_size=insert_size
-                                    )
-                        else:
-                            print('Function', function, 'not found in hits of read', read_id)
-
-            for read_id, read_pe2 in project.samples[sample].reads['pe2'].items():
-                if read_id in reads_processed:
-                    continue  # Skip read if it was already counted
-                if read_pe2.status != STATUS_GOOD:
-                    continue
-
-                fragment_functions = set()
-                read_functions = read_pe2.functions
-                fragment_functions.update(read_functions.keys())
-
-                function_maxbitscores = defaultdict(dict)
-                hits = [hit for hit in read_pe2.hit_list.hits]
-                # Find max. bitscore for each function
-                for hit in hits:
-                    for hit_function in [
-                            function for function in hit.functions
-                            if function in fragment_functions
-                    ]:
-                        if hit_function in function_maxbitscores:
-                            if hit.bitscore > function_maxbitscores[hit_function]['bitscore']:
-                                function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                function_maxbitscores[hit_function]['identity'] = hit.identity
-                                function_maxbitscores[hit_function]['length'] = hit.s_len
-                        else:
-                            function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                            function_maxbitscores[hit_function]['identity'] = hit.identity
-                            function_maxbitscores[hit_function]['length'] = hit.s_len
-
-                # Count hits and calculate cumulative identity
-                for function in fragment_functions:
-                    ret_val[function][sample]['count'] += 1
-                    if function in function_maxbitscores:
-                        ret_val[function][sample]['hit_count'] += 1.0
-                        ret_val[function][sample]['identity'] += function_maxbitscores[function][
-                            'identity'
-                            ]
-                        if metric == 'fragmentcount':
-                            ret_val[function][sample][metric] += 1
-                        elif metric in ['fpk', 'fpkg', 'fpkm']:
-                            ret_val[function][sample][metric] += norm_factor * get_fpk_score(
-                                function_maxbitscores[function]['length']
-                                )
-                        else:
-                            ret_val[function][sample][metric] += norm_factor * get_efpk_score(
-                                function_maxbitscores[function]['length'], average_read_length,
-                                length_cutoff, insert_size=insert_size
-                                )
-                    else:
-                        print('Function', function, 'not found in hits of read', read_id)
+            project.get_score_table(sample).add_function_scores(ret_val, metric)
     return ret_val
 
 
@@ -719,17 +492,22 @@ def get_function_taxonomy_scores(project, sample_id=None, metric=None):
     'hit_count' key. Cumulative identity % is additive, i.e. you can
     calculate average identity % for a group of function by summing up
     their cumulative identity % values and divide by total number of hits.
+
+    Note 3: scores of all metrics are calculated once per sample and cached
+    in the project (see Project.get_score_table).
     """
     ret_val = autovivify(4, float)
     for sample in project.list_samples():
         if sample_id is not None and sample != sample_id:
             continue
 
-        # Check if reads were processed or imported for this sample
-        if project.samples[sample].reads is None or 'pe1' not in project.samples[sample].reads:
+        # Check if reads were processed or imported for this sample.
+        # If no reads were loaded, saved scores or reads JSON are used.
+        sample_reads = project.samples[sample].reads
+        if sample_reads is None or (sample_reads and 'pe1' not in sample_reads):
             raise ValueError('No reads data loaded for sample' + sample + 'end pe1')
         if project.samples[sample].is_paired_end:
-            if 'pe2' not in project.samples[sample].reads:
+            if sample_reads and 'pe2' not in sample_reads:
                 raise ValueError('No reads data loaded for sample' + sample + 'end pe2')
 
         norm_factor = 0.0
@@ -747,252 +525,12 @@ def get_function_taxonomy_scores(project, sample_id=None, metric=None):
         if metric in ['readcount', 'rpkg', 'rpkm', 'erpk', 'erpkg', 'erpkm', 'proteincount']:
             if project.samples[sample].is_paired_end:
                 raise ValueError('No Read count, RPKG and RPKM metrics for paired-end input')
-
-            for read_id, read in project.samples[sample].reads['pe1'].items():
-                if read.status != STATUS_GOOD:  # Filter unmapped reads
-                    continue
-                read_erpk_scores = read.functions
-                for function in read_erpk_scores:
-                    ret_val[read.taxonomy][function][sample]['count'] += 1.0
-                    if metric == 'readcount' or metric == 'proteincount':
-                        ret_val[read.taxonomy][function][sample][metric] += 1
-                    else:
-                        ret_val[read.taxonomy][function][sample][
-                            metric
-                            ] += norm_factor * read_erpk_scores[function]
-
-                function_maxbitscores = {}
-                hits = [hit for hit in read.hit_list.hits]
-                # Find max. bitscore for each function
-                for hit in hits:
-                    for hit_function in [
-                            function for function in hit.functions
-                            if function in read.functions
-                    ]:
-                        if hit_function in function_maxbitscores:
-                            if hit.bitscore > function_maxbitscores[hit_function]:
-                                function_maxbitscores[hit_function] = hit.bitscore
-                        else:
-                            function_maxbitscores[hit_function] = hit.bitscore
-                # Count hits and calculate cumulative identity
-                for hit in hits:
-                    for hit_function in [
-                            function for function in hit.functions
-                            if function in read.functions
-                    ]:
-                        if hit_function in function_maxbitscores and (
-                                hit.bitscore == function_maxbitscores[hit_function]
-                        ):
-                            ret_val[read.taxonomy][function][sample]['hit_count'] += 1.0
-                            ret_val[read.taxonomy][function][sample]['identity'] += hit.identity
-                            del function_maxbitscores[hit_function]
+            project.get_score_table(sample).add_function_taxonomy_scores(ret_val, metric)
 
         elif metric in ['fragmentcount', 'fpk', 'efpk', 'fpkg', 'fpkm', 'efpkg', 'efpkm']:
             if not project.samples[sample].is_paired_end:
                 raise ValueError('FPKG and FPKM metric require paired-end sequences')
-            insert_size = project.get_insert_size(project.samples[sample])
-            reads_processed = set()
-            length_cutoff = project.config.get_length_cutoff(project.options.get_collection(sample))
-            average_read_length = project.samples[sample].get_avg_read_length('pe1')
-
-            for read_id in project.samples[sample].reads['pe1'].keys():
-                read_pe1 = project.samples[sample].reads['pe1'][read_id]
-                if read_pe1.status != STATUS_GOOD:
-                    continue
-                reads_processed.add(read_id)
-
-                if 'pe2' in project.samples[sample].reads and (
-                        read_id in project.samples[sample].reads['pe2']
-                ):
-                    read_pe2 = project.samples[sample].reads['pe2'][read_id]
-                    if read_pe2.status == STATUS_GOOD:
-                        # Both ends are mapped
-                        fragment_taxonomy = project.taxonomy_data.get_lca(
-                            [read_pe1.taxonomy, read_pe2.taxonomy]
-                            )
-
-                        fragment_functions = set()
-                        read1_functions = read_pe1.functions
-                        read2_functions = read_pe2.functions
-
-                        fragment_functions.update(read1_functions.keys())
-                        fragment_functions.update(read2_functions.keys())
-
-                        function_maxbitscores = defaultdict(dict)
-                        hits1 = [hit for hit in read_pe1.hit_list.hits]
-                        hits2 = [hit for hit in read_pe2.hit_list.hits]
-                        # Find max. bitscore for each function
-                        for hit in hits1:
-                            for hit_function in [
-                                    function for function in hit.functions
-                                    if function in fragment_functions
-                            ]:
-                                if hit_function in function_maxbitscores:
-                                    if hit.bitscore > function_maxbitscores[hit_function][
-                                            'bitscore'
-                                    ]:
-                                        function_maxbitscores[hit_function][
-                                            'bitscore'
-                                            ] = hit.bitscore
-                                        function_maxbitscores[hit_function][
-                                            'identity'
-                                            ] = hit.identity
-                                        function_maxbitscores[hit_function]['length'] = hit.s_len
-                                else:
-                                    function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                    function_maxbitscores[hit_function]['identity'] = hit.identity
-                                    function_maxbitscores[hit_function]['length'] = hit.s_len
-                        for hit in hits2:
-                            for hit_function in [
-                                    function for function in hit.functions
-                                    if function in fragment_functions
-                            ]:
-                                if hit_function in function_maxbitscores:
-                                    if hit.bitscore > function_maxbitscores[hit_function][
-                                            'bitscore'
-                                    ]:
-                                        function_maxbitscores[hit_function][
-                                            'bitscore'
-                                            ] = hit.bitscore
-                                        function_maxbitscores[hit_function][
-                                            'identity'
-                                            ] = hit.identity
-                                        function_maxbitscores[hit_function]['length'] = hit.s_len
-                                else:
-                                    function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                    function_maxbitscores[hit_function]['identity'] = hit.identity
-                                    function_maxbitscores[hit_function]['length'] = hit.s_len
-                        # Count hits and calculate cumulative identity of top hits for each function
-                        for function in fragment_functions:
-                            if function in function_maxbitscores:
-                                ret_val[fragment_taxonomy][function][sample]['count'] += 1
-                                ret_val[fragment_taxonomy][function][sample]['hit_count'] += 1.0
-                                ret_val[fragment_taxonomy][function][sample][
-                                    'identity'
-                                    ] += function_maxbitscores[function]['identity']
-                                if metric == 'fragmentcount':
-                                    ret_val[fragment_taxonomy][function][sample][metric] += 1
-                                elif metric in ['fpk', 'fpkg', 'fpkm']:
-                                    ret_val[fragment_taxonomy][function][sample][
-                                        metric
-                                        ] += norm_factor * get_fpk_score(
-                                            function_maxbitscores[function]['length']
-                                            )
-                                else:
-                                    ret_val[fragment_taxonomy][function][sample][
-                                        metric
-                                        ] += norm_factor * get_efpk_score(
-                                            function_maxbitscores[function]['length'],
-                                            average_read_length, length_cutoff,
-                                            insert_size=insert_size
-                                            )
-                            else:
-                                print('Function', function, 'not found in hits of read', read_id)
-
-                else:  # Only end1 is mapped
-                    fragment_taxonomy = read_pe1.taxonomy
-                    read_functions = read_pe1.functions
-                    fragment_functions = set(read_functions.keys())
-                    function_maxbitscores = defaultdict(dict)
-                    hits1 = [hit for hit in read_pe1.hit_list.hits]
-                    # Find max. bitscore for each function
-                    for hit in hits1:
-                        for hit_function in [
-                                function for function in hit.functions
-                                if function in fragment_functions
-                        ]:
-                            if hit_function in function_maxbitscores:
-                                if hit.bitscore > function_maxbitscores[hit_function]['bitscore']:
-                                    function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                    function_maxbitscores[hit_function]['identity'] = hit.identity
-                                    function_maxbitscores[hit_function]['length'] = hit.s_len
-                            else:
-                                function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                function_maxbitscores[hit_function]['identity'] = hit.identity
-                                function_maxbitscores[hit_function]['length'] = hit.s_len
-                    # Count hits and calculate cumulative identity of top hit for each function
-                    for function in fragment_functions:
-                        if function in function_maxbitscores:
-                            ret_val[fragment_taxonomy][function][sample]['count'] += 1
-                            ret_val[fragment_taxonomy][function][sample]['hit_count'] += 1.0
-                            ret_val[fragment_taxonomy][function][sample][
-                                'identity'
-                                ] += function_maxbitscores[function]['identity']
-                            if metric == 'fragmentcount':
-                                ret_val[fragment_taxonomy][function][sample][metric] += 1
-                            elif metric in ['fpk', 'fpkg', 'fpkm']:
-                                ret_val[fragment_taxonomy][function][sample][
-                                    metric
-                                ] += norm_factor * get_fpk_score(
-                                    function_maxbitscores[function]['length']
-                                )
-                            else:
-                                ret_val[fragment_taxonomy][function][sample][
-                                    metric
-                                ] += norm_factor * get_efpk_score(
-                                    function_maxbitscores[function]['length'],
-                                    average_read_length, length_cutoff,
-                                    insert_size=insert_size
-                                )
-                        else:
-                            print('Function', function, 'not found in hits of read', read_id)
-
-            for read_id in project.samples[sample].reads['pe2'].keys():
-                if read_id in reads_processed:
-                    continue  # Skip read if it was already counted
-
-                read_pe2 = project.samples[sample].reads['pe2'][read_id]
-                if read_pe2.status != STATUS_GOOD:
-                    continue
-
-                fragment_functions = set()
-                fragment_taxonomy = read_pe2.taxonomy
-                read_functions = read_pe2.functions
-                fragment_functions.update(read_functions.keys())
-
-                # Build FPKM-based functional taxonomic profile
-                function_maxbitscores = defaultdict(dict)
-                hits = [hit for hit in read_pe2.hit_list.hits]
-                # Find max. bitscore for each function
-                for hit in hits:
-                    for hit_function in [
-                            function for function in hit.functions
-                            if function in fragment_functions
-                    ]:
-                        if hit_function in function_maxbitscores:
-                            if hit.bitscore > function_maxbitscores[hit_function]['bitscore']:
-                                function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                                function_maxbitscores[hit_function]['identity'] = hit.identity
-                                function_maxbitscores[hit_function]['length'] = hit.s_len
-                        else:
-                            function_maxbitscores[hit_function]['bitscore'] = hit.bitscore
-                            function_maxbitscores[hit_function]['identity'] = hit.identity
-                            function_maxbitscores[hit_function]['length'] = hit.s_len
-                # Count hits and calculate cumulative %identity of top hits for each function
-                for function in fragment_functions:
-                    if function in function_maxbitscores:
-                        ret_val[fragment_taxonomy][function][sample]['count'] += 1
-                        ret_val[fragment_taxonomy][function][sample]['hit_count'] += 1.0
-                        ret_val[fragment_taxonomy][function][sample][
-                            'identity'
-                        ] += function_maxbitscores[function]['identity']
-                        if metric == 'fragmentcount':
-                            ret_val[fragment_taxonomy][function][sample][metric] += 1
-                        elif metric in ['fpk', 'fpkg', 'fpkm']:
-                            ret_val[fragment_taxonomy][function][sample][
-                                metric
-                                ] += norm_factor * get_fpk_score(
-                                    function_maxbitscores[function]['length']
-                                    )
-                        else:
-                            ret_val[fragment_taxonomy][function][sample][
-                                metric] += norm_factor * get_efpk_score(
-                                    function_maxbitscores[function]['length'],
-                                    average_read_length, length_cutoff,
-                                    insert_size=insert_size
-                                    )
-                    else:
-                        print('Function', function, 'not found in hits of read', read_id)
+            project.get_score_table(sample).add_function_taxonomy_scores(ret_val, metric)
     return ret_val
 
 
@@ -1217,10 +755,9 @@ def generate_project_report(project, metric=None):
                 print('Project contains both single-end and paired-end sequences.',
                       'No comparative tables will be generated.')
                 return
-
-        # If there are no read data, try to load them from JSON
-        if not project.samples[sample_id].reads:
-            project.import_reads_json(sample_id, project.ENDS)
+    # Scores of samples without read data are loaded from files saved by
+    # Project.export_score_table, or calculated from reads loaded for one
+    # sample at a time if there are no saved scores
     print('Generating spreadsheets and interactive diagrams for the project...')
 
     if metric is None:
@@ -1256,36 +793,35 @@ def generate_protein_project_report(project):
     Args:
         project (:obj:'Project'): Project object that stores all annotated reads
     """
-    for sample_id in project.list_samples():
-        # If there are no read data, try to load them from JSON
-        if not project.samples[sample_id].reads:
-            project.import_reads_json(sample_id, project.ENDS)
     print('Generating spreadsheets and interactive diagrams for the project...')
     outfile = os.path.join(project.options.work_dir, 'project_report.txt')
     with open(outfile, 'w') as out_f:
         out_f.write(project.options.project_name + '\n\n')
         for sample_id in project.list_samples():
+            read_counts = project.get_score_table(sample_id).read_counts
             out_f.write(
                 sample_id + ':\t' + project.samples[sample_id].sample_name
-                + '\tproteins mapped: ' + str(len(project.samples[sample_id].reads['pe1']))
+                + '\tproteins mapped: ' + str(read_counts.get('pe1', 0))
                 )
             out_f.write('\n')
         out_f.write('\nList of mapped proteins\n')
 
         for sample_id in project.list_samples():
-            for protein_id in sorted(project.samples[sample_id].reads['pe1'].keys()):
-                protein = project.samples[sample_id].reads['pe1'][protein_id]
-                if protein.status == STATUS_BAD:
-                    continue
-                for hit in protein.hit_list.hits:
-                    out_f.write(
-                        '\t'.join([
-                            sample_id,
-                            protein_id,
-                            project.taxonomy_data.data[protein.taxonomy]['name'],
-                            str(hit)
-                            ]) + '\n'
-                        )
+            # Reads not in memory are loaded for one sample at a time
+            with project.sample_reads(sample_id, ['pe1']) as sample_reads:
+                for protein_id in sorted(sample_reads['pe1'].keys()):
+                    protein = sample_reads['pe1'][protein_id]
+                    if protein.status == STATUS_BAD:
+                        continue
+                    for hit in protein.hit_list.hits:
+                        out_f.write(
+                            '\t'.join([
+                                sample_id,
+                                protein_id,
+                                project.taxonomy_data.data[protein.taxonomy]['name'],
+                                str(hit)
+                                ]) + '\n'
+                            )
     metric = 'proteincount'
     scores = get_function_scores(project, sample_id=None, metric=metric)
     make_function_sample_xlsx(project, scores, metric=metric)
@@ -0,0 +1,494 @@
+"""Describes ScoreTable class, which stores annotated reads of a sample
+as columns of NumPy arrays for calculation of function scores"""
+import os
+import json
+import numpy as np
+
+from fama.utils.const import STATUS_GOOD
+
+# Base score and normalization factor of metrics for single-end sequences
+SE_METRICS = {
+    'readcount': ('count', None),
+    'proteincount': ('count', None),
+    'erpk': ('erpk', None),
+    'rpkm': ('erpk', 'rpkm'),
+    'erpkm': ('erpk', 'rpkm'),
+    'rpkg': ('erpk', 'rpkg'),
+    'erpkg': ('erpk', 'rpkg')
+}
+# Base score and normalization factor of metrics for paired-end sequences
+PE_METRICS = {
+    'fragmentcount': ('count', None),
+    'fpk': ('fpk', None),
+    'fpkm': ('fpk', 'rpkm'),
+    'fpkg': ('fpk', 'rpkg'),
+    'efpk': ('efpk', None),
+    'efpkm': ('efpk', 'rpkm'),
+    'efpkg': ('efpk', 'rpkg')
+}
+
+
+class ScoreTable(object):
+    """ScoreTable is a columnar representation of annotated reads of a
+    sample. Each row is a function assigned to a read (for single-end
+    sequences) or to a fragment (for paired-end sequences). For each row,
+    the table stores the hit with maximal bitscore among hits of the read
+    or fragment having the row function. If several hits have the same
+    bitscore, the first one is used.
+
+    Rows are stored in the order reads are processed by score
+    calculation, so that grouped sums are calculated in the same order
+    as sums of individual read scores.
+
+    Raw counts are calculated when reads are imported. Scores for all
+    metrics are calculated at once by calculate_scores. Aggregated
+    scores can be saved into a file and loaded without reads.
+
+    Attributes:
+        sample_id (str): sample identifier
+        is_paired_end (bool): True if rows are functions of fragments,
+            False if rows are functions of reads
+        functions (list of str): function identifiers in order of first occurrence
+        taxonomies (list of str): taxonomy identifiers in order of first occurrence
+        read_counts (dict[str, int]): number of annotated reads for each end
+        reads_signature (tuple): identifies reads the table was built
+            from, or None if the table was loaded from file
+        reads_files (list of list): end identifier, size and modification
+            time of each file of annotated reads the saved scores were
+            calculated from, or None if unknown
+        read_ids (list of str): read identifiers of all reads or fragments
+        row_function (:obj:np.ndarray): index of function in functions list
+        row_taxonomy (:obj:np.ndarray): index of read or fragment taxonomy
+            in taxonomies list
+        row_read (:obj:np.ndarray): index of read or fragment in read_ids list
+        row_score (:obj:np.ndarray): score of the function assigned to
+            single-end read
+        row_last_function (:obj:np.ndarray): index of the last function
+            assigned to single-end read
+        row_found (:obj:np.ndarray): True if any hit has the row function
+        row_identity (:obj:np.ndarray): amino acid % identity of best hit
+        row_length (:obj:np.ndarray): reference protein length of best hit
+        row_hit_order (:obj:np.ndarray): position of best hit among hits
+            of all reads, for summation in the order of hits
+        groups (:obj:np.ndarray): (taxonomy index, function index) pairs
+            in order of first occurrence
+        function_scores (dict[str, :obj:np.ndarray]): 'count',
+            'hit_count', 'identity' and metric scores for each function
+        function_taxonomy_scores (dict[str, :obj:np.ndarray]): 'count',
+            'hit_count', 'identity' and metric scores for each
+            (taxonomy, function) pair in groups
+        parameters (tuple): parameters of last calculate_scores call
+    """
+
+    def __init__(self, sample_id=None, is_paired_end=False):
+        """Args:
+            sample_id (str): sample identifier
+            is_paired_end (bool): True for paired-end sample
+        """
+        self.sample_id = sample_id
+        self.is_paired_end = is_paired_end
+        self.functions = []
+        self.taxonomies = []
+        self.read_counts = {}
+        self.reads_signature = None
+        self.reads_files = None
+        self.read_ids = []
+        self.row_function = None
+        self.groups = np.zeros((0, 2), dtype=np.int64)
+        self.function_scores = {}
+        self.function_taxonomy_scores = {}
+        self.parameters = None
+        self._function_index = {}
+        self._taxonomy_index = {}
+        self._rows = {'function': [], 'taxonomy': [], 'read': [], 'score': [],
+                      'last_function': []}
+        self._hits = {'row': [], 'bitscore': [], 'identity': [], 'length': []}
+
+    def import_reads(self, project):
+        """Builds table from annotated reads of the sample
+
+        Args:
+            project (:obj:'Project'): Project object that stores all annotated reads
+        """
+        sample = project.samples[self.sample_id]
+        self.read_counts = {end: len(reads) for end, reads in sample.reads.items()
+                            if reads is not None}
+        if self.is_paired_end:
+            self._add_fragments(project, sample)
+        else:
+            for read_id, read in sample.reads['pe1'].items():
+                if read.status == STATUS_GOOD:
+                    self._add_read(read_id, read)
+        self._build_columns()
+
+    def _get_function_index(self, function):
+        """Returns index of function in functions list"""
+        try:
+            return self._function_index[function]
+        except KeyError:
+            self._function_index[function] = len(self.functions)
+            self.functions.append(function)
+            return self._function_index[function]
+
+    def _get_taxonomy_index(self, taxonomy):
+        """Returns index of taxonomy identifier in taxonomies list"""
+        try:
+            return self._taxonomy_index[taxonomy]
+        except KeyError:
+            self._taxonomy_index[taxonomy] = len(self.taxonomies)
+            self.taxonomies.append(taxonomy)
+            return self._taxonomy_index[taxonomy]
+
+    def _add_rows(self, read_id, functions, taxonomy, hits, scores=None):
+        """Adds rows for all functions of a read or fragment and hits
+        having those functions
+
+        Args:
+            read_id (str): read identifier
+            functions (iterable of str): functions of read or fragment
+            taxonomy (str): taxonomy identifier of read or fragment
+            hits (list of :obj:DiamondHit): hits of read or fragment
+            scores (dict[str, float], optional): function scores of single-end read
+        """
+        rows = self._rows
+        read_index = len(self.read_ids)
+        self.read_ids.append(read_id)
+        taxonomy_index = self._get_taxonomy_index(taxonomy)
+        function_rows = {}
+        for function in functions:
+            function_rows[function] = len(rows['function'])
+            rows['function'].append(self._get_function_index(function))
+            rows['taxonomy'].append(taxonomy_index)
+            rows['read'].append(read_index)
+            rows['score'].append(scores[function] if scores is not None else 0.0)
+        if function_rows:
+            last_function = rows['function'][-1]
+            rows['last_function'].extend([last_function] * len(function_rows))
+        hit_columns = self._hits
+        for hit in hits:
+            for function in hit.functions:
+                if function in function_rows:
+                    hit_columns['row'].append(function_rows[function])
+                    hit_columns['bitscore'].append(hit.bitscore)
+                    hit_columns['identity'].append(hit.identity)
+                    hit_columns['length'].append(hit.s_len)
+
+    def _add_read(self, read_id, read):
+        """Adds rows for single-end read"""
+        self._add_rows(read_id, read.functions, read.taxonomy, read.hit_list.hits,
+                       read.functions)
+
+    def _add_fragments(self, project, sample):
+        """Adds rows for all fragments of paired-end sample"""
+        lca_cache = {}
+        reads_processed = set()
+        for read_id, read_pe1 in sample.reads['pe1'].items():
+            if read_pe1.status != STATUS_GOOD:
+                continue
+            reads_processed.add(read_id)
+            read_pe2 = sample.reads['pe2'].get(read_id)
+            if read_pe2 is not None:
+                if read_pe2.status != STATUS_GOOD:
+                    # Fragments with unmapped end2 are not counted
+                    continue
+                # Both ends are mapped
+                taxonomy_pair = (read_pe1.taxonomy, read_pe2.taxonomy)
+                if taxonomy_pair not in lca_cache:
+                    lca_cache[taxonomy_pair] = project.taxonomy_data.get_lca(
+                        list(taxonomy_pair)
+                    )
+                fragment_functions = set()
+                fragment_functions.update(read_pe1.functions.keys())
+                fragment_functions.update(read_pe2.functions.keys())
+                self._add_rows(read_id, fragment_functions, lca_cache[taxonomy_pair],
+                               read_pe1.hit_list.hits + read_pe2.hit_list.hits)
+            else:
+                # Only end1 is mapped
+                self._add_rows(read_id, set(read_pe1.functions.keys()), read_pe1.taxonomy,
+                               read_pe1.hit_list.hits)
+        for read_id, read_pe2 in sample.reads['pe2'].items():
+            if read_id in reads_processed or read_pe2.status != STATUS_GOOD:
+                continue
+            self._add_rows(read_id, set(read_pe2.functions.keys()), read_pe2.taxonomy,
+                           read_pe2.hit_list.hits)
+
+    def _build_columns(self):
+        """Converts lists of values to arrays, finds best hit for each row
+        and calculates raw counts of functions and taxa"""
+        rows = self._rows
+        self.row_function = np.array(rows['function'], dtype=np.int64)
+        self.row_taxonomy = np.array(rows['taxonomy'], dtype=np.int64)
+        self.row_read = np.array(rows['read'], dtype=np.int64)
+        self.row_score = np.array(rows['score'], dtype=np.float64)
+        self.row_last_function = np.array(rows['last_function'], dtype=np.int64)
+        row_count = len(self.row_function)
+        hit_row = np.array(self._hits['row'], dtype=np.int64)
+        hit_bitscore = np.array(self._hits['bitscore'], dtype=np.float64)
+        # sort hits by row, then by descending bitscore, then by position
+        order = np.lexsort((np.arange(len(hit_row)), -hit_bitscore, hit_row))
+        sorted_rows = hit_row[order]
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = sorted_rows[1:] != sorted_rows[:-1]
+        best_hits = order[is_first]
+        best_rows = hit_row[best_hits]
+        self.row_found = np.zeros(row_count, dtype=bool)
+        self.row_found[best_rows] = True
+        self.row_identity = np.zeros(row_count, dtype=np.float64)
+        self.row_identity[best_rows] = np.array(self._hits['identity'],
+                                                dtype=np.float64)[best_hits]
+        self.row_length = np.zeros(row_count, dtype=np.int64)
+        self.row_length[best_rows] = np.array(self._hits['length'], dtype=np.int64)[best_hits]
+        self.row_hit_order = np.zeros(row_count, dtype=np.int64)
+        self.row_hit_order[best_rows] = best_hits
+        self._rows = None
+        self._hits = None
+        self._function_index = None
+        self._taxonomy_index = None
+        self._build_function_counts()
+        self._build_function_taxonomy_counts()
+        for row in np.flatnonzero(~self.row_found):
+            print('Function', self.functions[self.row_function[row]],
+                  'not found in hits of read', self.read_ids[self.row_read[row]])
+
+    def _build_function_counts(self):
+        """Calculates read count, hit count and cumulative identity for
+        each function"""
+        function_count = len(self.functions)
+        found = self.row_found
+        if self.is_paired_end:
+            # Only rows with hits have scores
+            self._function_rows = np.flatnonzero(found)
+        else:
+            self._function_rows = np.arange(len(self.row_function))
+        self.function_scores = {
+            'count': np.bincount(self.row_function,
+                                 minlength=function_count).astype(np.float64),
+            'hit_count': np.bincount(self.row_function[found],
+                                     minlength=function_count).astype(np.float64),
+            'identity': np.bincount(self.row_function[found], weights=self.row_identity[found],
+                                    minlength=function_count)
+        }
+
+    def _build_function_taxonomy_counts(self):
+        """Calculates read count, hit count and cumulative identity for
+        each pair of taxon and function"""
+        function_count = len(self.functions)
+        row_pair = self.row_taxonomy * function_count + self.row_function
+        found = self.row_found
+        if self.is_paired_end:
+            # Only rows with hits are counted
+            rows = np.flatnonzero(found)
+            hit_rows = rows
+            hit_pairs = row_pair[rows]
+        else:
+            rows = np.arange(len(row_pair))
+            # Hits of all functions of a read are counted for the last
+            # function of the read, in the order of hits
+            hit_rows = np.flatnonzero(found)
+            hit_rows = hit_rows[np.argsort(self.row_hit_order[hit_rows], kind='stable')]
+            hit_pairs = self.row_taxonomy[hit_rows] * function_count \
+                + self.row_last_function[hit_rows]
+        # Number pairs in order of first occurrence
+        pairs, first_rows, pair_index = np.unique(row_pair[rows], return_index=True,
+                                                  return_inverse=True)
+        pair_order = np.argsort(first_rows, kind='stable')
+        pair_group = np.empty(len(pairs), dtype=np.int64)
+        pair_group[pair_order] = np.arange(len(pairs))
+        self.groups = np.column_stack(np.divmod(pairs[pair_order], max(function_count, 1)))
+        self._group_rows = rows
+        self._row_group = np.zeros(len(row_pair), dtype=np.int64)
+        self._row_group[rows] = pair_group[pair_index.reshape(-1)]
+        hit_groups = pair_group[np.searchsorted(pairs, hit_pairs)]
+        group_count = len(pairs)
+        groups = self._row_group[rows]
+        self.function_taxonomy_scores = {
+            'count': np.bincount(groups, minlength=group_count).astype(np.float64),
+            'hit_count': np.bincount(hit_groups, minlength=group_count).astype(np.float64),
+            'identity': np.bincount(hit_groups, weights=self.row_identity[hit_rows],
+                                    minlength=group_count)
+        }
+
+    def calculate_scores(self, rpkm_scaling_factor, rpkg_scaling_factor,
+                         average_read_length=None, length_cutoff=None, insert_size=None):
+        """Calculates scores of functions and pairs of taxon and function
+        for all metrics supported by the sample in one pass. Metrics
+        with zero normalization factor are skipped. Scores are not
+        recalculated if the parameters did not change.
+
+        Args:
+            rpkm_scaling_factor (float): normalization factor for *pkm metrics
+            rpkg_scaling_factor (float): normalization factor for *pkg metrics
+            average_read_length (float): average read length for efpk
+                metrics (see get_efpk_score)
+            length_cutoff (int): minimal alignment length for efpk metrics
+            insert_size (float): average insert size for efpk metrics
+
+        Raises:
+            ValueError if parameters changed, but table was loaded without reads
+        """
+        parameters = (rpkm_scaling_factor, rpkg_scaling_factor, average_read_length,
+                      length_cutoff, insert_size)
+        if parameters == self.parameters:
+            return
+        if self.row_function is None:
+            raise ValueError('No reads data loaded for sample ' + self.sample_id)
+        self.parameters = parameters
+        norm_factors = {None: 1.0, 'rpkm': rpkm_scaling_factor, 'rpkg': rpkg_scaling_factor}
+        base_values = {'count': np.ones(len(self.row_function), dtype=np.float64)}
+        if self.is_paired_end:
+            metrics = PE_METRICS
+            base_values['fpk'] = self._get_fpk_values()
+            base_values['efpk'] = self._get_efpk_values(average_read_length, length_cutoff,
+                                                        insert_size)
+        else:
+            metrics = SE_METRICS
+            base_values['erpk'] = self.row_score
+        function_count = len(self.functions)
+        group_count = len(self.groups)
+        function_rows = self._function_rows
+        group_rows = self._group_rows
+        for metric, (base_score, normalization) in metrics.items():
+            norm_factor = norm_factors[normalization]
+            if not norm_factor:
+                self.function_scores.pop(metric, None)
+                self.function_taxonomy_scores.pop(metric, None)
+                continue
+            if base_score == 'count':
+                values = base_values[base_score]
+            else:
+                values = norm_factor * base_values[base_score]
+            self.function_scores[metric] = np.bincount(
+                self.row_function[function_rows], weights=values[function_rows],
+                minlength=function_count
+            )
+            self.function_taxonomy_scores[metric] = np.bincount(
+                self._row_group[group_rows], weights=values[group_rows],
+                minlength=group_count
+            )
+
+    def release_rows(self):
+        """Removes rows from the table, keeping aggregated scores. After
+        that, scores can not be calculated with other parameters."""
+        self.read_ids = []
+        self.row_function = None
+        for attr in ('row_taxonomy', 'row_read', 'row_score', 'row_last_function',
+                     'row_found', 'row_identity', 'row_length', 'row_hit_order',
+                     '_function_rows', '_group_rows', '_row_group'):
+            setattr(self, attr, None)
+
+    def _get_fpk_values(self):
+        """Returns FPK score of best hit for each row (see get_fpk_score)"""
+        # Protein length is 1 for rows without hits to avoid division by zero
+        length = np.where(self.row_found, self.row_length, 1)
+        return 1000/3/length
+
+    def _get_efpk_values(self, average_read_length, length_cutoff, insert_size):
+        """Returns EFPK score of best hit for each row (see get_efpk_score)"""
+        length = np.where(self.row_found, self.row_length, 1)
+        if insert_size is None:
+            effective_gene_length = 3*length - 6*length_cutoff + 2*average_read_length + 1
+        else:
+            effective_gene_length = np.where(
+                insert_size > 2*average_read_length + length,
+                2 * (3*length - 6*length_cutoff + average_read_length + 1),
+                3*length - 6*length_cutoff + insert_size + 1
+            )
+        effective_gene_length = np.asarray(effective_gene_length, dtype=np.float64)
+        result = np.full(len(length), 1000.0)
+        positive = effective_gene_length > 0
+        result[positive] = 1000/effective_gene_length[positive]
+        return result
+
+    def add_function_scores(self, scores, metric):
+        """Adds function scores for the sample to a three-level dictionary
+        (see get_function_scores)
+
+        Args:
+            scores (dict): three-level dictionary of function scores
+            metric (str): metric name
+        """
+        counts = self.function_scores['count']
+        hit_counts = self.function_scores['hit_count']
+        identity = self.function_scores['identity']
+        metric_values = self.function_scores[metric]
+        for index, function in enumerate(self.functions):
+            result = scores[function][self.sample_id]
+            result['count'] = counts[index].item()
+            if not self.is_paired_end:
+                result[metric] = metric_values[index].item()
+            if hit_counts[index]:
+                result['hit_count'] = hit_counts[index].item()
+                result['identity'] = identity[index].item()
+                if self.is_paired_end:
+                    result[metric] = metric_values[index].item()
+
+    def add_function_taxonomy_scores(self, scores, metric):
+        """Adds function scores for each taxon for the sample to a
+        four-level dictionary (see get_function_taxonomy_scores)
+
+        Args:
+            scores (dict): four-level dictionary of function scores
+            metric (str): metric name
+        """
+        counts = self.function_taxonomy_scores['count']
+        hit_counts = self.function_taxonomy_scores['hit_count']
+        identity = self.function_taxonomy_scores['identity']
+        metric_values = self.function_taxonomy_scores[metric]
+        for group, (taxonomy_index, function_index) in enumerate(self.groups.tolist()):
+            result = scores[self.taxonomies[taxonomy_index]][
+                self.functions[function_index]][self.sample_id]
+            result['count'] = counts[group].item()
+            if not self.is_paired_end:
+                result[metric] = metric_values[group].item()
+            if hit_counts[group]:
+                result['hit_count'] = hit_counts[group].item()
+                result['identity'] = identity[group].item()
+                if self.is_paired_end:
+                    result[metric] = metric_values[group].item()
+
+    def save(self, outfile):
+        """Writes aggregated scores into NumPy .npz file. Rows are not saved.
+
+        Args:
+            outfile (str): output file path
+        """
+        metadata = {'sample_id': self.sample_id,
+                    'is_paired_end': self.is_paired_end,
+                    'functions': self.functions,
+                    'taxonomies': self.taxonomies,
+                    'read_counts': self.read_counts,
+                    'reads_files': self.reads_files,
+                    'parameters': self.parameters}
+        arrays = {'metadata': np.array(json.dumps(metadata)), 'groups': self.groups}
+        for key, values in self.function_scores.items():
+            arrays['function:' + key] = values
+        for key, values in self.function_taxonomy_scores.items():
+            arrays['function_taxonomy:' + key] = values
+        temp_file = outfile + '.' + str(os.getpid()) + '.tmp.npz'
+        np.savez_compressed(temp_file, **arrays)
+        os.replace(temp_file, outfile)
+
+    def load(self, infile):
+        """Reads aggregated scores from NumPy .npz file written by save
+
+        Args:
+            infile (str): input file path
+        """
+        with np.load(infile, allow_pickle=False) as data:
+            metadata = json.loads(str(data['metadata']))
+            self.groups = data['groups']
+            for key in data.files:
+                if key.startswith('function:'):
+                    self.function_scores[key[len('function:'):]] = data[key]
+                elif key.startswith('function_taxonomy:'):
+                    self.function_taxonomy_scores[key[len('function_taxonomy:'):]] = data[key]
+        self.sample_id = metadata['sample_id']
+        self.is_paired_end = metadata['is_paired_end']
+        self.functions = metadata['functions']
+        self.taxonomies = metadata['taxonomies']
+        self.read_counts = metadata['read_counts']
+        self.reads_files = metadata.get('reads_files')
+        if metadata['parameters'] is not None:
+            self.parameters = tuple(metadata['parameters'])
+        self.reads_signature = None
+        self.row_function = None
@@ -1,7 +1,6 @@
 """Various functions for Excel table generation"""
 import os
 import xlsxwriter
-import pandas as pd
 
 from fama.utils.const import STATUS_GOOD
 from fama.utils.utils import autovivify, cleanup_protein_id, sanitize_file_name
@@ -167,7 +166,7 @@ def make_func_tax_sample_xlsx(project, scores, metric, sample_id=None, rank=None
             )
 
     print('Writing', xlsxfile)
-    writer = pd.ExcelWriter(xlsxfile, engine='xlsxwriter')
+    workbook = xlsxwriter.Workbook(xlsxfile, {'constant_memory': True})
 
     for sample in project.list_samples():
         if sample_id is not None and sample != sample_id:
@@ -185,37 +184,63 @@ def make_func_tax_sample_xlsx(project, scores, metric, sample_id=None, rank=None
         tax_profile.make_function_taxonomy_profile(project.taxonomy_data, sample_scores)
 
         if sample_id is None:
-            taxonomy_df = tax_profile.convert_profile_into_score_df(metric=metric)
+            rows = tax_profile.generate_score_rows(metric=metric)
         else:
-            taxonomy_df = tax_profile.convert_profile_into_df(metric=metric)
+            rows = tax_profile.generate_profile_rows(metric=metric)
 
         if len(sample) > 31:
             worksheet_label = sample[:31]
         else:
             worksheet_label = sample
 
-        if rank is None:
-            taxonomy_df.to_excel(writer, sheet_name=worksheet_label, merge_cells=False)
-        else:
-            filtered_df = taxonomy_df[taxonomy_df[('', 'Rank')] == rank]
-            filtered_df.to_excel(writer, sheet_name=worksheet_label, merge_cells=False)
+        write_taxonomy_worksheet(workbook, worksheet_label, rows, rank=rank)
+
+    workbook.close()
 
-        format_taxonomy_worksheet(writer, sample)
 
-    writer.save()
+def write_taxonomy_worksheet(workbook, worksheet_label, rows, rank=None):
+    """Writes functional-taxonomic profile into new worksheet of Excel
+    workbook. Rows are written one by one as they are generated, so the
+    workbook can be opened in constant_memory mode. The worksheet has the
+    same layout as pandas DataFrame of taxonomy profile exported by
+    to_excel with merge_cells=False.
+
+    Args:
+        workbook (xlsxwriter.Workbook): Workbook instance
+        worksheet_label (str): label of new worksheet
+        rows (iterable): line numbers and rows generated by
+            TaxonomyProfile.generate_profile_rows or
+            TaxonomyProfile.generate_score_rows
+        rank (str, optional): taxonomic rank. If rank parameter is not None,
+            only rows for this rank are written.
+    """
+    worksheet = workbook.add_worksheet(worksheet_label)
+    header_format = workbook.add_format({'bold': True, 'border': 1,
+                                         'align': 'center', 'valign': 'top'})
+    columns = None
+    row_index = 2
+    for line_number, row in rows:
+        if columns is None:
+            # Columns are in the same order as in DataFrame made from the rows
+            columns = list(row.keys())
+            for col, column in enumerate(columns, start=1):
+                worksheet.write(0, col, '.'.join(column), header_format)
+        if rank is not None and row[('', 'Rank')] != rank:
+            continue
+        worksheet.write(row_index, 0, line_number, header_format)
+        for col, column in enumerate(columns, start=1):
+            worksheet.write(row_index, col, row[column])
+        row_index += 1
+    format_taxonomy_worksheet(workbook, worksheet)
 
 
-def format_taxonomy_worksheet(xlsx_writer, worksheet_label):
+def format_taxonomy_worksheet(workbook, worksheet):
     """Applies formatting to a worksheet in Excel workbook
 
     Args:
-        xlsx_writer (xlsxwriter): xlsxwriter instance with existing Workbook
-        worksheet_label (str): labal of worksheet to format
+        workbook (xlsxwriter.Workbook): Workbook instance
+        worksheet (xlsxwriter.Worksheet): worksheet to format
     """
-    if len(worksheet_label) > 31:
-        worksheet_label = worksheet_label[:31]
-    workbook = xlsx_writer.book
-    worksheet = xlsx_writer.sheets[worksheet_label]
     superkingdom_format = workbook.add_format({'bg_color': '#FF6666'})
     phylum_format = workbook.add_format({'bg_color': '#FF9900'})
     class_format = workbook.add_format({'bg_color': '#FFCC99'})
@@ -296,7 +321,7 @@ def make_sample_tax_func_xlsx(project, scores, metric, function_id=None, rank=No
             )
 
     print('Writing', xlsxfile)
-    writer = pd.ExcelWriter(xlsxfile, engine='xlsxwriter')
+    workbook = xlsxwriter.Workbook(xlsxfile, {'constant_memory': True})
 
     for function in sorted(project.ref_data.functions_dict.keys()):
         if function_id is not None and function != function_id:
@@ -316,14 +341,8 @@ def make_sample_tax_func_xlsx(project, scores, metric, function_id=None, rank=No
         tax_profile = TaxonomyProfile()
         tax_profile.make_function_taxonomy_profile(project.taxonomy_data, sample_scores)
 
-        taxonomy_df = tax_profile.convert_profile_into_score_df(metric=metric)
-
-        if rank is None:
-            taxonomy_df.to_excel(writer, sheet_name=function, merge_cells=False)
-        else:
-            filtered_df = taxonomy_df[taxonomy_df[('', 'Rank')] == rank]
-            filtered_df.to_excel(writer, sheet_name=function, merge_cells=False)
-        format_taxonomy_worksheet(writer, function)
+        write_taxonomy_worksheet(workbook, function,
+                                 tax_profile.generate_score_rows(metric=metric), rank=rank)
 
     # Make 'Average' sheet
     if function_id is None:
@@ -346,17 +365,10 @@ def make_sample_tax_func_xlsx(project, scores, metric, function_id=None, rank=No
         tax_profile = TaxonomyProfile()
         tax_profile.make_function_taxonomy_profile(project.taxonomy_data, sample_scores)
 
-        taxonomy_df = tax_profile.convert_profile_into_score_df(metric=metric)
-
-        if rank is None:
-            taxonomy_df.to_excel(writer, sheet_name='Average', merge_cells=False)
-        else:
-            filtered_df = taxonomy_df[taxonomy_df[('', 'Rank')] == rank]
-            filtered_df.to_excel(writer, sheet_name='Average', merge_cells=False)
+        write_taxonomy_worksheet(workbook, 'Average',
+                                 tax_profile.generate_score_rows(metric=metric), rank=rank)
 
-        format_taxonomy_worksheet(writer, 'Average')
-
-    writer.save()
+    workbook.close()
 
 
 def make_assembly_xlsx(assembler):
@@ -1,223 +1,109 @@
 """Runs Fama functional profiling pipeline"""
 import os
-import gzip
+from itertools import zip_longest
 
 from fama.utils.const import ENDS, STATUS_GOOD
-from fama.se_functional_pipeline import run_fastq_pipeline
-from fama.utils.utils import run_external_program
+from fama.se_functional_pipeline import run_fastq_pipeline, search_reference_db, \
+    search_background_db, batch_reference_search, batch_background_search, \
+    get_sample_scheduler, prepare_reference_output, prepare_background_output, \
+    run_microbecensus, start_microbecensus, needs_microbecensus, estimate_average_genome_size, \
+    generate_sample_reports
+from fama.utils.gzip_io import open_input_file, open_output_file
 from fama.project.sample import Sample
 from fama.diamond_parser.diamond_parser import DiamondParser
-from fama.output.report import generate_fastq_report, generate_sample_report
+from fama.output.report import generate_fastq_report
 from fama.output.pdf_report import generate_pdf_report
 from fama.output.krona_xml_writer import make_functions_chart
-from fama.output.json_util import export_annotated_reads, export_sample
-from fama.third_party.microbe_census import run_pipeline, report_results
+from fama.output.json_util import export_sample
+from fama.output.npz_util import export_annotated_reads
 from fama.diamond_parser.hit_utils import parse_fastq_seqid
 
 
-def run_ref_search(parser, command):
-    """Runs pre-selection DIAMOND search
+def read_fastq_records(infile_handle):
+    """Reads FASTQ file opened in binary mode by four lines
 
     Args:
-        parser (:obj:DiamondParser): parser object processing an input sequence file
-        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
-    """
-    print('Starting DIAMOND')
-    diamond_args = [parser.config.diamond_path,
-                    command,
-                    '--db',
-                    parser.config.get_reference_diamond_db(
-                        parser.options.get_collection(parser.sample.sample_id)
-                    ),
-                    '--query',
-                    parser.options.get_fastq_path(parser.sample.sample_id, parser.end),
-                    '--out',
-                    os.path.join(
-                        parser.options.get_project_dir(parser.sample.sample_id),
-                        parser.sample.sample_id + '_' + parser.end + '_'
-                        + parser.options.ref_output_name
-                    ),
-                    '--max-target-seqs',
-                    '50',
-                    '--evalue',
-                    str(parser.config.get_evalue_cutoff(
-                        parser.options.get_collection(parser.sample.sample_id)
-                    )),
-                    # '--threads',
-                    # parser.config.threads,
-                    '--outfmt', '6', 'qseqid', 'sseqid', 'pident', 'length',
-                    'mismatch', 'slen', 'qstart', 'qend', 'sstart', 'send',
-                    'evalue', 'bitscore']
-    run_external_program(diamond_args)
-    print('DIAMOND finished')
-
-
-def run_bgr_search(parser, command):
-    """Runs classification DIAMOND search
+        infile_handle (file object): FASTQ file
 
-    Args:
-        parser (:obj:DiamondParser): parser object processing an input sequence file
-        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+    Yields:
+        tuple of four lines (bytes) of one FASTQ entry, with line endings
     """
-    print('Starting DIAMOND')
-    diamond_args = [parser.config.diamond_path,
-                    command,
-                    '--db',
-                    parser.config.get_background_diamond_db(
-                        parser.options.get_collection(parser.sample.sample_id)
-                    ),
-                    '--query',
-                    os.path.join(
-                        parser.options.get_project_dir(parser.sample.sample_id),
-                        parser.sample.sample_id + '_' + parser.end + '_'
-                        + parser.options.ref_hits_fastq_name
-                    ),
-                    '--out',
-                    os.path.join(
-                        parser.options.get_project_dir(parser.sample.sample_id),
-                        parser.sample.sample_id + '_' + parser.end + '_'
-                        + parser.options.background_output_name
-                    ),
-                    '--max-target-seqs',
-                    '100',
-                    '--evalue',
-                    str(
-                        parser.config.get_background_db_size(
-                            parser.options.get_collection(parser.sample.sample_id)
-                        ) * parser.config.get_evalue_cutoff(
-                            parser.options.get_collection(parser.sample.sample_id)
-                        ) / parser.config.get_reference_db_size(
-                            parser.options.get_collection(parser.sample.sample_id)
-                        )),
-                    # '--threads',
-                    # parser.config.threads,
-                    '--outfmt', '6', 'qseqid', 'sseqid', 'pident', 'length', 'mismatch',
-                    'slen', 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore']
-    run_external_program(diamond_args)
-    print('DIAMOND finished')
-
-
-def run_microbecensus(sample, config):
-    """Runs MicrobeCensus
+    for record in zip_longest(infile_handle, infile_handle, infile_handle,
+                              infile_handle, fillvalue=b''):
+        yield record
 
-    Args:
-        sample (:obj:Sample): sample analyzed
-        config (:obj:ProgramConfig): program configuration object
-    """
-    args = {}
-    if sample.is_paired_end:
-        args['seqfiles'] = [sample.fastq_fwd_path, sample.fastq_rev_path]
-    else:
-        args['seqfiles'] = [sample.fastq_fwd_path]
-    args['verbose'] = True
-    args['diamond'] = config.diamond_path
-    args['data_dir'] = config.microbecensus_datadir
-    args['outfile'] = os.path.join(sample.work_directory, 'microbecensus.out.txt')
-    args['threads'] = int(config.threads)
-    args['no_equivs'] = True
-    if sample.fastq_fwd_readcount < 1500000:
-        # MicrobeCensus subsamples 2M reads by default, but sequence library
-        # must have more reads as some reads are always discarded by filtering
-        args['nreads'] = sample.fastq_fwd_readcount // 2
-    elif sample.fastq_fwd_readcount < 3000000:
-        args['nreads'] = sample.fastq_fwd_readcount - 1000000
-    else:
-        args['nreads'] = 2000000
-    print(args)
-    est_ags, args = run_pipeline(args)
-    report_results(args, est_ags, None)
+
+def decode_fastq_record(record):
+    """Converts four lines of FASTQ entry into strings without line endings"""
+    return [line.decode('utf8').rstrip('\n\r') for line in record]
 
 
 def import_fastq_pe(parser1, parser2):
-    """Reads uncompressed or gzipped FASTQ file, finds sequences of
-    selected reads and stores them
+    """Reads uncompressed or gzipped FASTQ files of both ends in one pass,
+    finds sequences of selected reads and stores them
+
+    Note: both files are read in lockstep, one entry from each file at a
+    time. Only sequence identifier line is decoded for each entry, other
+    lines are decoded for selected reads only. Entries of each file are
+    processed independently, so files which are not synchronized (or have
+    different number of entries) give the same result as reading one file
+    after another.
 
     Returns:
         read_count (int): number of reads in the file
         base_count (int): total number of bases in all reads
     """
     fastq_file1 = parser1.options.get_fastq_path(parser1.sample.sample_id, parser1.end)
-    line_counter = 0
+    fastq_file2 = parser1.options.get_fastq_path(parser2.sample.sample_id, parser2.end)
+    reads1 = parser1.reads
+    reads2 = parser2.reads
     read_count1 = 0
     base_count1 = 0
-    current_read = None
-    infile_handle = None
-    if fastq_file1.endswith('.gz'):
-        infile_handle = gzip.open(fastq_file1, 'rb')
-    else:
-        infile_handle = open(fastq_file1, 'rb')
-    for line in infile_handle:
-        # count lines as each FASTQ entry has exactly four lines
-        line_counter += 1
-        if line_counter == 5:
-            line_counter = 1
-        line = line.decode('utf8').rstrip('\n\r')
-        if line_counter == 1:
-            read_count1 += 1
-            (read_id, _) = parse_fastq_seqid(line)
-            current_read = read_id
-            if current_read in parser1.reads:
-                parser1.reads[current_read].read_id_line = line
-            if current_read in parser2.reads:
-                parser2.reads[current_read].pe_id = line
-        elif line_counter == 2:
-            base_count1 += len(line)
-            if current_read in parser1.reads:
-                parser1.reads[current_read].sequence = line
-            if current_read in parser2.reads:
-                parser2.reads[current_read].pe_sequence = line
-        elif line_counter == 3:
-            if current_read in parser1.reads:
-                parser1.reads[current_read].line3 = line
-            if current_read in parser2.reads:
-                parser2.reads[current_read].pe_line3 = line
-        elif line_counter == 4:
-            if current_read in parser1.reads:
-                parser1.reads[current_read].quality = line
-            if current_read in parser2.reads:
-                parser2.reads[current_read].pe_quality = line
-    infile_handle.close()
-
-    fastq_file2 = parser1.options.get_fastq_path(parser2.sample.sample_id, parser2.end)
-    line_counter = 0
     read_count2 = 0
     base_count2 = 0
-    current_read = None
-    if fastq_file2.endswith('.gz'):
-        infile_handle = gzip.open(fastq_file2, 'rb')
-    else:
-        infile_handle = open(fastq_file2, 'rb')
-    for line in infile_handle:
-        # count lines as each FASTQ entry has exactly four lines
-        line_counter += 1
-        if line_counter == 5:
-            line_counter = 1
-        line = line.decode('utf8').rstrip('\n\r')
-        if line_counter == 1:
+    threads = int(parser1.config.threads)
+    infile_handle1 = open_input_file(fastq_file1, 'rb', threads)
+    infile_handle2 = open_input_file(fastq_file2, 'rb', threads)
+    for record1, record2 in zip_longest(read_fastq_records(infile_handle1),
+                                        read_fastq_records(infile_handle2)):
+        if record1 is not None:
+            read_count1 += 1
+            base_count1 += len(record1[1].rstrip(b'\n\r'))
+            (read_id, _) = parse_fastq_seqid(record1[0].decode('utf8').rstrip('\n\r'))
+            if read_id in reads1 or read_id in reads2:
+                (id_line, sequence, line3, quality) = decode_fastq_record(record1)
+                if read_id in reads1:
+                    read = reads1[read_id]
+                    read.read_id_line = id_line
+                    read.sequence = sequence
+                    read.line3 = line3
+                    read.quality = quality
+                if read_id in reads2:
+                    read = reads2[read_id]
+                    read.pe_id = id_line
+                    read.pe_sequence = sequence
+                    read.pe_line3 = line3
+                    read.pe_quality = quality
+        if record2 is not None:
             read_count2 += 1
-            (read_id, _) = parse_fastq_seqid(line)
-            current_read = read_id
-            if current_read in parser1.reads:
-                parser1.reads[current_read].pe_id = line
-            if current_read in parser2.reads:
-                parser2.reads[current_read].read_id_line = line
-        elif line_counter == 2:
-            base_count2 += len(line)
-            if current_read in parser1.reads:
-                parser1.reads[current_read].pe_sequence = line
-            if current_read in parser2.reads:
-                parser2.reads[current_read].sequence = line
-        elif line_counter == 3:
-            if current_read in parser1.reads:
-                parser1.reads[current_read].pe_line3 = line
-            if current_read in parser2.reads:
-                parser2.reads[current_read].line3 = line
-        elif line_counter == 4:
-            if current_read in parser1.reads:
-                parser1.reads[current_read].pe_quality = line
-            if current_read in parser2.reads:
-                parser2.reads[current_read].quality = line
-    infile_handle.close()
+            base_count2 += len(record2[1].rstrip(b'\n\r'))
+            (read_id, _) = parse_fastq_seqid(record2[0].decode('utf8').rstrip('\n\r'))
+            if read_id in reads1 or read_id in reads2:
+                (id_line, sequence, line3, quality) = decode_fastq_record(record2)
+                if read_id in reads1:
+                    read = reads1[read_id]
+                    read.pe_id = id_line
+                    read.pe_sequence = sequence
+                    read.pe_line3 = line3
+                    read.pe_quality = quality
+                if read_id in reads2:
+                    read = reads2[read_id]
+                    read.read_id_line = id_line
+                    read.sequence = sequence
+                    read.line3 = line3
+                    read.quality = quality
+    infile_handle1.close()
+    infile_handle2.close()
     return (parser1, parser2, read_count1, read_count2, base_count1, base_count2)
 
 
@@ -226,19 +112,17 @@ def export_paired_end_reads_fastq(parser):
     reads into a separate FASTQ file
     """
     outdir = parser.sample.work_directory
-    read_ids = {}
-    for read_id in sorted(parser.reads.keys()):
-        read_ids[read_id] = read_id
     fastq_outfile = os.path.join(outdir,
                                  parser.sample.sample_id + '_'
                                  + parser.end + '_'
                                  + parser.options.pe_reads_fastq_name + '.gz')
-    with gzip.open(fastq_outfile, 'wt') as outfile:
+    with open_output_file(fastq_outfile, 'wt', int(parser.config.threads)) as outfile:
         for read_id in sorted(parser.reads.keys()):
-            outfile.write(parser.reads[read_id].pe_id + '\n')
-            outfile.write(parser.reads[read_id].pe_sequence + '\n')
-            outfile.write(parser.reads[read_id].pe_line3 + '\n')
-            outfile.write(parser.reads[read_id].pe_quality + '\n')
+            read = parser.reads[read_id]
+            outfile.write(read.pe_id + '\n')
+            outfile.write(read.pe_sequence + '\n')
+            outfile.write(read.pe_line3 + '\n')
+            outfile.write(read.pe_quality + '\n')
 
 
 def fastq_pe_pipeline(project, sample_identifier=None, end_identifier=None):
@@ -249,9 +133,22 @@ def fastq_pe_pipeline(project, sample_identifier=None, end_identifier=None):
         sample_identifier (str, optional): sample identifier
         end_identifier (str, optional): end identifier
     """
+    batch_mode = project.config.batch_diamond_search and not end_identifier
+    parallel_mode = project.config.max_parallel_samples > 1 and not end_identifier
+    if batch_mode:
+        run_batch_pe_fastq_pipeline(project, sample_identifier)
+    elif parallel_mode:
+        run_parallel_pe_fastq_pipeline(project, sample_identifier)
     for sample_id in project.list_samples():
         if sample_identifier and sample_identifier != sample_id:
             continue
+        if batch_mode or parallel_mode:
+            # already processed
+            export_sample(project.samples[sample_id])
+            if end_identifier is None:
+                project.export_score_table(sample_id)
+            project.options.set_sample_data(project.samples[sample_id])
+            continue
         sample = Sample(sample_id)
         sample.load_sample(project.options)
         project.samples[sample_id] = sample
@@ -265,9 +162,14 @@ def fastq_pe_pipeline(project, sample_identifier=None, end_identifier=None):
                 run_pe_fastq_pipeline(project,
                                       sample=project.samples[sample_id])
         export_sample(project.samples[sample_id])
+        if end_identifier is None:
+            project.export_score_table(sample_id)
         # Generate output for the sample or delete sample from memory
         project.options.set_sample_data(project.samples[sample_id])
 
+    if sample_identifier is not None:
+        # Other samples are needed for metric selection and project report
+        project.load_missing_samples()
     metric = None
     for sample_id in project.list_samples():
         if project.is_paired_end():
@@ -280,13 +182,21 @@ def fastq_pe_pipeline(project, sample_identifier=None, end_identifier=None):
             for sample_id in project.list_samples():
                 if project.samples[sample_id].rpkg_scaling_factor == 0.0:
                     metric = 'readcount'
-    # Generate output for all samples
-    for sample_id in project.list_samples():
-        generate_sample_report(project, sample_id, metric=metric)
+    # Generate output for processed samples
+    generate_sample_reports(
+        project,
+        [sample_id for sample_id in project.list_samples()
+         if not sample_identifier or sample_identifier == sample_id],
+        metric=metric
+    )
 
     # Generate output for the project
     if sample_identifier is None:
-        # Skip project report if the pipeline is running for only one sample
+        project.generate_report()
+    elif end_identifier is None and all(
+            project.has_score_data(sample_id) for sample_id in project.list_samples()
+    ):
+        # Project report for one new sample uses saved scores of other samples
         project.generate_report()
 
     # Rename existing project file and save current version
@@ -294,6 +204,110 @@ def fastq_pe_pipeline(project, sample_identifier=None, end_identifier=None):
     return project
 
 
+def run_batch_pe_fastq_pipeline(project, sample_identifier=None):
+    """Functional profiling pipeline for all paired-end FASTQ files of
+    the project with one DIAMOND search per collection for all files.
+    Results of pre-selection search for all files are kept in memory
+    until classification search is finished.
+
+    Args:
+        project (:obj:Project): current project
+        sample_identifier (str, optional): sample identifier
+    """
+    samples = []
+    for sample_id in project.list_samples():
+        if sample_identifier and sample_identifier != sample_id:
+            continue
+        sample = Sample(sample_id)
+        sample.load_sample(project.options)
+        project.samples[sample_id] = sample
+        samples.append(sample)
+        if not os.path.isdir(project.options.get_project_dir(sample_id)):
+            os.makedirs(project.options.get_project_dir(sample_id), exist_ok=True)
+    batch_reference_search([DiamondParser(config=project.config,
+                                          options=project.options,
+                                          taxonomy_data=project.taxonomy_data,
+                                          ref_data=project.ref_data,
+                                          sample=sample,
+                                          end=end) for sample in samples for end in ENDS],
+                           'blastx')
+    sample_parsers = [prepare_pe_fastq_pipeline(project, sample) for sample in samples]
+    batch_background_search([parser for parsers in sample_parsers for parser in parsers
+                             if parser.reads], 'blastx')
+    for sample, (parser1, parser2) in zip(samples, sample_parsers):
+        sample.reads = finish_pe_fastq_pipeline(parser1, parser2)
+
+
+def run_parallel_pe_fastq_pipeline(project, sample_identifier=None):
+    """Functional profiling pipeline for all paired-end FASTQ files of
+    the project, which processes several samples at the same time.
+    DIAMOND searches write output files, which are processed in separate
+    tasks, so DIAMOND search for one sample runs along with processing
+    of another.
+
+    Args:
+        project (:obj:Project): current project
+        sample_identifier (str, optional): sample identifier
+    """
+    scheduler, diamond_threads = get_sample_scheduler(project.config)
+    diamond_options = ['--threads', str(diamond_threads)]
+
+    def import_reads(sample, parsers):
+        parsers.extend(prepare_pe_fastq_pipeline(project, sample))
+
+    def search_background(parsers, end_index):
+        prepare_background_output(parsers[end_index], 'blastx', diamond_options)
+
+    def classify_reads(sample, parsers):
+        sample.reads = finish_pe_fastq_pipeline(parsers[0], parsers[1])
+
+    for sample_id in project.list_samples():
+        if sample_identifier and sample_identifier != sample_id:
+            continue
+        sample = Sample(sample_id)
+        sample.load_sample(project.options)
+        project.samples[sample_id] = sample
+        if not os.path.isdir(project.options.get_project_dir(sample_id)):
+            os.makedirs(project.options.get_project_dir(sample_id), exist_ok=True)
+        # holds parsers created by prepare_pe_fastq_pipeline
+        parsers = []
+        search_tasks = []
+        for end in ENDS:
+            parser = DiamondParser(config=project.config,
+                                   options=project.options,
+                                   taxonomy_data=project.taxonomy_data,
+                                   ref_data=project.ref_data,
+                                   sample=sample,
+                                   end=end)
+            search_tasks.append(scheduler.add_task(sample_id + ' ' + end + ' reference DB search',
+                                                   prepare_reference_output,
+                                                   (parser, 'blastx', diamond_options),
+                                                   cpus=diamond_threads,
+                                                   memory=project.config.diamond_memory,
+                                                   group=sample_id))
+        if needs_microbecensus(sample):
+            # MicrobeCensus runs DIAMOND along with reference DB searches
+            search_tasks.append(scheduler.add_task(sample_id + ' MicrobeCensus',
+                                                   estimate_average_genome_size,
+                                                   (sample, project.config),
+                                                   cpus=diamond_threads,
+                                                   memory=project.config.diamond_memory,
+                                                   group=sample_id))
+        task = scheduler.add_task(sample_id + ' reads import', import_reads, (sample, parsers),
+                                  dependencies=search_tasks,
+                                  group=sample_id)
+        search_tasks = [scheduler.add_task(sample_id + ' ' + end + ' background DB search',
+                                           search_background, (parsers, end_index),
+                                           dependencies=[task],
+                                           cpus=diamond_threads,
+                                           memory=project.config.diamond_memory,
+                                           group=sample_id)
+                        for end_index, end in enumerate(ENDS)]
+        scheduler.add_task(sample_id + ' output', classify_reads, (sample, parsers),
+                           dependencies=search_tasks, group=sample_id)
+    scheduler.run()
+
+
 def run_pe_fastq_pipeline(project, sample):
     """Functional profiling pipeline for single FASTQ file processing
 
@@ -301,7 +315,22 @@ def run_pe_fastq_pipeline(project, sample):
         project (:obj:Project): current project
         sample (:obj:Sample): current sample
     """
-    result = {}
+    parser1, parser2 = prepare_pe_fastq_pipeline(project, sample)
+    return finish_pe_fastq_pipeline(parser1, parser2)
+
+
+def prepare_pe_fastq_pipeline(project, sample):
+    """First part of functional profiling pipeline for paired-end FASTQ
+    files: processing of reference DB search results and import of reads
+
+    Args:
+        project (:obj:Project): current project
+        sample (:obj:Sample): current sample
+
+    Returns:
+        parser1 (:obj:DiamondParser): parser object with hits found in forward end reads
+        parser2 (:obj:DiamondParser): parser object with hits found in reverse end reads
+    """
     parser1 = DiamondParser(config=project.config,
                             options=project.options,
                             taxonomy_data=project.taxonomy_data,
@@ -322,26 +351,12 @@ def run_pe_fastq_pipeline(project, sample):
         os.mkdir(os.path.join(project.options.get_project_dir(sample.sample_id),
                               project.options.get_output_subdir(sample.sample_id)))
 
-    # Search in reference database
-    if not os.path.exists(
-            os.path.join(
-                parser1.options.get_project_dir(parser1.sample.sample_id),
-                parser1.sample.sample_id + '_' + parser1.end + '_' + parser1.options.ref_output_name
-            )
-    ):
-        run_ref_search(parser1, 'blastx')
-
-    if not os.path.exists(
-            os.path.join(
-                parser2.options.get_project_dir(parser2.sample.sample_id),
-                parser2.sample.sample_id + '_' + parser2.end + '_' + parser2.options.ref_output_name
-            )
-    ):
-        run_ref_search(parser2, 'blastx')
+    # Estimate average genome size while DIAMOND output and reads are processed
+    microbecensus_started = start_microbecensus(sample, project.config)
 
-    # Process output of reference DB search
-    parser1.parse_reference_output()
-    parser2.parse_reference_output()
+    # Search in reference database and process output
+    search_reference_db(parser1, 'blastx')
+    search_reference_db(parser2, 'blastx')
 
     # Import sequence data for selected sequence reads
     print('Reading FASTQ file')
@@ -360,26 +375,35 @@ def run_pe_fastq_pipeline(project, sample):
 
     if sample.rpkg_scaling_factor == 0.0:
         sample.import_rpkg_scaling_factor()
-    if sample.rpkg_scaling_factor == 0.0:
+    if sample.rpkg_scaling_factor == 0.0 and not microbecensus_started:
         run_microbecensus(sample=sample, config=project.config)
         sample.import_rpkg_scaling_factor()
     project.options.set_sample_data(sample)
 
     if parser1.reads:
-        parser1.export_hit_fastq()
-        print('Hits for forward end reads exported in FASTQ format')
         parser1.export_hit_list()
         print('List of hits fo forward end reads exported')
-        if not os.path.exists(
-                os.path.join(
-                    parser1.options.get_project_dir(parser1.sample.sample_id),
-                    parser1.sample.sample_id + '_' + parser1.end + '_'
-                    + parser1.options.background_output_name
-                )
-        ):
-            run_bgr_search(parser1, 'blastx')
-        print('Classification DB search finished')
-        parser1.parse_background_output()
+    if parser2.reads:
+        parser2.export_hit_list()
+        print('List of hits for reverse end reads exported')
+    return parser1, parser2
+
+
+def finish_pe_fastq_pipeline(parser1, parser2):
+    """Second part of functional profiling pipeline for paired-end FASTQ
+    files: classification of hits found in reference DB search and output
+
+    Args:
+        parser1 (:obj:DiamondParser): parser object for forward end reads
+        parser2 (:obj:DiamondParser): parser object for reverse end reads
+
+    Returns:
+        dict[str, dict[str, :obj:AnnotatedRead]]: reads with functions
+            assigned for each end
+    """
+    result = {}
+    if parser1.reads:
+        search_background_db(parser1, 'blastx')
         print('Classification DB search results imported')
         parser1.export_read_fastq()
         print('Classified forward end reads exported in FASTQ format')
@@ -401,20 +425,7 @@ def run_pe_fastq_pipeline(project, sample):
         result[ENDS[0]] = {}
 
     if parser2.reads:
-        parser2.export_hit_fastq()
-        print('Hits for reverse end reads exported in FASTQ format')
-        parser2.export_hit_list()
-        print('List of hits for reverse end reads exported')
-        if not os.path.exists(
-                os.path.join(
-                    parser2.options.get_project_dir(parser2.sample.sample_id),
-                    parser2.sample.sample_id + '_' + parser2.end + '_'
-                    + parser2.options.background_output_name
-                )
-        ):
-            run_bgr_search(parser2, 'blastx')
-        print('Classification DB search for reverse end reads finished')
-        parser2.parse_background_output()
+        search_background_db(parser2, 'blastx')
         print('Classification DB search results for reverse end reads imported')
         parser2.export_read_fastq()
         print('Classified reverse end reads exported in FASTQ format')
@@ -207,6 +207,67 @@ class ProgramConfig(object):
         """Path to MicrobeCensus data directory"""
         return self.parser['DEFAULT']['microbecensus_data']
 
+    @property
+    def microbecensus_cache_dir(self):
+        """Path to directory for MicrobeCensus results shared by all
+        projects (default: empty, results are not cached)"""
+        return self.parser['DEFAULT'].get('microbecensus_cache_dir', fallback='')
+
+    @property
+    def microbecensus_cache_max_age(self):
+        """Number of days since last use after which cached MicrobeCensus
+        results are removed (default: 90, zero means no limit)"""
+        return self.parser['DEFAULT'].getfloat('microbecensus_cache_max_age', fallback=90.0)
+
+    @property
+    def microbecensus_cache_max_size(self):
+        """Maximal size of MicrobeCensus results cache, in megabytes
+        (default: 100, zero means no limit)"""
+        return self.parser['DEFAULT'].getfloat('microbecensus_cache_max_size', fallback=100.0)
+
+    @property
+    def stream_diamond_output(self):
+        """True if DIAMOND output must be parsed while search is running,
+        instead of writing it to file first (default: False)"""
+        return self.parser['DEFAULT'].getboolean('stream_diamond_output', fallback=False)
+
+    @property
+    def keep_diamond_output(self):
+        """True if DIAMOND output parsed while search is running must be
+        saved to file anyway, so that interrupted run can be resumed
+        without repeating the search (default: True)"""
+        return self.parser['DEFAULT'].getboolean('keep_diamond_output', fallback=True)
+
+    @property
+    def batch_diamond_search(self):
+        """True if project pipelines must run one DIAMOND search for all
+        samples of a collection, instead of one search per sequence file
+        (default: False)"""
+        return self.parser['DEFAULT'].getboolean('batch_diamond_search', fallback=False)
+
+    @property
+    def max_parallel_samples(self):
+        """Maximal number of samples processed at the same time by
+        project pipelines (default: 1)"""
+        return self.parser['DEFAULT'].getint('max_parallel_samples', fallback=1)
+
+    @property
+    def memory_limit(self):
+        """Memory available for processing of samples, in gigabytes
+        (default: 0, no limit)"""
+        return self.parser['DEFAULT'].getfloat('memory_limit', fallback=0.0)
+
+    @property
+    def diamond_memory(self):
+        """Estimated memory usage of one DIAMOND run, in gigabytes (default: 0)"""
+        return self.parser['DEFAULT'].getfloat('diamond_memory', fallback=0.0)
+
+    @property
+    def sample_memory(self):
+        """Estimated memory usage of one sample being processed, in
+        gigabytes (default: 0)"""
+        return self.parser['DEFAULT'].getfloat('sample_memory', fallback=0.0)
+
     @property
     def krona_path(self):
         """Path to KronaTools"""
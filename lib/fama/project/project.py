@@ -1,6 +1,7 @@
 """Describes Project class"""
 import os
 from collections import defaultdict
+from contextlib import contextmanager
 
 from fama.utils.const import ENDS
 from fama.project.program_config import ProgramConfig
@@ -8,8 +9,11 @@ from fama.project.project_options import ProjectOptions
 from fama.project.sample import Sample
 from fama.reference_library.reference_data import ReferenceData
 from fama.reference_library.taxonomy_data import TaxonomyData
+from fama.reference_library.protein_index import get_file_fingerprint
 from fama.output.report import generate_project_report
+from fama.output.score_table import ScoreTable
 from fama.output.json_util import import_sample, import_annotated_reads
+from fama.output.npz_util import import_annotated_reads as import_annotated_reads_npz
 
 
 class Project(object):
@@ -26,6 +30,8 @@ class Project(object):
             collection (list of functions, list of proteins etc.)
         taxonomy_data (:obj:'TaxonomyData'): NCBI taxonomy dataset for
             the collection
+        score_tables (dict[str, :obj:'ScoreTable']): cache of function
+            scores with sample identifiers as keys
     """
     def __init__(self, config_file, project_file):
         """
@@ -34,6 +40,7 @@ class Project(object):
             project_file (str): full path to project ini file.
         """
         self.samples = {}
+        self.score_tables = {}
         self.config = ProgramConfig(config_file)
         self.options = ProjectOptions(project_file)
         collection = self.options.get_collection()
@@ -75,19 +82,67 @@ class Project(object):
             import_sample(os.path.join(sample.work_directory,
                                        sample.sample_id + '_' + self.options.reads_json_name))
 
-    def import_reads_json(self, sample_id, ends):
-        """Loads annotated reads from one or two JSON files into memory
+    def get_reads_path(self, sample_id, end_id):
+        """Returns path to file with annotated reads in columnar format
+        or, if it does not exist, to JSON file written by older versions"""
+        result = os.path.join(self.options.get_project_dir(sample_id),
+                              sample_id + '_' + end_id + '_' + self.options.reads_data_name)
+        if not os.path.exists(result):
+            json_path = os.path.join(self.options.get_project_dir(sample_id),
+                                     sample_id + '_' + end_id + '_'
+                                     + self.options.reads_json_name)
+            if os.path.exists(json_path):
+                result = json_path
+        return result
+
+    def import_reads_json(self, sample_id, ends, sequences=True):
+        """Loads annotated reads from one or two files into memory.
+        Reads are loaded from .npz files or, for projects processed by
+        older versions, from JSON files.
+
         Args:
             sample_id (str): sample identifier
             ends (:obj:'list' of str): either ['pe1','pe2'] or ['pe1'] or ['pe2']
+            sequences (bool): if False, only annotations are loaded from
+                .npz files and sequence attributes of reads are None
         """
+        self.score_tables.pop(sample_id, None)
         for end_id in ends:
             if end_id == 'pe2' and not self.samples[sample_id].is_paired_end:
                 continue
-            self.samples[sample_id].reads[end_id] = \
-                import_annotated_reads(os.path.join(self.options.get_project_dir(sample_id),
-                                                    sample_id + '_' + end_id + '_'
-                                                    + self.options.reads_json_name))
+            infile = self.get_reads_path(sample_id, end_id)
+            if infile.endswith(self.options.reads_data_name):
+                self.samples[sample_id].reads[end_id] = \
+                    import_annotated_reads_npz(infile, sequences=sequences)
+            else:
+                self.samples[sample_id].reads[end_id] = import_annotated_reads(infile)
+
+    @contextmanager
+    def sample_reads(self, sample_id, ends=ENDS, sequences=True):
+        """Provides annotated reads of a sample. If reads of the sample are
+        not in memory, they are imported from files and released on exit,
+        so that samples can be processed one by one without keeping reads
+        of all samples in memory.
+
+        Args:
+            sample_id (str): sample identifier
+            ends (:obj:'list' of str): either ['pe1','pe2'] or ['pe1'] or ['pe2']
+            sequences (bool): if False, sequence attributes of imported
+                reads are None
+
+        Yields:
+            :obj:defaultdict[str, :obj:dict[str,:obj:AnnotatedRead]]: reads
+                of the sample
+        """
+        sample = self.samples[sample_id]
+        if sample.reads:
+            yield sample.reads
+            return
+        self.import_reads_json(sample_id, ends, sequences=sequences)
+        try:
+            yield sample.reads
+        finally:
+            sample.reads = defaultdict(dict)
 
     def get_insert_size(self, sample):
         """Returns average insert size for paired-end sample. If calculation of
@@ -105,6 +160,136 @@ class Project(object):
             result = sample.insert_size
         return result
 
+    def get_score_parameters(self, sample):
+        """Returns parameters of function score calculation for a sample
+        (see ScoreTable.calculate_scores)
+
+        Args:
+            sample (:obj:'Sample'): Sample object
+        """
+        if sample.is_paired_end and not sample.reads:
+            # Insert size cannot be estimated without reads
+            insert_size = sample.insert_size
+        else:
+            insert_size = self.get_insert_size(sample)
+        return (sample.rpkm_scaling_factor, sample.rpkg_scaling_factor,
+                sample.get_avg_read_length('pe1'),
+                self.config.get_length_cutoff(self.options.get_collection(sample.sample_id)),
+                insert_size)
+
+    def get_score_table_path(self, sample_id):
+        """Returns path to file with saved function scores of a sample"""
+        return os.path.join(self.options.get_project_dir(sample_id),
+                            sample_id + '_' + self.options.scores_name)
+
+    def get_reads_files(self, sample_id):
+        """Returns end identifier, size and modification time of each
+        file with annotated reads of a sample"""
+        result = []
+        for end_id in ENDS:
+            if end_id == 'pe2' and not self.samples[sample_id].is_paired_end:
+                continue
+            infile = self.get_reads_path(sample_id, end_id)
+            if os.path.exists(infile):
+                result.append([end_id] + get_file_fingerprint(infile))
+        return result
+
+    def export_score_table(self, sample_id):
+        """Saves function scores of a sample, so that project report can
+        be generated later without loading annotated reads of the sample.
+        Annotated reads must be exported before the scores.
+
+        Args:
+            sample_id (str): sample identifier
+        """
+        score_table = self.get_score_table(sample_id)
+        score_table.reads_files = self.get_reads_files(sample_id)
+        score_table.save(self.get_score_table_path(sample_id))
+
+    def import_score_table(self, sample_id):
+        """Loads saved function scores of a sample. Saved scores are
+        ignored if the sample parameters changed or files of annotated
+        reads were replaced after they were saved.
+
+        Args:
+            sample_id (str): sample identifier
+
+        Returns:
+            :obj:'ScoreTable': function scores for the sample or None
+        """
+        infile = self.get_score_table_path(sample_id)
+        if not os.path.exists(infile):
+            return None
+        sample = self.samples[sample_id]
+        score_table = ScoreTable()
+        score_table.load(infile)
+        if score_table.parameters is None \
+                or score_table.reads_files != self.get_reads_files(sample_id):
+            return None
+        if sample.is_paired_end and sample.insert_size == 0:
+            # Insert size was estimated from reads when scores were saved
+            sample.insert_size = score_table.parameters[-1]
+        if score_table.parameters != self.get_score_parameters(sample):
+            return None
+        return score_table
+
+    def has_score_data(self, sample_id):
+        """Returns True if annotated reads or saved function scores of a
+        sample are available"""
+        return (sample_id in self.samples and bool(self.samples[sample_id].reads)) \
+            or os.path.exists(self.get_score_table_path(sample_id))
+
+    def get_score_table(self, sample_id):
+        """Returns ScoreTable object with scores of all metrics for a
+        sample. ScoreTable is built once and reused by all reports until
+        reads of the sample are replaced. If reads of the sample are not
+        loaded, saved scores are used. If there are no saved scores or
+        they are outdated, scores are calculated from reads imported only
+        for the time of calculation, and only aggregated scores are kept.
+
+        Args:
+            sample_id (str): sample identifier
+
+        Returns:
+            :obj:'ScoreTable': function scores for the sample
+        """
+        sample = self.samples[sample_id]
+        score_table = self.score_tables.get(sample_id)
+        if not sample.reads:
+            if score_table is None or score_table.reads_signature is not None \
+                    or score_table.parameters != self.get_score_parameters(sample):
+                score_table = self.import_score_table(sample_id)
+            if score_table is None:
+                # Insert size estimation requires read sequences
+                sequences = sample.is_paired_end and sample.insert_size == 0
+                with self.sample_reads(sample_id, sequences=sequences):
+                    score_table = ScoreTable(sample_id, sample.is_paired_end)
+                    score_table.import_reads(self)
+                    score_table.calculate_scores(*self.get_score_parameters(sample))
+                score_table.release_rows()
+            self.score_tables[sample_id] = score_table
+            return score_table
+        reads_signature = tuple(
+            (end, id(reads), len(reads)) for end, reads in sorted(sample.reads.items())
+            if reads is not None
+        )
+        if score_table is None or score_table.reads_signature != reads_signature:
+            score_table = ScoreTable(sample_id, sample.is_paired_end)
+            score_table.import_reads(self)
+            score_table.reads_signature = reads_signature
+            self.score_tables[sample_id] = score_table
+        score_table.calculate_scores(*self.get_score_parameters(sample))
+        return score_table
+
+    def load_missing_samples(self):
+        """Creates Sample objects from project options for all samples
+        not loaded yet. Annotated reads are not loaded."""
+        for sample_id in self.list_samples():
+            if sample_id not in self.samples:
+                sample = Sample(sample_id=sample_id)
+                sample.load_sample(self.options)
+                self.samples[sample_id] = sample
+
     def generate_report(self, metrics=None):
         """Writes project report in text format. Also, calls XLSX report
         generation.
@@ -116,13 +301,14 @@ class Project(object):
         with open(outfile, 'w') as outfile:
             outfile.write(self.options.project_name + '\n\n')
             for sample_id in self.list_samples():
+                # Read counts are taken from scores, which do not require
+                # loading of annotated reads
+                read_counts = self.get_score_table(sample_id).read_counts
                 outfile.write('\t'.join([sample_id + ':',
                                          self.samples[sample_id].sample_name,
-                                         'pe1 reads: '
-                                         + str(len(self.samples[sample_id].reads['pe1']))]))
+                                         'pe1 reads: ' + str(read_counts.get('pe1', 0))]))
                 if self.samples[sample_id].is_paired_end:
-                    outfile.write('\tpe2 reads: '
-                                  + str(len(self.samples[sample_id].reads['pe2'])))
+                    outfile.write('\tpe2 reads: ' + str(read_counts.get('pe2', 0)))
                 outfile.write('\n')
         generate_project_report(self, metrics)
 
@@ -195,9 +381,11 @@ class Project(object):
                                             os.path.join(outdir,
                                                          sample + '_' + end + '_'
                                                          + self.options.reads_fastq_name + '.gz'))
-                if not os.path.exists(os.path.join(outdir,
-                                                   sample + '_' + end + '_'
-                                                   + self.options.ref_hits_fastq_name)):
+                # hits are not saved, if they were sent to DIAMOND through stdin
+                if not self.config.stream_diamond_output and \
+                        not os.path.exists(os.path.join(outdir,
+                                                        sample + '_' + end + '_'
+                                                        + self.options.ref_hits_fastq_name)):
                     problems[sample].append('Reference hits FASTQ file not found for sample '
                                             + sample + ', end ' + end + ':' +
                                             os.path.join(outdir,
@@ -220,14 +408,10 @@ class Project(object):
                                                          sample + '_' + end + '_'
                                                          + self.options.pe_reads_fastq_name
                                                          + '.gz'))
-                if not os.path.exists(os.path.join(outdir,
-                                                   sample + '_' + end + '_'
-                                                   + self.options.reads_json_name)):
-                    problems[sample].append('Output JSON file with annotated reads not found \
+                if not os.path.exists(self.get_reads_path(sample, end)):
+                    problems[sample].append('Output file with annotated reads not found \
                         for sample ' + sample + ', end ' + end + ':' +
-                                            os.path.join(outdir,
-                                                         sample + '_' + end + '_'
-                                                         + self.options.reads_json_name))
+                                            self.get_reads_path(sample, end))
                 if skip_output_check:
                     continue
                 if not os.path.exists(os.path.join(outdir,
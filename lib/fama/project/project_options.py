@@ -81,6 +81,16 @@ class ProjectOptions(object):
         """Ending of JSON file name for results"""
         return self.parser['DEFAULT']['reads_json_name']
 
+    @property
+    def reads_data_name(self):
+        """Ending of file name for annotated reads in columnar format"""
+        return self.parser['DEFAULT'].get('reads_data_name', fallback='reads.npz')
+
+    @property
+    def scores_name(self):
+        """Ending of file name for saved function scores of a sample"""
+        return self.parser['DEFAULT'].get('scores_name', fallback='scores.npz')
+
     @property
     def assembly_dir(self):
         """Name of subdirectory for assembly"""
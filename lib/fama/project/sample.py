@@ -27,6 +27,8 @@ class Sample(object):
         reads (:obj:defaultdict[str, :obj:dict[str,:obj:AnnotatedRead]]):
             annotation results; outer key is an end identifier, inner key
             is a read identifier, value is an AnnotatedRead object
+        microbecensus_task (:obj:concurrent.futures.Future): MicrobeCensus
+            run in background, None if not started or already finished
     """
     def __init__(self, sample_id='', sample_name=None, is_paired_end=True,
                  fastq_fwd_path=None, fastq_rev_path=None, fastq_fwd_readcount=0,
@@ -67,6 +69,7 @@ class Sample(object):
         self.replicate = replicate
         self.insert_size = insert_size
         self.reads = defaultdict(dict)
+        self.microbecensus_task = None
 
     def load_sample(self, options):
         """Sets sample attributes from project options
@@ -97,8 +100,15 @@ class Sample(object):
 
     def import_rpkg_scaling_factor(self):
         """Calculates RPKG/FPKG normalization coefficient from sample size
-        and average genome size
+        and average genome size.
+
+        If MicrobeCensus runs in background, waits for it to finish.
+        Errors of MicrobeCensus run are raised here.
         """
+        if self.microbecensus_task is not None:
+            task = self.microbecensus_task
+            self.microbecensus_task = None
+            task.result()
         mc_outfile = os.path.join(self.work_directory, 'microbecensus.out.txt')
         if os.path.exists(mc_outfile):
             with open(mc_outfile, 'r') as infile:
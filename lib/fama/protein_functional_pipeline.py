@@ -8,8 +8,9 @@ from fama.diamond_parser.diamond_parser import DiamondParser
 from fama.diamond_parser.diamond_hit import DiamondHit
 from fama.diamond_parser.diamond_hit_list import DiamondHitList
 from fama.diamond_parser.hit_utils import compare_protein_hits_lca
-from fama.output.json_util import export_annotated_reads, export_sample
-from fama.se_functional_pipeline import run_ref_search, run_bgr_search
+from fama.output.json_util import export_sample
+from fama.output.npz_util import export_annotated_reads
+from fama.se_functional_pipeline import search_reference_db, run_bgr_search
 from fama.output.report import generate_fasta_report, generate_protein_sample_report, \
     generate_protein_project_report
 from fama.output.krona_xml_writer import make_functions_chart
@@ -273,18 +274,8 @@ def functional_profiling_pipeline(project, sample):
                 )
             )
 
-    # Search in reference database
-    if not os.path.exists(
-            os.path.join(
-                parser.options.get_project_dir(parser.sample.sample_id),
-                parser.sample.sample_id + '_' + parser.end + '_'
-                + parser.options.ref_output_name
-                )
-    ):
-        run_ref_search(parser, 'blastp')
-
-    # Process output of reference DB search
-    parser.parse_reference_output()
+    # Search in reference database and process output
+    search_reference_db(parser, 'blastp')
     if not parser.reads:
         print('Hits not found in sample', sample)
         return {}
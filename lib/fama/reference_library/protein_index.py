@@ -0,0 +1,201 @@
+"""Compiled index of reference proteins, which can be memory-mapped
+instead of parsing proteins list file.
+
+Index file consists of 8-byte signature, 8-byte length of JSON header,
+JSON header and arrays referenced by the header:
+
+    protein_ids: sorted protein identifiers (fixed-width bytes)
+    taxids, functions, sources: for each protein, index of taxonomy
+        identifier, function identifiers and source DB in the string table
+    strings: string table, newline-separated UTF-8 strings
+
+"""
+import os
+import json
+import argparse
+from collections.abc import Mapping
+import numpy as np
+
+PROTEIN_INDEX_SUFFIX = '.fama_index'
+PROTEIN_INDEX_SIGNATURE = b'FAMAPIDX'
+PROTEIN_INDEX_VERSION = 1
+# Arrays of the index start at offsets divisible by this number
+PROTEIN_INDEX_ALIGNMENT = 64
+
+
+def get_protein_index_path(proteins_file):
+    """Returns path to compiled index of proteins list file"""
+    return proteins_file + PROTEIN_INDEX_SUFFIX
+
+
+def get_file_fingerprint(path):
+    """Returns size and modification time of a file"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_proteins_file(infile):
+    """Reads proteins list file in the same way as ReferenceData does
+
+    Returns:
+        dict[str, tuple(str, str, str)]: taxonomy identifier, function
+            identifiers and source DB for each protein identifier
+    """
+    result = {}
+    with open(infile, 'r') as file_handle:
+        for line in file_handle:
+            if line.startswith('#'):
+                continue  # skip header and comments
+            line_tokens = line.rstrip('\n\r').split('\t')
+            if len(line_tokens) > 3:
+                result[line_tokens[0]] = (line_tokens[1], line_tokens[-1], line_tokens[-2])
+    return result
+
+
+def compile_protein_index(infile, outfile=None):
+    """Reads proteins list file and writes compiled index
+
+    Args:
+        infile (str): path to proteins list file
+        outfile (str, optional): path to index file. By default,
+            index is written next to the proteins list file.
+
+    Returns:
+        outfile (str): path to index file
+    """
+    if outfile is None:
+        outfile = get_protein_index_path(infile)
+    proteins = read_proteins_file(infile)
+    protein_ids = np.array([protein.encode('utf8') for protein in proteins], dtype=bytes)
+    if protein_ids.size == 0:
+        protein_ids = protein_ids.astype('S1')
+    string_ids = {}
+    fields = np.zeros((len(proteins), 3), dtype=np.uint32)
+    for index, values in enumerate(proteins.values()):
+        for field_index, value in enumerate(values):
+            if value not in string_ids:
+                string_ids[value] = len(string_ids)
+            fields[index, field_index] = string_ids[value]
+    order = np.argsort(protein_ids, kind='stable')
+    arrays = {'protein_ids': protein_ids[order],
+              'taxids': np.ascontiguousarray(fields[order, 0]),
+              'functions': np.ascontiguousarray(fields[order, 1]),
+              'sources': np.ascontiguousarray(fields[order, 2]),
+              'strings': np.frombuffer('\n'.join(string_ids).encode('utf8'), dtype=np.uint8)}
+    header = {'version': PROTEIN_INDEX_VERSION,
+              'source': get_file_fingerprint(infile),
+              'proteins': len(proteins),
+              'arrays': {}}
+    # Array offsets are relative to the end of header
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = [array.dtype.str, len(array), offset]
+        offset += array.nbytes
+        offset += -offset % PROTEIN_INDEX_ALIGNMENT
+    header_data = json.dumps(header).encode('utf8')
+    header_data += b' ' * (-(len(header_data) + 16) % PROTEIN_INDEX_ALIGNMENT)
+    temp_file = outfile + '.tmp'
+    with open(temp_file, 'wb') as out:
+        out.write(PROTEIN_INDEX_SIGNATURE)
+        out.write(len(header_data).to_bytes(8, 'little'))
+        out.write(header_data)
+        for array in arrays.values():
+            out.write(array.tobytes())
+            out.write(b'\0' * (-array.nbytes % PROTEIN_INDEX_ALIGNMENT))
+    os.replace(temp_file, outfile)
+    return outfile
+
+
+class ProteinIndex(Mapping):
+    """ProteinIndex provides read-only dictionary interface to a compiled
+    index of reference proteins. Index file is memory-mapped, so
+    processes forked after loading share its pages.
+
+    Values are dictionaries with the same keys as in
+    ReferenceData.proteins_dict: 'taxid', 'function' and 'source'.
+
+    """
+
+    def __init__(self, index_file):
+        """ Args:
+            index_file (str): path to compiled index
+
+        Raises:
+            ValueError if the file is not a protein index of supported version
+        """
+        with open(index_file, 'rb') as file_handle:
+            if file_handle.read(len(PROTEIN_INDEX_SIGNATURE)) != PROTEIN_INDEX_SIGNATURE:
+                raise ValueError('Not a protein index file: ' + index_file)
+            header_size = int.from_bytes(file_handle.read(8), 'little')
+            self.header = json.loads(file_handle.read(header_size).decode('utf8'))
+        if self.header['version'] != PROTEIN_INDEX_VERSION:
+            raise ValueError('Unsupported version of protein index: ' + index_file)
+        data_offset = len(PROTEIN_INDEX_SIGNATURE) + 8 + header_size
+        data = np.memmap(index_file, dtype=np.uint8, mode='r')
+        arrays = {}
+        for name, (dtype, length, offset) in self.header['arrays'].items():
+            dtype = np.dtype(dtype)
+            arrays[name] = data[data_offset + offset:
+                                data_offset + offset + dtype.itemsize * length].view(dtype)
+        self.protein_ids = arrays['protein_ids']
+        self.taxids = arrays['taxids']
+        self.functions = arrays['functions']
+        self.sources = arrays['sources']
+        self.strings = arrays['strings'].tobytes().decode('utf8').split('\n')
+        self.id_width = self.protein_ids.dtype.itemsize
+
+    def is_current(self, proteins_file):
+        """Returns True if the index was compiled from current version of proteins list file"""
+        return self.header['source'] == get_file_fingerprint(proteins_file)
+
+    def get_protein_index(self, protein):
+        """Returns position of protein in the index
+
+        Raises:
+            KeyError if protein not found
+        """
+        try:
+            key = protein.encode('utf8')
+        except AttributeError:
+            raise KeyError(protein)
+        if len(key) > self.id_width or key.endswith(b'\0'):
+            raise KeyError(protein)
+        position = int(np.searchsorted(self.protein_ids, key))
+        if position == len(self.protein_ids) or self.protein_ids[position] != key:
+            raise KeyError(protein)
+        return position
+
+    def __getitem__(self, protein):
+        position = self.get_protein_index(protein)
+        return {'taxid': self.strings[self.taxids[position]],
+                'function': self.strings[self.functions[position]],
+                'source': self.strings[self.sources[position]]}
+
+    def __contains__(self, protein):
+        try:
+            self.get_protein_index(protein)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for protein in self.protein_ids:
+            yield protein.decode('utf8')
+
+    def __len__(self):
+        return len(self.protein_ids)
+
+
+def main():
+    """Compiles index for proteins list files"""
+    parser = argparse.ArgumentParser(description='Compiles index of Fama reference proteins')
+    parser.add_argument('files', nargs='+', help='proteins list file(s)')
+    args = parser.parse_args()
+    for infile in args.files:
+        print('Compiling index for', infile)
+        outfile = compile_protein_index(infile)
+        print(len(ProteinIndex(outfile)), 'reference proteins written to', outfile)
+
+
+if __name__ == '__main__':
+    main()
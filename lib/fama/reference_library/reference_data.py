@@ -1,7 +1,10 @@
 """Describes ReferenceData class"""
+import os
+import sys
 from collections import defaultdict
 from fama.utils.utils import singleton
 from fama.utils.const import RANKS
+from fama.reference_library.protein_index import ProteinIndex, get_protein_index_path
 
 
 @singleton
@@ -15,7 +18,13 @@ class ReferenceData(object):
         proteins_dict (:obj:'defaultdict'[str,dict[str,str]]): dictionary
             of reference proteins, outer key is protein identifier, inner
             keys are 'taxid' (for taxonomy ID), 'function' (for concatenated
-            function IDs) and 'source' (source DB)
+            function IDs) and 'source' (source DB). If compiled index of
+            proteins list file exists, read-only :obj:'ProteinIndex' is used.
+        protein_functions (dict[str,tuple(str)]): cache of function
+            identifiers for reference proteins. Function identifiers are
+            interned, and all hits to one protein share the same tuple.
+        protein_taxids (dict[str,str]): cache of taxonomy identifiers
+            for reference proteins
     """
 
     def __init__(self, config, collection):
@@ -27,6 +36,8 @@ class ReferenceData(object):
         self.default_ranks_thresholds = config.get_ranks_cutoffs(collection)
         self.functions_dict = defaultdict(dict)
         self.proteins_dict = defaultdict(dict)
+        self.protein_functions = {}
+        self.protein_taxids = {}
         self.load_reference_data(config, collection)
 
     def load_reference_data(self, config, collection):
@@ -62,7 +73,20 @@ class ReferenceData(object):
         print(len(self.functions_dict), ' functions found')
 
     def initialize_proteins_dict(self, infile):
-        """ Reads reference data and populates proteins_dict"""
+        """ Reads reference data and populates proteins_dict.
+
+        If compiled index of the proteins list file exists and is up to date,
+        proteins_dict is replaced with memory-mapped ProteinIndex.
+        """
+        index_file = get_protein_index_path(infile)
+        if os.path.exists(index_file):
+            print('Loading ', index_file)
+            protein_index = ProteinIndex(index_file)
+            if protein_index.is_current(infile):
+                self.proteins_dict = protein_index
+                print(len(self.proteins_dict), ' reference proteins found')
+                return
+            print('Index is older than', infile, 'and will not be used')
         print('Loading ', infile)
         with open(infile, 'r') as file_handle:
             for line in file_handle:
@@ -78,21 +102,31 @@ class ReferenceData(object):
         print(len(self.proteins_dict), ' reference proteins found')
 
     def lookup_protein_function(self, protein):
-        """Returns list of function identifiers assigned to a reference protein"""
-        ret_val = []
+        """Returns tuple of function identifiers assigned to a reference protein"""
         try:
-            ret_val = self.proteins_dict[protein]['function'].split('|')
+            return self.protein_functions[protein]
+        except KeyError:
+            pass
+        try:
+            ret_val = tuple(sys.intern(function) for function
+                            in self.proteins_dict[protein]['function'].split('|'))
         except KeyError:
             # print('Protein', protein, 'not found in reference database. No function reported')
-            ret_val.append('')
+            ret_val = ('',)
+        self.protein_functions[protein] = ret_val
         return ret_val
 
     def lookup_protein_tax(self, protein):
         """Returns taxonomy identifier assigned to a reference protein"""
         ret_val = ''
 #        print('Lookup tax for ', protein)
+        try:
+            return self.protein_taxids[protein]
+        except KeyError:
+            pass
         try:
             ret_val = self.proteins_dict[protein]['taxid']
+            self.protein_taxids[protein] = ret_val
         except KeyError:
             print('Protein not found in reference database', protein, 'Taxonomy ID set to zero')
             ret_val = '0'
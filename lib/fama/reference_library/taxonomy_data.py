@@ -1,4 +1,5 @@
 """Describes TaxonomyData class"""
+from array import array
 from collections import defaultdict
 from fama.utils.const import RANKS, UNKNOWN_TAXONOMY_ID, ROOT_TAXONOMY_ID
 from fama.utils.utils import singleton
@@ -16,6 +17,13 @@ class TaxonomyData(object):
         nodes (defaultdict[str, defaultdict[str,str]]): dictionary
             of taxonomy ranks and parent IDs, external key is taxonomy
             identifier, internal keys are 'rank' and 'parent'
+        node_ids (dict[str,int]): index of each taxon connected to the root
+        taxids (list of str): taxonomy identifier for each index
+        depths (:obj:array): depth of each taxon, root depth is 0
+        ancestors (list of :obj:array): ancestors of each taxon for binary
+            lifting: k-th array contains index of 2^k-th ancestor
+        upper_level_taxa (list of tuple(str, str)): for each taxon,
+            result of get_upper_level_taxon
     """
     def __init__(self, config, collection):
         """Args:
@@ -25,7 +33,13 @@ class TaxonomyData(object):
         self.data = defaultdict(dict)
         self.names = defaultdict(dict)
         self.nodes = defaultdict(dict)
+        self.node_ids = {}
+        self.taxids = []
+        self.depths = array('i')
+        self.ancestors = []
+        self.upper_level_taxa = []
         self.load_taxdata(config, collection)
+        self.index_taxonomy_tree()
 
     def load_taxdata(self, config, collection):
         """Loads taxonomic data from NCBI files"""
@@ -48,6 +62,129 @@ class TaxonomyData(object):
         # make rank of root different from others
         self.data[ROOT_TAXONOMY_ID]['rank'] = 'norank'
 
+    def index_taxonomy_tree(self):
+        """Assigns indexes to all taxa connected to the root and precomputes
+        depths, ancestors for binary lifting and upper level taxa.
+
+        Taxa not connected to the root (or all taxa, if root is not its own
+        parent) are not indexed, and methods fall back to walking
+        the tree by parent identifiers for them.
+        """
+        if self.data[ROOT_TAXONOMY_ID].get('parent') != ROOT_TAXONOMY_ID:
+            return
+        children = defaultdict(list)
+        for taxonomy_id, node in self.data.items():
+            if taxonomy_id != ROOT_TAXONOMY_ID:
+                children[node['parent']].append(taxonomy_id)
+        # Breadth-first traversal: parents are indexed before children
+        taxids = [ROOT_TAXONOMY_ID]
+        parents = [0]
+        depths = [0]
+        node_ids = {ROOT_TAXONOMY_ID: 0}
+        for node_id, taxonomy_id in enumerate(taxids):
+            depth = depths[node_id] + 1
+            for child_id in children[taxonomy_id]:
+                node_ids[child_id] = len(taxids)
+                taxids.append(child_id)
+                parents.append(node_id)
+                depths.append(depth)
+        self.node_ids = node_ids
+        self.taxids = taxids
+        self.depths = array('i', depths)
+        ancestors = array('i', parents)
+        self.ancestors = [ancestors]
+        for _ in range(max(depths).bit_length() - 1):
+            ancestors = array('i', [ancestors[ancestor] for ancestor in ancestors])
+            self.ancestors.append(ancestors)
+
+        # Upper level taxa, as found by get_upper_level_taxon
+        upper_level_taxa = []
+        ranked_taxa = {}
+        for node_id, taxonomy_id in enumerate(taxids):
+            parent_id = self.data[taxonomy_id]['parent']
+            parent_rank = self.data[parent_id]['rank']
+            if parent_id == UNKNOWN_TAXONOMY_ID:
+                upper_level_taxon = (UNKNOWN_TAXONOMY_ID, self.get_rank(UNKNOWN_TAXONOMY_ID))
+            elif taxonomy_id == ROOT_TAXONOMY_ID:
+                upper_level_taxon = (ROOT_TAXONOMY_ID, self.get_rank(ROOT_TAXONOMY_ID))
+            elif parent_rank in RANKS:
+                if parent_id not in ranked_taxa:
+                    ranked_taxa[parent_id] = (parent_id, parent_rank)
+                upper_level_taxon = ranked_taxa[parent_id]
+            else:
+                upper_level_taxon = upper_level_taxa[parents[node_id]]
+            upper_level_taxa.append(upper_level_taxon)
+        self.upper_level_taxa = upper_level_taxa
+
+    def get_ancestor(self, node_id, depth):
+        """Returns index of ancestor of indexed taxon at a given depth
+
+        Args:
+            node_id (int): index of taxon
+            depth (int): depth of ancestor, not greater than depth of taxon
+
+        Returns:
+            node_id (int): index of ancestor
+        """
+        distance = self.depths[node_id] - depth
+        level = 0
+        while distance:
+            if distance & 1:
+                node_id = self.ancestors[level][node_id]
+            distance >>= 1
+            level += 1
+        return node_id
+
+    def get_common_ancestor(self, node_id, other_node_id):
+        """Returns index of the lowest common ancestor of two indexed taxa"""
+        if self.depths[node_id] > self.depths[other_node_id]:
+            node_id = self.get_ancestor(node_id, self.depths[other_node_id])
+        elif self.depths[node_id] < self.depths[other_node_id]:
+            other_node_id = self.get_ancestor(other_node_id, self.depths[node_id])
+        if node_id == other_node_id:
+            return node_id
+        for ancestors in reversed(self.ancestors):
+            if ancestors[node_id] != ancestors[other_node_id]:
+                node_id = ancestors[node_id]
+                other_node_id = ancestors[other_node_id]
+        return self.ancestors[0][node_id]
+
+    def get_lineage_node(self, node_id, position):
+        """Returns taxonomy identifier at a given position of the lineage
+        built by get_lca for indexed taxon. Lineages start from a child
+        of the root, except taxa at depth 0 and 1 that have lineage
+        [root, taxon].
+        """
+        if self.depths[node_id] > 1:
+            return self.taxids[self.get_ancestor(node_id, position + 1)]
+        if position == 0:
+            return ROOT_TAXONOMY_ID
+        return self.taxids[node_id]
+
+    def get_lca_indexed(self, node_ids):
+        """Returns the same result as get_lca for a non-empty list of indexes
+        of existing taxa"""
+        if all(self.depths[node_id] > 1 for node_id in node_ids):
+            lca_id = node_ids[0]
+            for node_id in node_ids[1:]:
+                lca_id = self.get_common_ancestor(lca_id, node_id)
+                if lca_id == 0:
+                    break
+            if lca_id == 0:
+                # top-level LCA is Unknown, not root
+                return UNKNOWN_TAXONOMY_ID
+            return self.taxids[lca_id]
+        # Lineages of taxa at depth 0 and 1 do not start from the same level
+        # as other lineages, so lineages are compared by position. Their
+        # length is 2, so only two first positions are compared.
+        result = UNKNOWN_TAXONOMY_ID
+        for position in range(2):
+            lineage_nodes = set(self.get_lineage_node(node_id, position) for node_id in node_ids)
+            if len(lineage_nodes) > 1:
+                break
+            result = lineage_nodes.pop()
+        return result
+
     def is_exist(self, taxonomy_id):
         """ Checks if taxonomy identifier exists in taxonomy data)
 
@@ -145,6 +282,13 @@ class TaxonomyData(object):
             # if taxonomy_id_list is empty or contains only Unknowns:
             return result
 
+        node_ids = [self.node_ids.get(taxonomy_id) for taxonomy_id in taxonomy_id_list
+                    if self.is_exist(taxonomy_id)]
+        if not node_ids:
+            return result
+        if None not in node_ids:
+            return self.get_lca_indexed(node_ids)
+
         taxonomic_lineages = {}
         # Calculate length of the shortest path in taxonomic subtree
         min_depth = 1000
@@ -242,6 +386,10 @@ class TaxonomyData(object):
         Returns:
             result (tuple(str, str)): LCA taxonomy dentifier and LCA rank
         """
+        try:
+            return self.upper_level_taxa[self.node_ids[taxonomy_id]]
+        except KeyError:
+            pass
         result = (UNKNOWN_TAXONOMY_ID, self.get_rank(UNKNOWN_TAXONOMY_ID))
         if not self.is_exist(taxonomy_id):
             return result
@@ -1,43 +1,56 @@
 """Runs Fama functional profiling pipeline"""
 import os
+import io
+import time
+import threading
+import multiprocessing
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
 
 from fama.utils.const import ENDS, STATUS_GOOD
-from fama.utils.utils import run_external_program
+from fama.utils.utils import run_external_program, open_external_program_output
+from fama.utils.gzip_io import open_input_file
+from fama.utils.scheduler import TaskScheduler
+from fama.utils.ags_cache import AgsCache
 from fama.project.sample import Sample
 from fama.diamond_parser.diamond_parser import DiamondParser
 from fama.output.report import generate_fastq_report, generate_sample_report
 from fama.output.pdf_report import generate_pdf_report
 from fama.output.krona_xml_writer import make_functions_chart
-from fama.output.json_util import export_annotated_reads, export_sample
+from fama.output.json_util import export_sample
+from fama.output.npz_util import export_annotated_reads
 from fama.third_party.microbe_census import run_pipeline, report_results
+from fama.third_party.microbe_census import __version__ as microbecensus_version
 
+# Separates index of sequence file from sequence identifier in batch DIAMOND search
+BATCH_TAG_SEPARATOR = '|'
+# Project of sample reports generated in worker processes
+_REPORT_PROJECT = None
 
-def run_ref_search(parser, command, options=None):
-    """Runs pre-selection DIAMOND search
+
+def get_ref_search_args(parser, command, options=None, query_from_stdin=False):
+    """Returns arguments of pre-selection DIAMOND search, except output file
 
     Args:
         parser (:obj:DiamondParser): parser object processing an input sequence file
         command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+        options (list of str, optional): additional DIAMOND options
+        query_from_stdin (bool): if True, DIAMOND reads query sequences
+            from stdin instead of input sequence file
     """
-    print('Starting DIAMOND')
     diamond_args = [parser.config.diamond_path,
                     command]
     if options is not None:
         diamond_args = diamond_args + options
+    if not query_from_stdin:
+        diamond_args = diamond_args + ['--query',
+                                       parser.options.get_fastq_path(
+                                           parser.sample.sample_id, parser.end
+                                       )]
     diamond_args = diamond_args + ['--db',
                                    parser.config.get_reference_diamond_db(
                                        parser.options.get_collection(parser.sample.sample_id)
                                    ),
-                                   '--query',
-                                   parser.options.get_fastq_path(
-                                       parser.sample.sample_id, parser.end
-                                   ),
-                                   '--out',
-                                   os.path.join(
-                                       parser.options.get_project_dir(parser.sample.sample_id),
-                                       parser.sample.sample_id + '_' + parser.end + '_'
-                                       + parser.options.ref_output_name
-                                   ),
                                    '--max-target-seqs',
                                    '50',
                                    '--evalue',
@@ -47,38 +60,36 @@ def run_ref_search(parser, command, options=None):
                                    '--outfmt', '6', 'qseqid', 'sseqid', 'pident', 'length',
                                    'mismatch', 'slen', 'qstart', 'qend', 'sstart', 'send',
                                    'evalue', 'bitscore']
-    run_external_program(diamond_args)
-    print('DIAMOND finished')
+    return diamond_args
 
 
-def run_bgr_search(parser, command, options=None):
-    """Runs classification DIAMOND search
+def get_bgr_search_args(parser, command, options=None, query_from_stdin=False):
+    """Returns arguments of classification DIAMOND search, except output file
 
     Args:
         parser (:obj:DiamondParser): parser object processing an input sequence file
         command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+        options (list of str, optional): additional DIAMOND options
+        query_from_stdin (bool): if True, DIAMOND reads query sequences
+            from stdin instead of hits file
     """
-    print('Starting DIAMOND')
     diamond_args = [parser.config.diamond_path,
                     command]
     if options is not None:
         diamond_args = diamond_args + options
+    if not query_from_stdin:
+        diamond_args = diamond_args + ['--query',
+                                       os.path.join(
+                                           parser.options.get_project_dir(
+                                               parser.sample.sample_id
+                                           ),
+                                           parser.sample.sample_id + '_' + parser.end + '_'
+                                           + parser.options.ref_hits_fastq_name
+                                       )]
     diamond_args = diamond_args + ['--db',
                                    parser.config.get_background_diamond_db(
                                        parser.options.get_collection(parser.sample.sample_id)
                                    ),
-                                   '--query',
-                                   os.path.join(
-                                       parser.options.get_project_dir(parser.sample.sample_id),
-                                       parser.sample.sample_id + '_' + parser.end + '_'
-                                       + parser.options.ref_hits_fastq_name
-                                   ),
-                                   '--out',
-                                   os.path.join(
-                                       parser.options.get_project_dir(parser.sample.sample_id),
-                                       parser.sample.sample_id + '_' + parser.end + '_'
-                                       + parser.options.background_output_name
-                                   ),
                                    '--max-target-seqs',
                                    '100',
                                    '--evalue',
@@ -93,17 +104,307 @@ def run_bgr_search(parser, command, options=None):
                                    '--outfmt', '6', 'qseqid', 'sseqid', 'pident', 'length',
                                    'mismatch', 'slen', 'qstart', 'qend', 'sstart', 'send',
                                    'evalue', 'bitscore']
-    run_external_program(diamond_args)
+    return diamond_args
+
+
+def get_ref_output_path(parser):
+    """Returns path to output file of pre-selection DIAMOND search"""
+    return os.path.join(
+        parser.options.get_project_dir(parser.sample.sample_id),
+        parser.sample.sample_id + '_' + parser.end + '_' + parser.options.ref_output_name
+    )
+
+
+def get_bgr_output_path(parser):
+    """Returns path to output file of classification DIAMOND search"""
+    return os.path.join(
+        parser.options.get_project_dir(parser.sample.sample_id),
+        parser.sample.sample_id + '_' + parser.end + '_' + parser.options.background_output_name
+    )
+
+
+def run_ref_search(parser, command, options=None):
+    """Runs pre-selection DIAMOND search
+
+    Args:
+        parser (:obj:DiamondParser): parser object processing an input sequence file
+        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+    """
+    print('Starting DIAMOND')
+    run_external_program(get_ref_search_args(parser, command, options)
+                         + ['--out', get_ref_output_path(parser)])
+    print('DIAMOND finished')
+
+
+def run_bgr_search(parser, command, options=None):
+    """Runs classification DIAMOND search
+
+    Args:
+        parser (:obj:DiamondParser): parser object processing an input sequence file
+        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+    """
+    print('Starting DIAMOND')
+    run_external_program(get_bgr_search_args(parser, command, options)
+                         + ['--out', get_bgr_output_path(parser)])
     print('DIAMOND finished')
 
 
-def run_microbecensus(sample, config):
-    """Runs MicrobeCensus
+def search_reference_db(parser, command, options=None):
+    """Runs pre-selection DIAMOND search, if its output file does not
+    exist, and processes search results.
+
+    If stream_diamond_output is set in program config, DIAMOND output
+    is parsed while search is running. Output file is written only if
+    keep_diamond_output is set.
+
+    Args:
+        parser (:obj:DiamondParser): parser object processing an input sequence file
+        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+        options (list of str, optional): additional DIAMOND options
+    """
+    outfile = get_ref_output_path(parser)
+    if os.path.exists(outfile):
+        parser.parse_reference_output()
+    elif parser.config.stream_diamond_output:
+        print('Starting DIAMOND')
+        with open_external_program_output(
+                get_ref_search_args(parser, command, options),
+                outfile if parser.config.keep_diamond_output else None
+        ) as diamond_output:
+            parser.parse_reference_output(diamond_output)
+        print('DIAMOND finished')
+    else:
+        run_ref_search(parser, command, options)
+        parser.parse_reference_output()
+
+
+def search_background_db(parser, command, options=None):
+    """Exports hits of pre-selection search and runs classification
+    DIAMOND search, if its output file does not exist. Then processes
+    search results.
+
+    If stream_diamond_output is set in program config, sequences of hits
+    are sent to DIAMOND through stdin, and DIAMOND output is parsed while
+    search is running. Output file is written only if keep_diamond_output
+    is set. Otherwise, hits are exported into file before the search.
+
+    Args:
+        parser (:obj:DiamondParser): parser object processing an input sequence file
+        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+        options (list of str, optional): additional DIAMOND options
+    """
+    outfile = get_bgr_output_path(parser)
+    if os.path.exists(outfile):
+        parser.parse_background_output()
+    elif parser.config.stream_diamond_output:
+        # list of hits must be ready before parsing starts
+        parser.hit_segments = parser.get_hit_segments()
+        parser.save_hit_segments_checksum(outfile)
+        print('Starting DIAMOND')
+        with open_external_program_output(
+                get_bgr_search_args(parser, command, options, query_from_stdin=True),
+                outfile if parser.config.keep_diamond_output else None,
+                input_function=parser.export_hit_segments
+        ) as diamond_output:
+            parser.parse_background_output(tsvfile=diamond_output)
+        print('DIAMOND finished')
+    else:
+        parser.export_hit_segments()
+        parser.save_hit_segments_checksum(outfile)
+        run_bgr_search(parser, command, options)
+        parser.parse_background_output()
+
+
+def group_parsers_by_collection(parsers):
+    """Groups DiamondParser objects by reference collection
+
+    Returns:
+        dict[str, :obj:'list' of :obj:DiamondParser]: parsers for each collection
+    """
+    result = {}
+    for parser in parsers:
+        result.setdefault(parser.collection, []).append(parser)
+    return result
+
+
+def run_batch_search(diamond_args, input_function, outfiles):
+    """Runs one DIAMOND search for query sequences of several files and
+    splits its output into separate files.
+
+    Query identifiers must start with index of output file followed by
+    BATCH_TAG_SEPARATOR. This prefix is removed from DIAMOND output.
+    Output files appear only after DIAMOND finished successfully.
+
+    Args:
+        diamond_args (list of str): DIAMOND command reading queries from stdin
+        input_function (function): function that takes text file object
+            and writes query sequences with tagged identifiers into it
+        outfiles (list of str): paths to output files
+    """
+    temp_files = [outfile + '.tmp' for outfile in outfiles]
+    handles = [open(temp_file, 'wb') for temp_file in temp_files]
+    separator = BATCH_TAG_SEPARATOR.encode('utf8')
+    success = False
+    try:
+        print('Starting DIAMOND for', len(outfiles), 'sequence files')
+        with open_external_program_output(diamond_args,
+                                          input_function=input_function) as diamond_output:
+            for line in diamond_output:
+                tag, _, line = line.partition(separator)
+                handles[int(tag)].write(line)
+        print('DIAMOND finished')
+        success = True
+    finally:
+        for handle in handles:
+            handle.close()
+        for temp_file, outfile in zip(temp_files, outfiles):
+            if success:
+                os.replace(temp_file, outfile)
+            else:
+                os.remove(temp_file)
+
+
+def batch_reference_search(parsers, command, options=None):
+    """Runs one pre-selection DIAMOND search for input sequence files of
+    all parsers of each collection, unless their output files exist.
+    Then search results can be processed separately for each file.
+
+    Args:
+        parsers (:obj:'list' of :obj:DiamondParser): parser objects
+            processing input sequence files
+        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+        options (list of str, optional): additional DIAMOND options
+    """
+    parsers = [parser for parser in parsers if not os.path.exists(get_ref_output_path(parser))]
+    for collection_parsers in group_parsers_by_collection(parsers).values():
+        def write_queries(outfile, collection_parsers=collection_parsers):
+            """Writes sequences from all input files with tagged identifiers"""
+            for tag, parser in enumerate(collection_parsers):
+                prefix = str(tag) + BATCH_TAG_SEPARATOR
+                fastq_path = parser.options.get_fastq_path(parser.sample.sample_id, parser.end)
+                with open_input_file(fastq_path, 'rt', int(parser.config.threads)) as infile:
+                    for line_counter, line in enumerate(infile):
+                        if not line.endswith('\n'):
+                            line += '\n'
+                        if line_counter % 4 == 0:
+                            # sequence identifier line
+                            line = line[0] + prefix + line[1:]
+                        outfile.write(line)
+        run_batch_search(get_ref_search_args(collection_parsers[0], command, options,
+                                             query_from_stdin=True),
+                         write_queries,
+                         [get_ref_output_path(parser) for parser in collection_parsers])
+
+
+def batch_background_search(parsers, command, options=None):
+    """Runs one classification DIAMOND search for hits of all parsers of
+    each collection, unless their output files exist. Then search results
+    can be processed separately for each parser.
+
+    Args:
+        parsers (:obj:'list' of :obj:DiamondParser): parser objects with
+            results of pre-selection search
+        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+        options (list of str, optional): additional DIAMOND options
+    """
+    parsers = [parser for parser in parsers if not os.path.exists(get_bgr_output_path(parser))]
+    for parser in parsers:
+        parser.save_hit_segments_checksum(get_bgr_output_path(parser))
+    for collection_parsers in group_parsers_by_collection(parsers).values():
+        def write_queries(outfile, collection_parsers=collection_parsers):
+            """Writes hits of all parsers with tagged identifiers"""
+            for tag, parser in enumerate(collection_parsers):
+                parser.export_hit_segments(outfile, str(tag) + BATCH_TAG_SEPARATOR)
+        run_batch_search(get_bgr_search_args(collection_parsers[0], command, options,
+                                             query_from_stdin=True),
+                         write_queries,
+                         [get_bgr_output_path(parser) for parser in collection_parsers])
+
+
+def get_sample_scheduler(config):
+    """Creates TaskScheduler for processing of several samples at the
+    same time within CPU and memory budget from program config.
+
+    One DIAMOND run may use all CPUs, except one CPU for Python code of
+    each other sample in progress. If memory limit is set, number of
+    samples in progress is limited by memory reserved for each sample.
+
+    Args:
+        config (:obj:ProgramConfig): program configuration object
+
+    Returns:
+        scheduler (:obj:TaskScheduler): task scheduler
+        diamond_threads (int): number of threads for one DIAMOND run
+    """
+    threads = int(config.threads)
+    max_samples = max(1, config.max_parallel_samples)
+    memory = config.memory_limit
+    if memory > 0.0 and config.sample_memory > 0.0:
+        max_samples = max(1, min(max_samples, int((memory - config.diamond_memory)
+                                                  // config.sample_memory)))
+        memory = max(config.diamond_memory, memory - max_samples * config.sample_memory)
+    diamond_threads = max(1, threads - max_samples + 1)
+    return TaskScheduler(threads, memory, max_samples), diamond_threads
+
+
+def prepare_reference_output(parser, command, options=None):
+    """Runs pre-selection DIAMOND search, if its output file does not exist
+
+    Args:
+        parser (:obj:DiamondParser): parser object processing an input sequence file
+        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+        options (list of str, optional): additional DIAMOND options
+    """
+    if not os.path.exists(get_ref_output_path(parser)):
+        run_ref_search(parser, command, options)
+
+
+def prepare_background_output(parser, command, options=None):
+    """Exports hits and runs classification DIAMOND search, if any hits
+    were found and output file of the search does not exist
+
+    Args:
+        parser (:obj:DiamondParser): parser object with hits found
+        command (str): either 'blastx' or 'blastp' (see DIAMOND manual)
+        options (list of str, optional): additional DIAMOND options
+    """
+    if parser.reads and not os.path.exists(get_bgr_output_path(parser)):
+        parser.export_hit_segments()
+        parser.save_hit_segments_checksum(get_bgr_output_path(parser))
+        run_bgr_search(parser, command, options)
+
+
+def count_fastq_reads(fastq_file, threads=1):
+    """Counts entries in uncompressed or gzipped FASTQ file in the same
+    way as DiamondParser.import_fastq does
+
+    Args:
+        fastq_file (str): path to FASTQ file
+        threads (int, optional): number of threads for decompression
+
+    Returns:
+        int: number of reads
+    """
+    line_count = 0
+    with open_input_file(fastq_file, 'rb', threads) as infile_handle:
+        for _ in infile_handle:
+            line_count += 1
+    # each FASTQ entry has exactly four lines
+    return (line_count + 3) // 4
+
+
+def run_microbecensus(sample, config, read_count=None):
+    """Runs MicrobeCensus. If MicrobeCensus cache directory is configured,
+    reuses results of previous run for the same sequence files.
 
     Args:
         sample (:obj:Sample): sample analyzed
         config (:obj:ProgramConfig): program configuration object
+        read_count (int, optional): number of reads in forward end FASTQ
+            file. By default, fastq_fwd_readcount of the sample is used.
     """
+    if read_count is None:
+        read_count = sample.fastq_fwd_readcount
     args = {}
     if sample.is_paired_end:
         args['seqfiles'] = [sample.fastq_fwd_path, sample.fastq_rev_path]
@@ -115,17 +416,136 @@ def run_microbecensus(sample, config):
     args['outfile'] = os.path.join(sample.work_directory, 'microbecensus.out.txt')
     args['threads'] = int(config.threads)
     args['no_equivs'] = True
-    if sample.fastq_fwd_readcount < 1500000:
+    if read_count < 1500000:
         # MicrobeCensus subsamples 2M reads by default, but sequence library
         # must have more reads as some reads are always discarded by filtering
-        args['nreads'] = sample.fastq_fwd_readcount // 2
-    elif sample.fastq_fwd_readcount < 3000000:
-        args['nreads'] = sample.fastq_fwd_readcount - 1000000
+        args['nreads'] = read_count // 2
+    elif read_count < 3000000:
+        args['nreads'] = read_count - 1000000
     else:
         args['nreads'] = 2000000
     print(args)
+    cache = None
+    if config.microbecensus_cache_dir:
+        cache = AgsCache(config.microbecensus_cache_dir,
+                         config.microbecensus_cache_max_age,
+                         config.microbecensus_cache_max_size)
+        cache_key = cache.get_key(args['seqfiles'],
+                                  {'nreads': args['nreads'],
+                                   'data_dir': args['data_dir'],
+                                   'no_equivs': args['no_equivs'],
+                                   'version': microbecensus_version})
+        if cache.load(cache_key, args['outfile']):
+            print('Average genome size found in cache')
+            return
     est_ags, args = run_pipeline(args)
     report_results(args, est_ags, None)
+    if cache is not None and est_ags:
+        cache.store(cache_key, args['outfile'])
+
+
+def needs_microbecensus(sample):
+    """Returns True if average genome size for the sample is neither
+    known from project options nor estimated by previous MicrobeCensus run
+    """
+    return sample.rpkg_scaling_factor == 0.0 and not os.path.exists(
+        os.path.join(sample.work_directory, 'microbecensus.out.txt')
+    )
+
+
+def estimate_average_genome_size(sample, config):
+    """Runs MicrobeCensus for a sample. If number of reads in the sample
+    is not known yet, counts reads in forward end FASTQ file first.
+
+    Args:
+        sample (:obj:Sample): sample analyzed
+        config (:obj:ProgramConfig): program configuration object
+    """
+    read_count = sample.fastq_fwd_readcount
+    if read_count == 0:
+        read_count = count_fastq_reads(sample.fastq_fwd_path, int(config.threads))
+    run_microbecensus(sample, config, read_count)
+
+
+def start_microbecensus(sample, config):
+    """Starts MicrobeCensus in background thread, if average genome size
+    for the sample is not known yet. Sample.import_rpkg_scaling_factor
+    waits for the background run to finish.
+
+    Args:
+        sample (:obj:Sample): sample analyzed
+        config (:obj:ProgramConfig): program configuration object
+
+    Returns:
+        bool: True if MicrobeCensus was started
+    """
+    if not needs_microbecensus(sample):
+        return False
+    executor = ThreadPoolExecutor(max_workers=1)
+    sample.microbecensus_task = executor.submit(estimate_average_genome_size, sample, config)
+    executor.shutdown(wait=False)
+    return True
+
+
+def _generate_sample_report(task):
+    """Generates report files for one sample in a worker process.
+
+    Args:
+        task (tuple(str, str)): sample identifier and scoring metric
+
+    Returns:
+        sample_id (str): sample identifier
+        output (str): messages printed during report generation
+        elapsed (float): report generation time, in seconds
+    """
+    sample_id, metric = task
+    start_time = time.time()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        generate_sample_report(_REPORT_PROJECT, sample_id, metric=metric)
+    return sample_id, output.getvalue(), time.time() - start_time
+
+
+def generate_sample_reports(project, sample_ids, metric=None):
+    """Generates report files for several samples and prints timing summary.
+
+    Reports are generated in up to config.threads worker processes forked
+    from current process, so they share all loaded data. Each sample
+    writes its own files, and messages of samples are printed in order of
+    sample_ids. If other threads are running, reports are generated one
+    by one, because forking a multi-threaded process is not safe.
+
+    Args:
+        project (:obj:Project): current project
+        sample_ids (list of str): sample identifiers
+        metric (str, optional): scoring metric
+    """
+    start_time = time.time()
+    timings = []
+    processes = min(int(project.config.threads), len(sample_ids))
+    if processes > 1 and threading.active_count() == 1 \
+            and 'fork' in multiprocessing.get_all_start_methods():
+        global _REPORT_PROJECT
+        _REPORT_PROJECT = project
+        try:
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                for sample_id, output, elapsed in pool.imap(
+                        _generate_sample_report, [(sample_id, metric) for sample_id in sample_ids]
+                ):
+                    print(output, end='')
+                    timings.append((sample_id, elapsed))
+        finally:
+            _REPORT_PROJECT = None
+    else:
+        processes = 1
+        for sample_id in sample_ids:
+            sample_start_time = time.time()
+            generate_sample_report(project, sample_id, metric=metric)
+            timings.append((sample_id, time.time() - sample_start_time))
+    print('Sample reports generated in', format(time.time() - start_time, '0.1f'), 's',
+          '(' + str(len(sample_ids)), 'samples,', processes, 'processes)')
+    for sample_id, elapsed in timings:
+        print('\t' + sample_id + ':\t' + format(elapsed, '0.1f') + ' s')
 
 
 def fastq_pipeline(project, sample_identifier=None, end_identifier=None):
@@ -136,9 +556,20 @@ def fastq_pipeline(project, sample_identifier=None, end_identifier=None):
         sample_identifier (str, optional): sample identifier
         end_identifier (str, optional): end identifier
     """
+    if project.config.batch_diamond_search:
+        run_batch_fastq_pipeline(project, sample_identifier, end_identifier)
+    elif project.config.max_parallel_samples > 1:
+        run_parallel_fastq_pipeline(project, sample_identifier, end_identifier)
     for sample_id in project.list_samples():
         if sample_identifier and sample_identifier != sample_id:
             continue
+        if project.config.batch_diamond_search or project.config.max_parallel_samples > 1:
+            # already processed
+            export_sample(project.samples[sample_id])
+            if end_identifier is None:
+                project.export_score_table(sample_id)
+            project.options.set_sample_data(project.samples[sample_id])
+            continue
         sample = Sample(sample_id)
         sample.load_sample(project.options)
         project.samples[sample_id] = sample
@@ -152,8 +583,13 @@ def fastq_pipeline(project, sample_identifier=None, end_identifier=None):
                                    sample=project.samples[sample_id],
                                    end_id=end)
         export_sample(project.samples[sample_id])
+        if end_identifier is None:
+            project.export_score_table(sample_id)
         project.options.set_sample_data(project.samples[sample_id])
 
+    if sample_identifier is not None:
+        # Other samples are needed for metric selection and project report
+        project.load_missing_samples()
     metric = None
     for sample_id in project.list_samples():
         if project.is_paired_end():
@@ -166,13 +602,21 @@ def fastq_pipeline(project, sample_identifier=None, end_identifier=None):
             for sample_id in project.list_samples():
                 if project.samples[sample_id].rpkg_scaling_factor == 0.0:
                     metric = 'readcount'
-    # Generate output for all samples
-    for sample_id in project.list_samples():
-        generate_sample_report(project, sample_id, metric=metric)
+    # Generate output for processed samples
+    generate_sample_reports(
+        project,
+        [sample_id for sample_id in project.list_samples()
+         if not sample_identifier or sample_identifier == sample_id],
+        metric=metric
+    )
 
     # Generate output for the project
     if sample_identifier is None:
-        # Skip project report if the pipeline is running for only one sample
+        project.generate_report()
+    elif end_identifier is None and all(
+            project.has_score_data(sample_id) for sample_id in project.list_samples()
+    ):
+        # Project report for one new sample uses saved scores of other samples
         project.generate_report()
 
     # Rename existing project file and save current version
@@ -180,6 +624,121 @@ def fastq_pipeline(project, sample_identifier=None, end_identifier=None):
     return project
 
 
+def run_batch_fastq_pipeline(project, sample_identifier=None, end_identifier=None):
+    """Functional profiling pipeline for all FASTQ files of the project
+    with one DIAMOND search per collection for all files. Results of
+    pre-selection search for all files are kept in memory until
+    classification search is finished.
+
+    Args:
+        project (:obj:Project): current project
+        sample_identifier (str, optional): sample identifier
+        end_identifier (str, optional): end identifier
+    """
+    parsers = []
+    for sample_id in project.list_samples():
+        if sample_identifier and sample_identifier != sample_id:
+            continue
+        sample = Sample(sample_id)
+        sample.load_sample(project.options)
+        project.samples[sample_id] = sample
+        for end in ENDS:
+            if end_identifier is not None and end != end_identifier:
+                continue
+            if end == 'pe2':
+                continue
+            parsers.append(DiamondParser(config=project.config,
+                                         options=project.options,
+                                         taxonomy_data=project.taxonomy_data,
+                                         ref_data=project.ref_data,
+                                         sample=sample,
+                                         end=end))
+    for parser in parsers:
+        if not os.path.isdir(project.options.get_project_dir(parser.sample.sample_id)):
+            os.makedirs(project.options.get_project_dir(parser.sample.sample_id), exist_ok=True)
+    batch_reference_search(parsers, 'blastx')
+    parsers = [prepare_fastq_pipeline(project, parser.sample, parser.end) for parser in parsers]
+    batch_background_search([parser for parser in parsers if parser.reads], 'blastx')
+    for parser in parsers:
+        parser.sample.reads[parser.end] = finish_fastq_pipeline(parser) if parser.reads else {}
+
+
+def run_parallel_fastq_pipeline(project, sample_identifier=None, end_identifier=None):
+    """Functional profiling pipeline for all FASTQ files of the project,
+    which processes several samples at the same time. DIAMOND searches
+    write output files, which are processed in separate tasks, so
+    DIAMOND search for one sample runs along with processing of another.
+
+    Args:
+        project (:obj:Project): current project
+        sample_identifier (str, optional): sample identifier
+        end_identifier (str, optional): end identifier
+    """
+    scheduler, diamond_threads = get_sample_scheduler(project.config)
+    diamond_options = ['--threads', str(diamond_threads)]
+
+    def import_reads(sample, end, parsers):
+        parsers.append(prepare_fastq_pipeline(project, sample, end))
+
+    def search_background(parsers):
+        prepare_background_output(parsers[0], 'blastx', diamond_options)
+
+    def classify_reads(parsers):
+        parser = parsers[0]
+        parser.sample.reads[parser.end] = finish_fastq_pipeline(parser) if parser.reads else {}
+
+    for sample_id in project.list_samples():
+        if sample_identifier and sample_identifier != sample_id:
+            continue
+        sample = Sample(sample_id)
+        sample.load_sample(project.options)
+        project.samples[sample_id] = sample
+        if not os.path.isdir(project.options.get_project_dir(sample_id)):
+            os.makedirs(project.options.get_project_dir(sample_id), exist_ok=True)
+        for end in ENDS:
+            if end_identifier is not None and end != end_identifier:
+                continue
+            if end == 'pe2':
+                continue
+            parser = DiamondParser(config=project.config,
+                                   options=project.options,
+                                   taxonomy_data=project.taxonomy_data,
+                                   ref_data=project.ref_data,
+                                   sample=sample,
+                                   end=end)
+            # holds parser created by prepare_fastq_pipeline
+            parsers = []
+            task_name = sample_id + ' ' + end
+            task = scheduler.add_task(task_name + ' reference DB search',
+                                      prepare_reference_output,
+                                      (parser, 'blastx', diamond_options),
+                                      cpus=diamond_threads,
+                                      memory=project.config.diamond_memory,
+                                      group=sample_id)
+            dependencies = [task]
+            if end == ENDS[0] and needs_microbecensus(sample):
+                # MicrobeCensus runs DIAMOND along with reference DB search
+                dependencies.append(scheduler.add_task(sample_id + ' MicrobeCensus',
+                                                       estimate_average_genome_size,
+                                                       (sample, project.config),
+                                                       cpus=diamond_threads,
+                                                       memory=project.config.diamond_memory,
+                                                       group=sample_id))
+            task = scheduler.add_task(task_name + ' reads import', import_reads,
+                                      (sample, end, parsers),
+                                      dependencies=dependencies,
+                                      group=sample_id)
+            task = scheduler.add_task(task_name + ' background DB search', search_background,
+                                      (parsers,),
+                                      dependencies=[task],
+                                      cpus=diamond_threads,
+                                      memory=project.config.diamond_memory,
+                                      group=sample_id)
+            scheduler.add_task(task_name + ' output', classify_reads, (parsers,),
+                               dependencies=[task], group=sample_id)
+    scheduler.run()
+
+
 def run_fastq_pipeline(project, sample, end_id):
     """Functional profiling pipeline for single FASTQ file processing
 
@@ -188,6 +747,25 @@ def run_fastq_pipeline(project, sample, end_id):
         sample (:obj:Sample): current sample
         end_id (str): end identifier
     """
+    parser = prepare_fastq_pipeline(project, sample, end_id)
+    if not parser.reads:
+        # No hits found
+        return {}
+    return finish_fastq_pipeline(parser)
+
+
+def prepare_fastq_pipeline(project, sample, end_id):
+    """First part of functional profiling pipeline for single FASTQ file:
+    processing of reference DB search results and import of reads
+
+    Args:
+        project (:obj:Project): current project
+        sample (:obj:Sample): current sample
+        end_id (str): end identifier
+
+    Returns:
+        :obj:DiamondParser: parser object with hits found
+    """
     parser = DiamondParser(config=project.config,
                            options=project.options,
                            taxonomy_data=project.taxonomy_data,
@@ -202,17 +780,11 @@ def run_fastq_pipeline(project, sample, end_id):
         os.mkdir(os.path.join(project.options.get_project_dir(sample.sample_id),
                               project.options.get_output_subdir(sample.sample_id)))
 
-    # Search in reference database
-    if not os.path.exists(
-            os.path.join(
-                parser.options.get_project_dir(parser.sample.sample_id),
-                parser.sample.sample_id + '_' + parser.end + '_' + parser.options.ref_output_name
-            )
-    ):
-        run_ref_search(parser, 'blastx')
+    # Estimate average genome size while DIAMOND output and reads are processed
+    microbecensus_started = start_microbecensus(sample, project.config)
 
-    # Process output of reference DB search
-    parser.parse_reference_output()
+    # Search in reference database and process output
+    search_reference_db(parser, 'blastx')
 
     # Import sequence data for selected sequence reads
     print('Reading FASTQ file')
@@ -232,32 +804,30 @@ def run_fastq_pipeline(project, sample, end_id):
 
     if sample.rpkg_scaling_factor == 0.0:
         sample.import_rpkg_scaling_factor()
-    if sample.rpkg_scaling_factor == 0.0:
+    if sample.rpkg_scaling_factor == 0.0 and not microbecensus_started:
         run_microbecensus(sample=sample, config=project.config)
         sample.import_rpkg_scaling_factor()
     project.options.set_sample_data(sample)
 
-    if not parser.reads:
-        # No hits found
-        return {}
+    if parser.reads:
+        print('Exporting hits')
+        parser.export_hit_list()
+    return parser
 
-    print('Exporting FASTQ ')
-    parser.export_hit_fastq()
-    print('Exporting hits')
-    parser.export_hit_list()
-
-    # Search in background database
-    if not os.path.exists(
-            os.path.join(
-                parser.options.get_project_dir(parser.sample.sample_id),
-                parser.sample.sample_id + '_' + parser.end + '_'
-                + parser.options.background_output_name
-            )
-    ):
-        run_bgr_search(parser, 'blastx')
 
-    # Process output of background DB search
-    parser.parse_background_output()
+def finish_fastq_pipeline(parser):
+    """Second part of functional profiling pipeline for single FASTQ file:
+    classification of hits found in reference DB search and output
+
+    Args:
+        parser (:obj:DiamondParser): parser object returned by prepare_fastq_pipeline
+
+    Returns:
+        dict[str, :obj:AnnotatedRead]: reads with functions assigned
+    """
+    sample = parser.sample
+    # Search in background database and process output
+    search_background_db(parser, 'blastx')
 
     parser.export_read_fastq()
     if sample.is_paired_end:
@@ -23,7 +23,13 @@ class AnnotatedRead(object):
         self.pe_quality (str): For FASTQ entry, this is the entire fourth line of paired end
         self.pe_line3 (str): For FASTQ entry, this is the entire third line of paired end
         self.taxonomy (str): NCBI Taxonomy ID set by LCA algorithm
+
+    Note: AnnotatedRead uses __slots__ to keep memory footprint small.
     """
+    __slots__ = ('read_id', 'read_id_line', 'sequence', 'quality', 'line3',
+                 'hit_list', 'status', 'functions', 'pe_id', 'pe_sequence',
+                 'pe_quality', 'pe_line3', 'taxonomy')
+
     def __init__(self, read_id=None):
         """
         Args:
@@ -287,6 +287,14 @@ class TaxonomyProfile(object):
             ret_val = ''
         return ret_val
 
+    def get_function_list(self):
+        """Returns set of function identifiers in node attributes"""
+        function_list = set()
+        for taxid in self.tree.data:
+            for function in self.tree.data[taxid].attributes.keys():
+                function_list.add(function)
+        return function_list
+
     def convert_profile_into_df(self, metric='rpkm'):
         """Converts functional-taxonomic profile into pandas DataFrame object
 
@@ -297,21 +305,29 @@ class TaxonomyProfile(object):
             result (pd.DataFrame): functional-taxonomic profile as pandas
                 DataFrame object
         """
-        function_list = set()
-        for taxid in self.tree.data:
-            for function in self.tree.data[taxid].attributes.keys():
-                function_list.add(function)
-        root_id = ROOT_TAXONOMY_ID
-        line_number = 1
-        tax_dict, _ = self.convert_node_into_dict(
-            root_id, function_list, line_number, metric=metric
-            )
-        result = pd.DataFrame(tax_dict)
+        result = pd.DataFrame(dict(self.generate_profile_rows(metric=metric)))
         result = result.transpose()
         return result
 
-    def convert_node_into_dict(self, taxid, function_list, line_number, metric='rpkm'):
-        """Returns node of functional-taxonomic profile for conversion into DataFrame.
+    def generate_profile_rows(self, metric='rpkm'):
+        """Generates rows of functional-taxonomic profile table, one row
+        per node, top-down depth-first
+
+        Args:
+            metric (str): score metric (default value 'rpkm') to be reported
+
+        Yields:
+            line_number (int): sequential number of row
+            row (dict[tuple(str,str),obj]): key is a tuple with function
+                identifier or empty string as first element and field name
+                as second element (see generate_node_rows)
+        """
+        yield from self.generate_node_rows(
+            ROOT_TAXONOMY_ID, self.get_function_list(), 1, metric=metric
+            )
+
+    def generate_node_rows(self, taxid, function_list, line_number, metric='rpkm'):
+        """Generates rows for node of functional-taxonomic profile.
         Recursively called for all children of the node.
 
         Args:
@@ -321,21 +337,24 @@ class TaxonomyProfile(object):
             line_number (int): sequential number of node printed
             metric (str): score metric (default value 'rpkm') to be reported
 
-        Returns:
-            ret_val (dict[str,dict[tuple(str,str),float]]): outer key is line number,
-                inner key is a tuple with function identifier or empty string as
-                first element and field name as second element, value is a float.
+        Yields:
+            line_number (int): sequential number of row
+            row (dict[tuple(str,str),float]): key is a tuple with function
+                identifier or empty string as first element and field name
+                as second element, value is a float.
                 Field names are 'Rank', 'Taxon name', '1.Score', '2.Identity',
                 '3.Raw count'. For each function, only the latter three fields are reported.
+
+        Returns:
             attribute_values (defaultdict[str,dict[str,obj]]): outer key is
                 function identifier, inner key may be metric, 'hit_count', 'identity'
                 'hit_count', value is float.
+            line_number (int): sequential number of next row
         """
         # Collect values of all required attributes for reporting to the upper level
         attribute_values = defaultdict(dict)
-        ret_val = defaultdict(dict)
         if taxid not in self.tree.data:
-            return ret_val, attribute_values
+            return attribute_values, line_number
         for function in function_list:
             for attribute_name in ['count', 'identity', 'hit_count', metric]:
                 attribute_values[function][attribute_name] = 0.0
@@ -354,32 +373,29 @@ class TaxonomyProfile(object):
 
         children_values = autovivify(2, float)
 
-        ret_val[line_number][('', 'Rank')] = self.tree.data[taxid].rank
-        ret_val[line_number][('', 'Taxon name')] = self.tree.data[taxid].name
+        row = {}
+        row[('', 'Rank')] = self.tree.data[taxid].rank
+        row[('', 'Taxon name')] = self.tree.data[taxid].name
         for function in function_list:
             for field_name in ['1.Score', '2.Identity', '3.Raw count']:
-                ret_val[line_number][(function, field_name)] = 0.0
+                row[(function, field_name)] = 0.0
             if function in self.tree.data[taxid].attributes:
-                ret_val[line_number][(function, '1.Score')] = \
+                row[(function, '1.Score')] = \
                     self.tree.data[taxid].attributes[function][metric]
-                ret_val[line_number][(function, '3.Raw count')] = \
+                row[(function, '3.Raw count')] = \
                     self.tree.data[taxid].attributes[function]['count']
                 if 'identity' in self.tree.data[taxid].attributes[function]:
-                    ret_val[line_number][(function, '2.Identity')] = \
+                    row[(function, '2.Identity')] = \
                         self.tree.data[taxid].attributes[function]['identity'] \
                         / self.tree.data[taxid].attributes[function]['hit_count']
+        yield line_number, row
         line_number += 1
-        # If node has children, call convert_node_into_dict recursively
+        # If node has children, call generate_node_rows recursively
         if self.tree.data[taxid].children:
             for child_id in sorted(self.tree.data[taxid].children):
-                child_lines, child_attribute_values = \
-                    self.convert_node_into_dict(child_id,
-                                                function_list,
-                                                line_number,
-                                                metric)
-                for child_line_number, child_line in child_lines.items():
-                    ret_val[child_line_number] = child_line
-                line_number += len(child_lines)
+                child_attribute_values, line_number = yield from self.generate_node_rows(
+                    child_id, function_list, line_number, metric
+                    )
                 for child_function, child_attrib in child_attribute_values.items():
                     for key, val in child_attrib.items():
                         children_values[child_function][key] += val
@@ -399,23 +415,23 @@ class TaxonomyProfile(object):
             # For other node, fictional child name is ' Unclassified <node taxon>'
             # For example, 'Unclassified Proteobacteria'
             if unidentified_flag and self.tree.data[taxid].rank in LOWER_RANKS:
-                ret_val[line_number][('', 'Rank')] = LOWER_RANKS[self.tree.data[taxid].rank]
-                ret_val[line_number][('', 'Taxon name')] = 'Unclassified ' \
-                    + self.tree.data[taxid].name
+                row = {}
+                row[('', 'Rank')] = LOWER_RANKS[self.tree.data[taxid].rank]
+                row[('', 'Taxon name')] = 'Unclassified ' + self.tree.data[taxid].name
                 if taxid == '1':
-                    ret_val[line_number][('', 'Taxon name')] = 'Unclassified'
+                    row[('', 'Taxon name')] = 'Unclassified'
                 # Calculate scores for fictional node
                 for function in function_list:
                     for field_name in ['1.Score', '2.Identity', '3.Raw count']:
-                        ret_val[line_number][(function, field_name)] = 0.0
+                        row[(function, field_name)] = 0.0
                     if function in self.tree.data[taxid].attributes and (
                             children_values[function]['count']
                             < self.tree.data[taxid].attributes[function]['count']
                     ):
-                        ret_val[line_number][(function, '1.Score')] = \
+                        row[(function, '1.Score')] = \
                             self.tree.data[taxid].attributes[function][metric] \
                             - children_values[function][metric]
-                        ret_val[line_number][(function, '3.Raw count')] = \
+                        row[(function, '3.Raw count')] = \
                             self.tree.data[taxid].attributes[function]['count'] \
                             - children_values[function]['count']
 
@@ -423,15 +439,16 @@ class TaxonomyProfile(object):
                                 self.tree.data[taxid].attributes[function]['hit_count']
                                 > children_values[function]['hit_count']
                         ):
-                            ret_val[line_number][(function, '2.Identity')] = (
+                            row[(function, '2.Identity')] = (
                                 self.tree.data[taxid].attributes[function]['identity']
                                 - children_values[function]['identity']
                             ) / (
                                 self.tree.data[taxid].attributes[function]['hit_count']
                                 - children_values[function]['hit_count']
                             )
+                yield line_number, row
                 line_number += 1
-        return ret_val, attribute_values
+        return attribute_values, line_number
 
     def convert_profile_into_score_df(self, metric='rpkm'):
         """Converts functional-taxonomic profile into pandas DataFrame object
@@ -443,22 +460,29 @@ class TaxonomyProfile(object):
             result (pd.DataFrame): functional-taxonomic profile as pandas
                 DataFrame object
         """
-        function_list = set()
-        for taxid in self.tree.data:
-            for function in self.tree.data[taxid].attributes.keys():
-                function_list.add(function)
-        root_id = ROOT_TAXONOMY_ID
-        line_number = 1
-        tax_dict, _ = self.convert_node_into_values_dict(root_id,
-                                                         function_list,
-                                                         line_number,
-                                                         metric=metric)
-        result = pd.DataFrame(tax_dict)
+        result = pd.DataFrame(dict(self.generate_score_rows(metric=metric)))
         result = result.transpose()
         return result
 
-    def convert_node_into_values_dict(self, taxid, function_list, line_number, metric='efpkg'):
-        """Returns node of functional-taxonomic profile for conversion into DataFrame.
+    def generate_score_rows(self, metric='rpkm'):
+        """Generates rows of functional-taxonomic profile table with scores
+        only, one row per node, top-down depth-first
+
+        Args:
+            metric (str): score metric (default value 'rpkm') to be reported
+
+        Yields:
+            line_number (int): sequential number of row
+            row (dict[tuple(str,str),obj]): key is a tuple with function
+                identifier or empty string as first element and field name
+                as second element (see generate_node_score_rows)
+        """
+        yield from self.generate_node_score_rows(
+            ROOT_TAXONOMY_ID, self.get_function_list(), 1, metric=metric
+            )
+
+    def generate_node_score_rows(self, taxid, function_list, line_number, metric='efpkg'):
+        """Generates rows with scores for node of functional-taxonomic profile.
         Recursively called for all children of the node.
 
         Args:
@@ -468,13 +492,16 @@ class TaxonomyProfile(object):
             line_number (int): sequential number of node printed
             metric (str): score metric (default value 'efpkg') to be reported
 
+        Yields:
+            line_number (int): sequential number of row
+            row (dict[tuple(str,str),obj]): key is a tuple with function
+                identifier or empty string as first element and field name
+                as second element. Field names are 'Rank', 'Taxon name', metric.
+
         Returns:
             attribute_values (defaultdict[str,dict[str,float]]): outer key is
                 function identifier, inner key is metric,  value is float.
-            ret_val (dict[str,tuple(str,str)]): key is line number, value is a
-                tuple with function identifier or empty string as first element
-                and field name as second element. Field names are 'Rank',
-                'Taxon name', metric.
+            line_number (int): sequential number of next row
         """
         # Collect all attributes for reporting to the upper level
         attribute_values = defaultdict(dict)
@@ -485,27 +512,23 @@ class TaxonomyProfile(object):
                     attribute_values[function][metric] = \
                         self.tree.data[taxid].attributes[function][metric]
 
-        ret_val = defaultdict(dict)
         children_values = autovivify(2, float)
         if taxid in self.tree.data:
-            ret_val[line_number][('', 'Rank')] = self.tree.data[taxid].rank
-            ret_val[line_number][('', 'Taxon name')] = self.tree.data[taxid].name
+            row = {}
+            row[('', 'Rank')] = self.tree.data[taxid].rank
+            row[('', 'Taxon name')] = self.tree.data[taxid].name
             for function in function_list:
-                ret_val[line_number][(function, metric)] = 0.0
+                row[(function, metric)] = 0.0
                 if function in self.tree.data[taxid].attributes:
-                    ret_val[line_number][(function, metric)] = \
+                    row[(function, metric)] = \
                         self.tree.data[taxid].attributes[function][metric]
+            yield line_number, row
             line_number += 1
             if self.tree.data[taxid].children:
                 for child_id in sorted(self.tree.data[taxid].children):
-                    child_lines, child_values = \
-                        self.convert_node_into_values_dict(child_id,
-                                                           function_list,
-                                                           line_number,
-                                                           metric)
-                    for child_line_number, child_line in child_lines.items():
-                        ret_val[child_line_number] = child_line
-                    line_number += len(child_lines)
+                    child_values, line_number = yield from self.generate_node_score_rows(
+                        child_id, function_list, line_number, metric
+                        )
                     for datapoint in child_values.keys():
                         for key, val in child_values[datapoint].items():
                             children_values[datapoint][key] += val
@@ -521,22 +544,23 @@ class TaxonomyProfile(object):
                         break
 
                 if unidentified_flag and self.tree.data[taxid].rank in LOWER_RANKS:
-                    ret_val[line_number][('', 'Rank')] = LOWER_RANKS[self.tree.data[taxid].rank]
-                    ret_val[line_number][('', 'Taxon name')] = 'Unclassified ' \
-                        + self.tree.data[taxid].name
+                    row = {}
+                    row[('', 'Rank')] = LOWER_RANKS[self.tree.data[taxid].rank]
+                    row[('', 'Taxon name')] = 'Unclassified ' + self.tree.data[taxid].name
                     if taxid == '1':
-                        ret_val[line_number][('', 'Taxon name')] = 'Unclassified'
+                        row[('', 'Taxon name')] = 'Unclassified'
                     for function in function_list:
-                        ret_val[line_number][(function, metric)] = 0.0
+                        row[(function, metric)] = 0.0
                         if function in self.tree.data[taxid].attributes and (
                                 children_values[function][metric]
                                 < self.tree.data[taxid].attributes[function][metric]
                         ):
-                            ret_val[line_number][(function, metric)] = \
+                            row[(function, metric)] = \
                                 self.tree.data[taxid].attributes[function][metric] \
                                 - children_values[function][metric]
+                    yield line_number, row
                     line_number += 1
         else:
             print('Node not found:', taxid)
 
-        return ret_val, attribute_values
+        return attribute_values, line_number
@@ -18,6 +18,11 @@ try:
 except ImportError:
     sys.exit("Could not import module 'os'")
 
+try:
+    import io
+except ImportError:
+    sys.exit("Could not import module 'io'")
+
 try:
     import platform
 except ImportError:
@@ -39,15 +44,38 @@ except ImportError:
     sys.exit("Could not import module 'bz2'")
 
 try:
+    import numpy as np
     from numpy import median, mean
 except ImportError:
     sys.exit("Could not import module 'numpy'")
 
+try:
+    from itertools import chain, repeat
+except ImportError:
+    sys.exit("Could not import module 'itertools'")
+
+try:
+    from operator import lt
+except ImportError:
+    sys.exit("Could not import module 'operator'")
+
 try:
     from tempfile import mkstemp
 except ImportError:
     sys.exit("Could not import module 'tempfile.mkstemp'")
 
+from fama.utils.gzip_io import open_input_file
+
+# Size of data blocks read by process_seqfile, in bytes
+SEQ_BLOCK_SIZE = 16777216
+# Number of records processed at once by process_seqfile, if records are parsed one by one
+SEQ_BATCH_SIZE = 65536
+# Complementary bases for A, C, G, T and N. Other bytes are mapped to zero.
+COMPLEMENT_TABLE = bytes(
+    {ord('A'): ord('T'), ord('T'): ord('A'), ord('G'): ord('C'), ord('C'): ord('G'),
+     ord('N'): ord('N')}.get(byte, 0) for byte in range(256)
+)
+
 
 #######################################################################################
 #   FUNCTIONS
@@ -57,8 +85,9 @@ def mad(vals, const=1.48):
     return const * median([abs(i - median(vals)) for i in vals])
 
 
-def open_file(inpath):
-    """ Open input file for reading regardless of compression [gzip, bzip] or python version """
+def open_file(inpath, threads=1):
+    """ Open input file for reading regardless of compression [gzip, bzip] or python version.
+        Gzipped files are decompressed with <threads> threads, if possible """
     ext = inpath.split('.')[-1]
     # Python2
     result = None
@@ -73,7 +102,7 @@ def open_file(inpath):
     elif sys.version_info[0] == 3:
         # if ext == 'gz': return io.TextIOWrapper(gzip.open(inpath))
         if ext == 'gz':
-            result = gzip.open(inpath, 'rt')
+            result = open_input_file(inpath, 'rt', threads)
         elif ext == 'bz2':
             result = bz2.BZ2File(inpath)
         else:
@@ -81,6 +110,14 @@ def open_file(inpath):
     return result
 
 
+def open_binary_file(inpath, threads=1):
+    """ Open input file for reading in binary mode regardless of compression [gzip, bzip].
+        Gzipped files are decompressed with <threads> threads, if possible """
+    if inpath.split('.')[-1] == 'bz2':
+        return bz2.BZ2File(inpath)
+    return open_input_file(inpath, 'rb', threads)
+
+
 def find_opt_pars(path_optpars, read_length):
     """ Read in optimal parameters for each family at given read length
         Returns optpars[fam_id] = [min_cov, max_aaid, min_score, aln_stat]
@@ -406,53 +443,246 @@ def parse_seqs(fp):
                 break
 
 
+def chomp(line):
+    """ Remove line ending from binary line in the same way as text mode reading does """
+    if line.endswith(b'\r\n'):
+        return line[:-2]
+    return line[:-1]
+
+
+def parse_binary_seqs(fp):
+    """ A generator function for parsing fasta/fastq records from binary file,
+        like parse_seqs. Yields (sequence, quality) tuples of bytes; quality is
+        None for fasta records """
+    last = None  # this is a buffer keeping the last unprocessed line
+    while True:
+        if not last:  # the first record or a record following a fastq
+            for line in fp:  # search for the start of the next record
+                if line[:1] in b'>@':  # fasta/q header line
+                    last = chomp(line)  # save this line
+                    break
+        if not last:
+            break
+        seqs, last = [], None
+        for line in fp:  # read the sequence
+            if line[:1] in b'@+>':
+                last = chomp(line)
+                break
+            seqs.append(chomp(line))
+        if not last or last[:1] != b'+':  # this is a fasta record
+            yield b''.join(seqs), None  # yield a fasta record
+            if not last:
+                break
+        else:  # this is a fastq record
+            seq, leng, seqs = b''.join(seqs), 0, []
+            for line in fp:  # read the quality
+                line = chomp(line)
+                seqs.append(line)
+                leng += len(line)
+                if leng >= len(seq):  # have read enough quality
+                    last = None
+                    yield seq, b''.join(seqs)  # yield a fastq record
+                    break
+            if last:  # reach EOF before reading enough quality
+                yield seq, None  # yield a fasta record instead
+                break
+
+
+def split_fastq_lines(lines):
+    """ Split list of binary lines without line endings into sequences and qualities,
+        if the lines are four-line fastq records parsed by parse_binary_seqs in the
+        same way. Return None for any other lines """
+    seqs, quals = lines[1::4], lines[3::4]
+    if len(lines) % 4 \
+            or not all(map(bytes.startswith, lines[0::4], repeat(b'@'))) \
+            or not all(map(bytes.startswith, lines[2::4], repeat(b'+'))) \
+            or any(map(bytes.startswith, seqs, repeat((b'@', b'+', b'>')))) \
+            or any(map(lt, map(len, quals), map(len, seqs))):
+        return None
+    return seqs, quals
+
+
+def read_seq_batches(fp):
+    """ Read records from binary file by batches. Each batch is a tuple of sequences
+        list and qualities list; quality is None for fasta records.
+
+        Four-line fastq records are split by blocks of SEQ_BLOCK_SIZE bytes without
+        parsing of each line. The first block of other records, the rest of file
+        after it and the last record are parsed by parse_binary_seqs """
+    data = b''
+    while True:
+        block = fp.read(SEQ_BLOCK_SIZE)
+        if not block:
+            break
+        data += block
+        if b'\r' in data:
+            break
+        lines = data.split(b'\n')
+        # the last line is incomplete
+        complete = (len(lines) - 1) // 4 * 4
+        if not complete:
+            continue
+        batch = split_fastq_lines(lines[:complete])
+        if batch is None:
+            break
+        yield batch
+        data = b'\n'.join(lines[complete:])
+    lines = io.BytesIO(data).readlines()
+    if lines and not lines[-1].endswith(b'\n'):
+        # complete the line split by block boundary
+        lines[-1] += fp.readline()
+    seqs, quals = [], []
+    for seq, qual in parse_binary_seqs(chain(lines, fp)):
+        seqs.append(seq)
+        quals.append(qual)
+        if len(seqs) == SEQ_BATCH_SIZE:
+            yield seqs, quals
+            seqs, quals = [], []
+    if seqs:
+        yield seqs, quals
+
+
+def find_low_quality(seqs, quals, args):
+    """ Return list of flags for reads, True if read fails QC. Same as quality_filter
+        for all reads, but checks all reads at once. Flag is None for fastq records
+        without quality, which must be checked by quality_filter """
+    read_length = args['read_length']
+    result = [False] * len(seqs)
+    if (args['mean_quality'] == -5) and (args['min_quality'] == -5):
+        # no filtering
+        return result
+    indices = [index for index, seq in enumerate(seqs) if len(seq) >= read_length]
+    if args['file_type'] == 'fastq':
+        for index in indices:
+            if quals[index] is None:
+                result[index] = None
+        indices = [index for index in indices if quals[index] is not None]
+    if not indices:
+        return result
+    # check percent unknown
+    trimmed = np.frombuffer(b''.join([seqs[index][:read_length] for index in indices]),
+                            dtype=np.uint8).reshape(-1, read_length)
+    failed = 100 * np.count_nonzero(trimmed == ord('N'), axis=1) / float(read_length) \
+        > args['max_unknown']
+    # check quality
+    if args['file_type'] == 'fastq':
+        quality = np.frombuffer(b''.join([quals[index][:read_length] for index in indices]),
+                                dtype=np.uint8).reshape(-1, read_length).astype(np.int16)
+        quality -= args['quality_offset']
+        failed |= quality.sum(axis=1) / float(read_length) < args['mean_quality']
+        failed |= quality.min(axis=1) < args['min_quality']
+    for index, flag in zip(indices, failed.tolist()):
+        result[index] = flag
+    return result
+
+
+def get_canonical_seq(seq):
+    """ Return lexicographically smaller of sequence and its reverse complement.
+        Raise KeyError for unknown base, as Sequence.reverse_complement does """
+    rev_comp = seq[::-1].translate(COMPLEMENT_TABLE)
+    if b'\0' in rev_comp:
+        raise KeyError(chr(seq[-1 - rev_comp.index(b'\0')]))
+    return min(seq, rev_comp)
+
+
+def sample_batch(seqs, low_quality, args, stats, kept_seqs):
+    """ Select reads for output from a batch, in the same order as reads are
+        checked one by one: read length, duplicates, quality.
+
+        Args:
+            seqs (list of bytes): sequences of the batch
+            low_quality (list of bool): flags returned by find_low_quality
+            args (dict): MicrobeCensus arguments
+            stats (dict): counts of reads processed ('reads'), sampled ('read_id'),
+                too short ('too_short'), duplicate ('dups') and low quality ('low_qual').
+                Updated by this function.
+            kept_seqs (set of bytes): canonical sequences of sampled reads,
+                if duplicates are filtered. Updated by this function.
+
+        Returns:
+            list of bytes: sampled reads trimmed to read length
+    """
+    read_length = args['read_length']
+    result = []
+    if not args['filter_dups'] and None not in low_quality:
+        # no dependency between reads: select all at once
+        kept = [index for index, (seq, is_low_quality) in enumerate(zip(seqs, low_quality))
+                if len(seq) >= read_length and not is_low_quality]
+        remaining = args['nreads'] - stats['read_id']
+        if 0 < remaining <= len(kept):
+            kept = kept[:remaining]
+            seqs = seqs[:kept[-1] + 1]
+        too_short = sum(map(lt, map(len, seqs), repeat(read_length)))
+        stats['reads'] += len(seqs)
+        stats['too_short'] += too_short
+        stats['low_qual'] += len(seqs) - too_short - len(kept)
+        stats['read_id'] += len(kept)
+        return [seqs[index][:read_length] for index in kept]
+    for seq, is_low_quality in zip(seqs, low_quality):
+        stats['reads'] += 1
+        # record sequence if enough high quality bases remain
+        if len(seq) < read_length:
+            stats['too_short'] += 1
+            continue
+        if args['filter_dups']:
+            canonical_seq = get_canonical_seq(seq)
+            # check if sequence is a duplicate
+            if canonical_seq in kept_seqs:
+                stats['dups'] += 1
+                continue
+        # check if sequence is low quality
+        if is_low_quality is None:
+            is_low_quality = quality_filter(Sequence(None, seq.decode('utf8')), args)
+        if is_low_quality:
+            stats['low_qual'] += 1
+            continue
+        # keep seq
+        result.append(seq[:read_length])
+        stats['read_id'] += 1
+        if args['filter_dups']:
+            kept_seqs.add(canonical_seq)
+        if stats['read_id'] == args['nreads']:
+            break
+    return result
+
+
 def process_seqfile(args, paths):
     """ Sample high quality reads from seqfile """
     if args['verbose']:
         print("====Estimating Average Genome Size====")
         print("Sampling & trimming reads...")
-    outfile = open(paths['tempfile'], 'w')
     # loop over sequences
-    read_id, dups, too_short, low_qual = 0, 0, 0, 0
+    stats = {'reads': 0, 'read_id': 0, 'dups': 0, 'too_short': 0, 'low_qual': 0}
+    # canonical sequences of sampled reads: a read is a duplicate if it is
+    # identical to a sampled read or to its reverse complement
     seqs = set([])
-    for seqfile in args['seqfiles']:
-        i = 0
-        try:
-            for rec in parse_seqs(open_file(seqfile)):
-                i += 1
-                # record sequence if enough high quality bases remain
-                if len(rec.seq) < args['read_length']:
-                    too_short += 1
-                    continue
-                # check if sequence is a duplicate
-                elif args['filter_dups'] and (str(rec.seq) in seqs or str(
-                        rec.reverse_complement()) in seqs
-                                             ):
-                    dups += 1
-                    continue
-                # check if sequence is low quality
-                elif quality_filter(rec, args):
-                    low_qual += 1
-                    continue
-                # keep seq
-                else:
-                    outfile.write('>'+str(read_id)+'\n'+str(rec.seq[0:args['read_length']])+'\n')
-                    read_id += 1
-                    if args['filter_dups']:
-                        seqs.add(str(rec.seq))
-                    if read_id == args['nreads']:
-                        break
-            if read_id == args['nreads']:
-                break
-        except Exception as e:
-            error = (
-                "\nThe following error was encountered when parsing sequence "
-                "#%s in the input file %s:\n%s\n" % (i+1, seqfile, e)
-            )
-            clean_up(paths)
-            sys.exit(error)
-        finally:
-            outfile.close()
+    with open(paths['tempfile'], 'wb') as outfile:
+        for seqfile in args['seqfiles']:
+            stats['reads'] = 0
+            try:
+                with open_binary_file(seqfile, args['threads']) as f_in:
+                    for batch_seqs, batch_quals in read_seq_batches(f_in):
+                        first_id = stats['read_id']
+                        sampled = sample_batch(batch_seqs,
+                                               find_low_quality(batch_seqs, batch_quals, args),
+                                               args, stats, seqs)
+                        outfile.write(b''.join([b'>%d\n%s\n' % (read_id, seq) for read_id, seq
+                                                in enumerate(sampled, first_id)]))
+                        # zero nreads means all reads
+                        if sampled and stats['read_id'] == args['nreads']:
+                            break
+                if stats['read_id'] == args['nreads'] > 0:
+                    break
+            except Exception as e:
+                error = (
+                    "\nThe following error was encountered when parsing sequence "
+                    "#%s in the input file %s:\n%s\n" % (stats['reads'] + 1, seqfile, e)
+                )
+                outfile.close()
+                clean_up(paths)
+                sys.exit(error)
+    read_id, dups, too_short, low_qual = (stats['read_id'], stats['dups'],
+                                          stats['too_short'], stats['low_qual'])
     # report summary
     if read_id == 0:
         clean_up(paths)
@@ -728,7 +958,7 @@ def count_bases(args):
     total_bp = 0
     for inpath in args['seqfiles']:
         base_p = 0
-        with open_file(inpath) as infile:
+        with open_file(inpath, args['threads']) as infile:
             for _, seq, _ in read_seqfile(infile):
                 base_p += len(seq)
         total_bp += base_p
@@ -0,0 +1,146 @@
+"""Describes AgsCache class, which keeps MicrobeCensus reports for reuse
+in other projects processing the same sequence files"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+# Size of each of three file regions hashed for file signature, in bytes
+AGS_CACHE_SAMPLE_SIZE = 1048576
+AGS_CACHE_SUFFIX = '.microbecensus.txt'
+
+
+def get_file_signature(path):
+    """Returns hash of file size and content of file beginning, middle and
+    end. Signature does not depend on file path and modification time, so
+    copies of the same file have the same signature.
+
+    Args:
+        path (str): file path
+
+    Returns:
+        str: hexadecimal SHA-256 digest
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode('utf8'))
+    offsets = sorted({0,
+                      max(0, (size - AGS_CACHE_SAMPLE_SIZE) // 2),
+                      max(0, size - AGS_CACHE_SAMPLE_SIZE)})
+    with open(path, 'rb') as infile:
+        for offset in offsets:
+            infile.seek(offset)
+            digest.update(infile.read(AGS_CACHE_SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+class AgsCache(object):
+    """AgsCache stores MicrobeCensus output files in a directory shared
+    by all projects. Cache entry key is made from signatures of input
+    sequence files and MicrobeCensus parameters.
+
+    Entries not used for more than max_age days are removed. If total
+    size of entries exceeds max_size, least recently used entries are
+    removed.
+
+    Attributes:
+        cache_dir (str): path to cache directory
+        max_age (float): maximal age of entry since last use, in days.
+            Zero means no limit.
+        max_size (float): maximal total size of entries, in megabytes.
+            Zero means no limit.
+    """
+
+    def __init__(self, cache_dir, max_age=0.0, max_size=0.0):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_size = max_size
+
+    def get_key(self, seqfiles, parameters):
+        """Returns cache key for MicrobeCensus run
+
+        Args:
+            seqfiles (list of str): paths to input sequence files
+            parameters (dict): MicrobeCensus parameters affecting the
+                result, like number of reads and read length
+
+        Returns:
+            str: hexadecimal SHA-256 digest
+        """
+        key_data = {'seqfiles': [get_file_signature(seqfile) for seqfile in seqfiles],
+                    'parameters': parameters}
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode('utf8')).hexdigest()
+
+    def get_entry_path(self, key):
+        """Returns path to cache entry file"""
+        return os.path.join(self.cache_dir, key + AGS_CACHE_SUFFIX)
+
+    def load(self, key, outfile):
+        """Copies cached MicrobeCensus output to outfile
+
+        Args:
+            key (str): cache key
+            outfile (str): path to MicrobeCensus output file
+
+        Returns:
+            bool: True if entry was found
+        """
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(entry_path, 'r') as infile:
+                report = infile.read()
+        except OSError:
+            return False
+        with open(outfile, 'w') as out:
+            out.write(report)
+        try:
+            # modification time of entry is the time of last use
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, report_file):
+        """Saves MicrobeCensus output file as cache entry and removes
+        expired entries
+
+        Args:
+            key (str): cache key
+            report_file (str): path to MicrobeCensus output file
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry_path = self.get_entry_path(key)
+        with open(report_file, 'r') as infile:
+            report = infile.read()
+        # temporary file is unique for each thread of each process
+        temp_file = '{}.{}.{}.tmp'.format(entry_path, os.getpid(), threading.get_ident())
+        with open(temp_file, 'w') as out:
+            out.write(report)
+        os.replace(temp_file, entry_path)
+        self.evict()
+
+    def evict(self):
+        """Removes entries older than max_age and least recently used
+        entries exceeding max_size"""
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(AGS_CACHE_SUFFIX):
+                continue
+            entry_path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+        # most recently used entries first
+        entries.sort(reverse=True)
+        min_time = time.time() - self.max_age * 86400
+        total_size = 0
+        for mtime, size, entry_path in entries:
+            total_size += size
+            if (self.max_age > 0.0 and mtime < min_time) \
+                    or (self.max_size > 0.0 and total_size > self.max_size * 1048576):
+                try:
+                    os.remove(entry_path)
+                except OSError:
+                    pass
@@ -0,0 +1,159 @@
+"""Functions for reading and writing of gzipped files by external
+multi-threaded programs, with fallback to gzip module"""
+import io
+import gzip
+from shutil import which
+from subprocess import Popen, PIPE, CalledProcessError
+
+# Decompression programs in order of preference: executable name and
+# arguments. Program must decompress stdin and write it to stdout.
+GZIP_READERS = [('igzip', ['-d', '-c', '-T', '{threads}']),
+                ('pigz', ['-d', '-c', '-p', '{threads}'])]
+# Compression programs in order of preference: executable name and
+# arguments. Program must compress stdin and write it to stdout.
+GZIP_WRITERS = [('pigz', ['-c', '-p', '{threads}']),
+                ('igzip', ['-c', '-T', '{threads}'])]
+
+
+def find_program(programs):
+    """Returns full path and arguments of the first program available in PATH
+
+    Args:
+        programs (list of tuple(str, list of str)): program names and arguments
+
+    Returns:
+        tuple(str, list of str): path and arguments of a program, or None
+    """
+    for program, arguments in programs:
+        path = which(program)
+        if path is not None:
+            return path, arguments
+    return None
+
+
+class PipedFile(object):
+    """File object connected to stdin or stdout of an external program.
+
+    Reading is done from stdout of decompression program, writing goes
+    to stdin of compression program. On closing, waits for the program
+    to finish and raises CalledProcessError if the program failed.
+
+    """
+
+    def __init__(self, process, handle, outfile=None):
+        """ Args:
+            process (:obj:subprocess.Popen): external program
+            handle (file object): stdout or stdin of the program, maybe wrapped
+                by io.TextIOWrapper
+            outfile (file object, optional): file receiving output of
+                compression program
+        """
+        self.process = process
+        self.handle = handle
+        self.outfile = outfile
+
+    def __getattr__(self, name):
+        return getattr(self.handle, name)
+
+    def __iter__(self):
+        return iter(self.handle)
+
+    def __next__(self):
+        return next(self.handle)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Closes pipe and waits for the external program to finish"""
+        if self.process is None:
+            return
+        process = self.process
+        self.process = None
+        if self.outfile is None:
+            # file may be closed before the end, e.g. after reading first records
+            finished = not self.handle.read(1)
+            if not finished:
+                process.terminate()
+                self.handle.close()
+                process.wait()
+                return
+            self.handle.close()
+            returncode = process.wait()
+        else:
+            self.handle.close()
+            returncode = process.wait()
+            self.outfile.close()
+        if returncode != 0:
+            raise CalledProcessError(returncode, process.args)
+
+
+def open_input_file(path, mode='rb', threads=1):
+    """Opens uncompressed or gzipped file for reading.
+
+    Gzipped files are decompressed by external program from GZIP_READERS,
+    if available, or by gzip module otherwise. The file is opened before
+    the program starts, so that errors like missing file are raised here.
+    Error messages of the program go to stderr.
+
+    Args:
+        path (str): file path. Gzipped files must have '.gz' extension.
+        mode (str): 'rb' or 'rt'
+        threads (int): number of threads for decompression program
+
+    Returns:
+        file object
+    """
+    if not path.endswith('.gz'):
+        return open(path, mode)
+    program = find_program(GZIP_READERS)
+    if program is not None:
+        executable, arguments = program
+        args = [executable] + [arg.format(threads=threads) for arg in arguments]
+        with open(path, 'rb') as infile:
+            try:
+                process = Popen(args, stdin=infile, stdout=PIPE)
+            except OSError:
+                process = None
+        if process is not None:
+            handle = process.stdout
+            if 't' in mode:
+                handle = io.TextIOWrapper(handle)
+            return PipedFile(process, handle)
+    return gzip.open(path, mode)
+
+
+def open_output_file(path, mode='wt', threads=1):
+    """Opens file for writing. Files with '.gz' extension are compressed.
+
+    Gzipped files are compressed by external program from GZIP_WRITERS,
+    if available, or by gzip module otherwise.
+
+    Args:
+        path (str): file path
+        mode (str): 'wb' or 'wt'
+        threads (int): number of threads for compression program
+
+    Returns:
+        file object
+    """
+    if not path.endswith('.gz'):
+        return open(path, mode)
+    program = find_program(GZIP_WRITERS)
+    if program is not None:
+        executable, arguments = program
+        args = [executable] + [arg.format(threads=threads) for arg in arguments]
+        outfile = open(path, 'wb')
+        try:
+            process = Popen(args, stdin=PIPE, stdout=outfile)
+        except OSError:
+            outfile.close()
+        else:
+            handle = process.stdin
+            if 't' in mode:
+                handle = io.TextIOWrapper(handle)
+            return PipedFile(process, handle, outfile)
+    return gzip.open(path, mode)
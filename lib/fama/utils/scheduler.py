@@ -0,0 +1,158 @@
+"""Describes TaskScheduler class, which runs interdependent tasks in
+worker threads within CPU and memory budget"""
+import threading
+
+
+class Task(object):
+    """Task is a function call scheduled by TaskScheduler
+
+    Attributes:
+        name (str): task name for messages
+        function (function): function to call
+        args (tuple): arguments of the function
+        dependencies (:obj:'list' of :obj:'Task'): tasks that must be
+            finished before this task starts
+        cpus (int): number of CPUs used by the task
+        memory (float): memory used by the task, in gigabytes
+        group (str): identifier of task group, for example, sample identifier
+        done (bool): True if the task finished successfully
+    """
+
+    def __init__(self, name, function, args=(), dependencies=None, cpus=1, memory=0.0,
+                 group=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.dependencies = dependencies if dependencies is not None else []
+        self.cpus = cpus
+        self.memory = memory
+        self.group = group
+        self.done = False
+
+
+class TaskScheduler(object):
+    """TaskScheduler runs tasks in worker threads. A task starts when
+    all its dependencies are finished and there are enough free CPUs and
+    memory for it. Tasks are started in the order they were added.
+
+    Threads share all objects, including singleton ProgramConfig,
+    ReferenceData and TaxonomyData. Because of global interpreter lock,
+    only one task at a time may run Python code, but external programs
+    (DIAMOND etc.) run in parallel with Python code of other tasks.
+
+    Task groups (for example, all tasks of a sample) limit the number of
+    samples in progress: a group is active from start of its first task
+    till the end of its last task.
+
+    If a task fails, no new tasks are started. The first error is raised
+    after all running tasks are finished.
+
+    Attributes:
+        cpus (int): number of CPUs available for tasks
+        memory (float): memory available for tasks, in gigabytes.
+            Zero means no limit.
+        max_groups (int): maximal number of active task groups.
+            Zero means no limit.
+        tasks (:obj:'list' of :obj:'Task'): all tasks
+    """
+
+    def __init__(self, cpus, memory=0.0, max_groups=0):
+        self.cpus = max(1, cpus)
+        self.memory = memory
+        self.max_groups = max_groups
+        self.tasks = []
+        self._condition = threading.Condition()
+        self._free_cpus = self.cpus
+        self._free_memory = memory
+        self._pending = []
+        self._running = set()
+        self._group_tasks = {}
+        self._error = None
+
+    def add_task(self, name, function, args=(), dependencies=None, cpus=1, memory=0.0,
+                 group=None):
+        """Adds new task. Tasks requesting more CPUs or memory than
+        available get all CPUs or memory.
+
+        Returns:
+            :obj:'Task': new task
+        """
+        cpus = min(max(1, cpus), self.cpus)
+        if self.memory > 0.0:
+            memory = min(memory, self.memory)
+        task = Task(name, function, args, dependencies, cpus, memory, group)
+        self.tasks.append(task)
+        self._pending.append(task)
+        if group is not None:
+            self._group_tasks[group] = self._group_tasks.get(group, 0) + 1
+        return task
+
+    def run(self):
+        """Runs all tasks and waits for them to finish
+
+        Raises:
+            Exception raised by any task
+            RuntimeError if some tasks cannot be started
+        """
+        with self._condition:
+            while True:
+                if self._error is None:
+                    self._start_ready_tasks()
+                if not self._running:
+                    break
+                self._condition.wait()
+        if self._error is not None:
+            raise self._error
+        if self._pending:
+            raise RuntimeError('Tasks cannot be started: '
+                               + ', '.join(task.name for task in self._pending))
+
+    def _get_active_groups(self):
+        """Returns identifiers of groups with started and unfinished tasks"""
+        result = set()
+        for task in self.tasks:
+            if task.group is not None and self._group_tasks[task.group] > 0 \
+                    and (task.done or task in self._running):
+                result.add(task.group)
+        return result
+
+    def _start_ready_tasks(self):
+        """Starts pending tasks that can run now. Must be called with the
+        condition acquired."""
+        active_groups = self._get_active_groups()
+        for task in list(self._pending):
+            if not all(dependency.done for dependency in task.dependencies):
+                continue
+            if task.cpus > self._free_cpus:
+                continue
+            if self.memory > 0.0 and task.memory > self._free_memory:
+                continue
+            if task.group is not None and task.group not in active_groups \
+                    and 0 < self.max_groups <= len(active_groups):
+                continue
+            self._pending.remove(task)
+            self._running.add(task)
+            self._free_cpus -= task.cpus
+            self._free_memory -= task.memory
+            if task.group is not None:
+                active_groups.add(task.group)
+            threading.Thread(target=self._run_task, args=(task,), daemon=True).start()
+
+    def _run_task(self, task):
+        """Calls task function in worker thread"""
+        error = None
+        try:
+            task.function(*task.args)
+        except BaseException as task_error:  # pylint: disable=broad-except
+            error = task_error
+        with self._condition:
+            if error is None:
+                task.done = True
+            elif self._error is None:
+                self._error = error
+            self._running.remove(task)
+            self._free_cpus += task.cpus
+            self._free_memory += task.memory
+            if task.group is not None:
+                self._group_tasks[task.group] -= 1
+            self._condition.notify()
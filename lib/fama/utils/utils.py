@@ -1,7 +1,14 @@
 """ Utility functions"""
+import io
+import os
+import threading
+from contextlib import contextmanager
 from collections import defaultdict
 from subprocess import Popen, PIPE, CalledProcessError
 
+# Size of blocks (in bytes) for copying output of external programs
+PROGRAM_OUTPUT_BLOCK_SIZE = 1048576
+
 
 def autovivify(levels=1, final=dict):
     """Creates multi-level dictionary based on defaultdict
@@ -73,6 +80,119 @@ def run_external_program(cmd):
         raise CalledProcessError(proc.returncode, proc.args)
 
 
+class _TeeReader(io.RawIOBase):
+    """Binary stream that copies all data read from source stream into
+    another file"""
+
+    def __init__(self, source, copy_handle):
+        """ Args:
+            source (:obj:io.BufferedReader): source stream
+            copy_handle (file object): binary file receiving copy of the data
+        """
+        super().__init__()
+        self.source = source
+        self.copy_handle = copy_handle
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.source.read1(len(buffer))
+        self.copy_handle.write(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _InputWriter(threading.Thread):
+    """Thread writing standard input of external program"""
+
+    def __init__(self, handle, input_function):
+        """ Args:
+            handle (:obj:io.BufferedWriter): stdin of the program
+            input_function (function): function that takes text file
+                object and writes program input into it
+        """
+        super().__init__(daemon=True)
+        self.handle = handle
+        self.input_function = input_function
+        self.error = None
+
+    def run(self):
+        try:
+            with io.TextIOWrapper(self.handle) as infile:
+                self.input_function(infile)
+        except Exception as error:  # pylint: disable=broad-except
+            # reported after the program finished
+            self.error = error
+
+
+@contextmanager
+def open_external_program_output(cmd, copy_path=None, input_function=None):
+    """Starts new process with given arguments and provides its standard
+    output as binary file object, which can be read while the program
+    is running.
+
+    Args:
+        cmd (list of str): external command with parameters and options
+        copy_path (str, optional): if set, output is also saved to this
+            file. The file appears only after the program finished
+            successfully, so incomplete output is never left under this name.
+        input_function (function, optional): function that takes text file
+            object and writes input of the program into it. If set, it is
+            called in a separate thread with stdin of the program.
+
+    Yields:
+        binary file object
+
+    Raises:
+        CalledProcessError if external program fails
+    """
+    copy_handle = None
+    temp_path = None
+    if copy_path is not None:
+        temp_path = copy_path + '.tmp'
+        copy_handle = open(temp_path, 'wb')
+    try:
+        with Popen(cmd, stdin=PIPE if input_function is not None else None,
+                   stdout=PIPE) as proc:
+            writer = None
+            if input_function is not None:
+                writer = _InputWriter(proc.stdin, input_function)
+                writer.start()
+            output = proc.stdout
+            if copy_handle is not None:
+                output = io.BufferedReader(_TeeReader(proc.stdout, copy_handle),
+                                           PROGRAM_OUTPUT_BLOCK_SIZE)
+            try:
+                yield output
+                # consumer may stop before the end of output
+                while output.read(PROGRAM_OUTPUT_BLOCK_SIZE):
+                    pass
+            except BaseException:
+                proc.kill()
+                if writer is not None:
+                    writer.join()
+                if proc.wait() > 0:
+                    # error was caused by incomplete output of failed program
+                    # pylint: disable=no-member
+                    raise CalledProcessError(proc.returncode, proc.args)
+                raise
+            if writer is not None:
+                writer.join()
+        if proc.returncode != 0:
+            # pylint: disable=no-member
+            raise CalledProcessError(proc.returncode, proc.args)
+        if writer is not None and writer.error is not None:
+            raise writer.error
+        if copy_handle is not None:
+            copy_handle.close()
+            os.replace(temp_path, copy_path)
+    finally:
+        if copy_handle is not None and not copy_handle.closed:
+            copy_handle.close()
+            os.remove(temp_path)
+
+
 def run_external_program_ignoreerror(cmd):
     """Starts new process with given arguments. Use with caution: does not exits on error!
 
@@ -57,6 +57,13 @@ elif [ "${1}" = "init" ] ; then
   tar xvf /data/famaprofiling/1.5/fama_taxonomy.tar.gz
   rm /data/famaprofiling/1.5/fama_taxonomy.tar.gz
 
+  echo "compiling reference protein indexes"
+  PYTHONPATH=/kb/module/lib python -m fama.reference_library.protein_index \
+    /data/famaprofiling/1.5/fama/nitrogen11/fama_nitrogen-cycle_v.11.0_proteins.txt \
+    /data/famaprofiling/1.5/fama/universal1.4/fama_universal_v.1.4.txt \
+    /data/famaprofiling/1.5/fama/cazy2/cazy_v2_proteins.txt \
+    /data/famaprofiling/1.5/fama_rpl6_proteins_v.1.2.txt
+
   echo "downloading Microbe Census data: https://iseq.lbl.gov/mydocs/fama_downloads/microbecensus_data.tar.gz"
   curl -LJO -q https://iseq.lbl.gov/mydocs/fama_downloads/microbecensus_data.tar.gz
   tar xvf /data/famaprofiling/1.5/microbecensus_data.tar.gz
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import random
+import unittest
+
+import fama.diamond_parser.hit_utils as hit_utils
+from fama.diamond_parser.diamond_hit import DiamondHit
+from fama.diamond_parser.diamond_hit_list import DiamondHitList, OVERLAP_INDEX_MIN_HITS
+
+
+def filter_hits_sequentially(hits, overlap_cutoff):
+    """Filters hits by comparison of each hit with all selected hits"""
+    temp_list = []
+    for hit in hits:
+        if not temp_list:
+            temp_list.append(hit)
+        elif not hit_utils.hit_overlaps_any_hits(hit, temp_list, overlap_cutoff):
+            temp_list.append(hit)
+        elif hit_utils.has_higher_score(hit, temp_list, overlap_cutoff):
+            temp_list = hit_utils.replace_hit(hit, temp_list, overlap_cutoff)
+    return temp_list
+
+
+def make_random_hits(rnd, hit_count, read_length, zero_length=False):
+    """Makes hits on both strands. Start positions are drawn from a short
+    read, so that many hits share the same start. Bit-scores are drawn
+    from a small set to produce ties."""
+    hits = []
+    for hit_index in range(hit_count):
+        start = rnd.randint(1, read_length - 1)
+        if zero_length and rnd.random() < 0.2:
+            end = start
+        else:
+            end = min(read_length, start + rnd.randint(1, read_length // 2))
+        if rnd.random() < 0.5:
+            start, end = end, start
+        hits.append(DiamondHit('read', 'protein' + str(hit_index), 90.0,
+                               abs(end - start) // 3, 0, 100, start, end, 1, 10,
+                               1e-10, float(rnd.randint(20, 30))))
+    return hits
+
+
+class FilterOverlappingHitsTest(unittest.TestCase):
+
+    def test_filter_overlapping_hits(self):
+        rnd = random.Random(1)
+        for _ in range(2000):
+            hits = make_random_hits(rnd, rnd.randint(1, 60), rnd.choice([30, 150, 1000]))
+            overlap_cutoff = rnd.choice([1, 5, 15])
+            expected = filter_hits_sequentially(list(hits), overlap_cutoff)
+            result = hit_utils.filter_overlapping_hits(list(hits), overlap_cutoff)
+            self.assertEqual([id(hit) for hit in result], [id(hit) for hit in expected])
+
+    def test_filter_list(self):
+        rnd = random.Random(2)
+        for _ in range(2000):
+            hits = make_random_hits(rnd, rnd.randint(1, 3 * OVERLAP_INDEX_MIN_HITS),
+                                    rnd.choice([30, 150]), zero_length=rnd.random() < 0.5)
+            overlap_cutoff = rnd.choice([1, 5, 15])
+            expected = filter_hits_sequentially(list(hits), overlap_cutoff)
+            hit_list = DiamondHitList('read')
+            for hit in hits:
+                hit_list.add_hit(hit)
+            hit_list.filter_list(overlap_cutoff)
+            self.assertEqual([id(hit) for hit in hit_list.hits], [id(hit) for hit in expected])
+
+    def test_same_start(self):
+        hits = [DiamondHit('read', 'protein' + str(index), 90.0, 30, 0, 100, 10, 100 - index,
+                           1, 30, 1e-10, bitscore)
+                for index, bitscore in enumerate([25.0, 30.0, 30.0, 20.0, 35.0] * 4)]
+        expected = filter_hits_sequentially(list(hits), 15)
+        result = hit_utils.filter_overlapping_hits(list(hits), 15)
+        self.assertEqual([id(hit) for hit in result], [id(hit) for hit in expected])
+        self.assertEqual(len(result), 1)
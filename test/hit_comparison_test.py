@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+from configparser import ConfigParser
+
+import fama.diamond_parser.hit_utils as hit_utils
+from fama.project.program_config import ProgramConfig
+from fama.reference_library.reference_data import ReferenceData
+from fama.reference_library.taxonomy_data import TaxonomyData
+from fama.diamond_parser.diamond_hit import DiamondHit
+from fama.diamond_parser.diamond_hit_list import DiamondHitList
+from fama.sequences.annotated_read import AnnotatedRead
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'hit_comparison')
+COLLECTION = 'test_collection'
+LENGTH_CUTOFF = 15
+OVERLAP_CUTOFF = 10
+BITSCORE_RANGE_CUTOFF = 0.03
+AVERAGE_READ_LENGTH = 150.0
+COVERAGE = 5.0
+AVERAGE_COVERAGE = 2.0
+# Expected values were recorded with the implementation of
+# compare_hits_erpk_lca and compare_protein_hits_lca, which preceded
+# find_major_functions
+EXPECTED_FILE = os.path.join(DATA_DIR, 'expected.json')
+
+
+def get_singleton_class(getinstance):
+    """Returns class decorated with @singleton. Reference data of the test
+    must not be shared with other tests running in the same process."""
+    return getinstance.__closure__[getinstance.__code__.co_freevars.index('cls')].cell_contents
+
+
+def load_reference_data(work_dir):
+    """Writes config file for reference data of the test and loads the data"""
+    config_file = os.path.join(work_dir, 'config.ini')
+    parser = ConfigParser()
+    parser['DEFAULT'] = {
+        'functions_file': os.path.join(DATA_DIR, 'functions.tsv'),
+        'proteins_list_file': os.path.join(DATA_DIR, 'proteins.tsv'),
+        'taxonomy_file': os.path.join(DATA_DIR, 'taxonomy.tsv'),
+        'identity_cutoff': '40.0',
+        'length_cutoff': str(LENGTH_CUTOFF),
+        'hits_overlap_cutoff': str(OVERLAP_CUTOFF),
+        'biscore_range_cutoff': str(BITSCORE_RANGE_CUTOFF)
+    }
+    parser[COLLECTION] = {
+        'rank_cutoffs': 'superkingdom,20.0,phylum,32.0,class,40.0,order,50.0,'
+                        'family,60.0,genus,75.0,species,90.0'
+    }
+    with open(config_file, 'w') as outfile:
+        parser.write(outfile)
+    config = get_singleton_class(ProgramConfig)(config_file)
+    ref_data = get_singleton_class(ReferenceData)(config, COLLECTION)
+    taxonomy_data = get_singleton_class(TaxonomyData)(config, COLLECTION)
+    return ref_data, taxonomy_data
+
+
+def read_hits(infile, query_id_parser=lambda query_id: query_id):
+    """Reads DIAMOND tabular output and groups hits by query"""
+    result = []
+    with open(infile, 'r') as file_handle:
+        for row in csv.reader(file_handle, delimiter='\t'):
+            if int(row[3]) < LENGTH_CUTOFF:
+                continue
+            hit = DiamondHit()
+            hit.create_hit(row)
+            query_id = query_id_parser(hit.query_id)
+            if not result or result[-1][0] != query_id:
+                result.append((query_id, []))
+            result[-1][1].append(hit)
+    return result
+
+
+def make_reads(ref_data):
+    """Makes annotated reads from reference DIAMOND output, as
+    DiamondParser.parse_reference_output does"""
+    reads = {}
+    for read_id, hits in read_hits(os.path.join(DATA_DIR, 'reference_hits.tsv')):
+        hit_list = DiamondHitList(read_id)
+        for hit in hits:
+            hit_list.add_hit(hit)
+        hit_list.filter_list(OVERLAP_CUTOFF)
+        hit_list.annotate_hits(ref_data)
+        hit_list.filter_list_by_identity(ref_data)
+        if hit_list.hits_number != 0:
+            read = AnnotatedRead(read_id)
+            read.hit_list = hit_list
+            reads[read_id] = read
+    return reads
+
+
+def parse_segment(query_id):
+    """Returns read identifier and hit coordinates from query identifier
+    of background DIAMOND output"""
+    read_id, hit_start, hit_end = query_id.split('|')
+    return read_id, int(hit_start), int(hit_end)
+
+
+def get_read_state(read):
+    """Returns status, functions, taxonomy and hits of a read in a form
+    comparable with recorded values"""
+    return {
+        'status': read.status,
+        'functions': dict(sorted(read.functions.items())),
+        'taxonomy': read.taxonomy,
+        'hits': [[hit.subject_id, hit.q_start, hit.q_end, hit.bitscore, list(hit.functions)]
+                 for hit in read.hit_list.hits]
+    }
+
+
+def run_comparison(compare_function, ref_data, taxonomy_data):
+    """Compares hits of background DIAMOND output with hits of reads, as
+    DiamondParser.process_background_hits does
+
+    Returns:
+        comparisons (list): query identifier, KeyError flag and state of the
+            read after each comparison
+        reads (dict): final state of each read
+    """
+    reads = make_reads(ref_data)
+    comparisons = []
+    for query_id, hits in read_hits(os.path.join(DATA_DIR, 'background_hits.tsv')):
+        hit_list = DiamondHitList(query_id)
+        for hit in hits:
+            hit_list.add_hit(hit)
+        hit_list.annotate_hits(ref_data)
+        hit_list.filter_list_by_identity(ref_data)
+        read_id, hit_start, hit_end = parse_segment(query_id)
+        if read_id not in reads:
+            continue
+        read = reads[read_id]
+        key_error = False
+        try:
+            if compare_function == 'compare_hits_erpk_lca':
+                hit_utils.compare_hits_erpk_lca(
+                    read, hit_start, hit_end, hit_list, BITSCORE_RANGE_CUTOFF, LENGTH_CUTOFF,
+                    AVERAGE_READ_LENGTH, taxonomy_data, ref_data
+                )
+            else:
+                hit_utils.compare_protein_hits_lca(
+                    read, hit_start, hit_end, hit_list, BITSCORE_RANGE_CUTOFF, COVERAGE,
+                    AVERAGE_COVERAGE, taxonomy_data, ref_data
+                )
+        except KeyError:
+            # subject taxonomy ID is not in taxonomy data
+            key_error = True
+        comparisons.append([query_id, key_error, get_read_state(read)])
+    return comparisons, {read_id: get_read_state(read) for read_id, read in reads.items()}
+
+
+def record_expected_values():
+    """Writes expected values. Run from the test directory with the
+    implementation to be recorded:
+    PYTHONPATH=../lib python -c 'import hit_comparison_test as t; t.record_expected_values()'
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        ref_data, taxonomy_data = load_reference_data(work_dir)
+        result = {}
+        for compare_function in ('compare_hits_erpk_lca', 'compare_protein_hits_lca'):
+            comparisons, reads = run_comparison(compare_function, ref_data, taxonomy_data)
+            result[compare_function] = {'comparisons': comparisons, 'reads': reads}
+        with open(EXPECTED_FILE, 'w') as outfile:
+            json.dump(result, outfile, indent=1, sort_keys=True)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+class HitComparisonTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        cls.ref_data, cls.taxonomy_data = load_reference_data(cls.work_dir)
+        with open(EXPECTED_FILE, 'r') as infile:
+            cls.expected = json.load(infile)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir)
+
+    def check_comparison(self, compare_function):
+        comparisons, reads = run_comparison(compare_function, self.ref_data,
+                                            self.taxonomy_data)
+        expected = self.expected[compare_function]
+        self.assertEqual(len(comparisons), len(expected['comparisons']))
+        for comparison, expected_comparison in zip(comparisons, expected['comparisons']):
+            self.assertEqual(comparison, expected_comparison)
+        self.assertEqual(reads, expected['reads'])
+
+    def test_find_major_functions(self):
+        hits = []
+        for index, (functions, bitscore) in enumerate([
+                (['F01'], 50.0), (['F01', 'F02'], 60.0), (['F03'], 70.0), (['F02'], 65.0),
+                (['F01', 'F02'], 60.0)
+        ]):
+            hit = DiamondHit('read', 'protein' + str(index), 90.0, 30, 0, 100, 1, 90, 1, 30,
+                             1e-10, bitscore)
+            hit.functions = tuple(functions)
+            hits.append(hit)
+        function_hits = hit_utils.find_major_functions(hits)
+        self.assertEqual(list(function_hits), ['F01', 'F02'])
+        self.assertIs(function_hits['F01'], hits[1])
+        self.assertIs(function_hits['F02'], hits[3])
+
+    def test_compare_hits_erpk_lca(self):
+        self.check_comparison('compare_hits_erpk_lca')
+
+    def test_compare_protein_hits_lca(self):
+        self.check_comparison('compare_protein_hits_lca')